@@ -29,12 +29,13 @@ export default function SimpleSettings({ theme, onToggleTheme }: SimpleSettingsP
       const stateResponse = await fetch(apiUrl("/financeiro"));
       const state = await stateResponse.json();
 
-      // Fetch history if exists
+      // Fetch history if exists (streamed as NDJSON, one event per line)
       let history = null;
       try {
-        const historyResponse = await fetch(apiUrl("/financeiro/historico"));
+        const historyResponse = await fetch(apiUrl("/financeiro/historico?format=ndjson"));
         if (historyResponse.ok) {
-          history = await historyResponse.json();
+          const lines = (await historyResponse.text()).split("\n").filter(Boolean);
+          history = { eventos: lines.map((line) => JSON.parse(line)) };
         }
       } catch {}
 
@@ -0,0 +1,260 @@
+"""
+LifeOS BR Parser
+Valores em reais, prazos e datas de mensagens em português, numa passada só.
+
+Uma regex compilada reconhece, da esquerda para a direita, tudo o que é
+número na mensagem e decide o tipo pelo contexto:
+
+    "R$ 1.234,56", "1234,56", "2 mil", "1,5k", "3000 reais"   -> Amount
+    "6 meses", "10 dias", "uma semana", "1,5 ano"             -> Duration
+    "hoje", "amanhã", "próxima segunda", "dia 10", "10/11"     -> DateMention
+
+Percentuais ("10%"), horários ("às 10", "14h", "9:30"), parcelas ("10x") e
+cursores ("#12") são reconhecidos e descartados, para não virarem valores.
+Cada resultado traz o span (start, end) na mensagem original.
+
+Mais preciso e, no tráfego do chat, mais rápido que as duas ou três regexes
+soltas que os handlers usavam (que só achavam o primeiro número): a maioria das
+mensagens não tem dígito nem palavra de data ou prazo e sai numa busca só
+(_MAYBE_VALUE), sem passar pelo _SCANNER. Numa mensagem cheia de valores a
+varredura completa ainda custa mais que elas; test_br_parser mede os dois
+casos. Cada mensagem passa por aqui uma vez (a extração financeira é
+incremental), por isso não há memo.
+"""
+
+import calendar
+import re
+from datetime import date, timedelta
+from typing import NamedTuple, Optional, Tuple
+
+# "1.234,56" | "1,234.56" | "1234,56" | "1.5" | "1234". O lookahead só deixa
+# tentar os formatos com milhar quando há um separador seguido de 3 dígitos: sem
+# ele "3000" voltava atrás seis vezes antes de cair no último formato.
+_NUM = r"(?=\d{1,3}[.,]\d{3})(?:\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d{1,3}(?:,\d{3})+\.\d+)|\d+(?:[.,]\d+)?"
+
+NUMBER_WORDS = {
+    "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "três": 3, "quatro": 4, "cinco": 5,
+    "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10, "onze": 11, "doze": 12,
+    "quinze": 15, "vinte": 20, "trinta": 30,
+}
+MULTIPLIERS = {"mil": 1_000, "k": 1_000, "mi": 1_000_000, "milhao": 1_000_000, "milhão": 1_000_000,
+               "milhoes": 1_000_000, "milhões": 1_000_000}
+WEEKDAYS = {"segunda": 0, "terca": 1, "terça": 1, "quarta": 2, "quinta": 3, "sexta": 4,
+            "sabado": 5, "sábado": 5, "domingo": 6}
+_WEEKDAY = r"segunda|ter[çc]a|quarta|quinta|sexta|s[áa]bado|domingo"
+_WORKDAY = r"segunda|ter[çc]a|quarta|quinta|sexta"
+_NUMBER_WORD = "|".join(NUMBER_WORDS)
+# Duas primeiras letras de cada alternativa do _SCANNER ("r$", "às", "di"a,
+# "de"pois, "pr"óxima, "se"xta, "do"mingo, "um"...): ajustar junto com ele
+_PREFIXES = sorted({"r$", "às", "di", "de", "am", "ho", "on", "se", "pr", "me", "mê", "na", "no", "ne",
+                    "es", "te", "qu", "sa", "sá", "do"} | {w[:2] for w in NUMBER_WORDS})
+_STARTS = r"\d|" + "|".join(map(re.escape, _PREFIXES))
+_FIRST_CHARS = "[" + re.escape("".join(sorted({p[0] for p in _PREFIXES}))) + r"\d]"
+
+# Toda alternativa começa num início de palavra: o \b de fora descarta rápido as
+# posições no meio das palavras. Um número é casado uma vez só e o que vem
+# depois dele decide o tipo (%, h, x, /mês, unidade de prazo, mil/k, reais).
+# Tudo em minúsculas: o texto é baixado antes, e sem IGNORECASE a regex roda
+# quase 2x mais rápido. Os lookaheads descartam de uma vez as posições que não
+# começam nenhuma alternativa: a classe de primeiras letras barra os fins de
+# palavra (que também são \b), mas quase toda palavra começa por uma delas; os
+# começos de duas letras barram ~40% das palavras ("juros", "dívida", "paguei").
+_SCANNER = re.compile(
+    rf"""
+    \b(?={_FIRST_CHARS})(?={_STARTS})(?:
+      (?:(?P<cur>r\$)\s*)?(?P<num>{_NUM})
+      (?:
+          (?P<pct>\s*%)                                  # percentual: descartado
+        | (?P<clock>h\d{{0,2}}\b|:\d{{2}}\b)               # "14h", "9:30": descartado
+        | (?P<times>\s*x\b)                              # parcelas "10x": descartado
+        | /(?P<d_month>\d{{1,2}})(?:/(?P<d_year>\d{{4}}|\d{{2}}))?(?![\w/])
+        | \s*(?P<dur_unit>dias?|semanas?|m[êe]s|meses|anos?)\b
+        | (?:\s*(?P<mult>milh(?:[õo]es|[ãa]o)|mil|mi|k)\b)?(?:\s*(?P<cur2>reais|real|contos?|pila)\b)?
+      )
+    | (?P<at>às\s+\d{{1,2}}(?:h\d{{0,2}}|:\d{{2}})?\b)       # "às 10": descartado
+    | dia\s+(?P<dia_n>\d{{1,2}})\b(?![.,]\d)
+    | (?P<relative>depois\s+de\s+amanh[ãa]|amanh[ãa]|hoje|ontem
+          |semana\s+que\s+vem|pr[óo]xima\s+semana|m[êe]s\s+que\s+vem|pr[óo]ximo\s+m[êe]s)\b
+    | (?:pr[óo]xim[oa]|na|no|nesta|neste|esta|este|essa|esse)\s+(?P<wd1>{_WEEKDAY})(?:-feira)?\b
+    | (?P<wd2>{_WORKDAY})-feira\b
+    | (?P<wd3>s[áa]bado|domingo)\b
+    | (?P<word_n>{_NUMBER_WORD})\s+(?P<word_unit>dias?|semanas?|m[êe]s|meses|anos?)\b
+    )
+    """,
+    re.VERBOSE,
+)
+# Sem dígito e sem nenhuma destas palavras o _SCANNER não acha nada: a mensagem
+# sai com uma busca só. Toda alternativa começa por um literal, o que deixa o re
+# pular direto de uma letra inicial possível para a próxima.
+_HINT_WORDS = ("amanh", "hoje", "ontem", "dia", "semana", "mes", "mês", "ano", "segunda", "terça", "terca",
+               "quarta", "quinta", "sexta", "sábado", "sabado", "domingo")
+_MAYBE_VALUE = re.compile("|".join((*"0123456789", *_HINT_WORDS)))
+_THOUSANDS = re.compile(r"\d{0,3}(?:\.\d{3})+")
+
+
+def parse_number(raw: str) -> float:
+    """BR-formatted number to float: "1.234,56" -> 1234.56, "1.234" -> 1234, "1,5" -> 1.5."""
+    if raw.isdecimal():
+        return float(raw)
+    if "," in raw and "." in raw:
+        if raw.rfind(",") > raw.rfind("."):
+            return float(raw.replace(".", "").replace(",", "."))
+        return float(raw.replace(",", ""))
+    if "," in raw:
+        return float(raw.replace(",", "."))
+    if "." in raw:
+        if _THOUSANDS.fullmatch(raw):
+            return float(raw.replace(".", ""))  # separador de milhar
+    return float(raw)
+
+
+class Amount(NamedTuple):
+    value: float
+    start: int
+    end: int
+    currency: bool  # "R$" ou "reais" explícito
+
+
+class Duration(NamedTuple):
+    value: float
+    unit: str  # "day" | "week" | "month" | "year"
+    start: int
+    end: int
+
+    @property
+    def days(self) -> int:
+        per_unit = {"day": 1, "week": 7, "month": 30, "year": 365}[self.unit]
+        return round(self.value * per_unit)
+
+    @property
+    def months(self) -> int:
+        """Whole months, at least 1 (how the debt deadline is stored)."""
+        if self.unit == "month":
+            return max(1, round(self.value))
+        if self.unit == "year":
+            return max(1, round(self.value * 12))
+        return max(1, self.days // 30)
+
+
+class DateMention(NamedTuple):
+    date: date
+    start: int
+    end: int
+
+
+class Parsed(NamedTuple):
+    amounts: Tuple[Amount, ...]
+    durations: Tuple[Duration, ...]
+    dates: Tuple[DateMention, ...]
+
+    def first_amount(self) -> Optional[float]:
+        return self.amounts[0].value if self.amounts else None
+
+    def amount_after(self, index: int) -> Optional[float]:
+        """First amount starting at or after `index` (e.g. right after a keyword)."""
+        for amount in self.amounts:
+            if amount.start >= index:
+                return amount.value
+        return None
+
+
+_NOTHING = Parsed((), (), ())
+# Percentual, horário, parcelas e "às 10": reconhecidos só para não virarem valor
+_DROPPED = frozenset({"pct", "clock", "times", "at"})
+_AFTER_NUMBER = frozenset({"num", "mult", "cur2", "dur_unit", "d_month", "d_year"})
+# Monta os NamedTuple sem passar pelo __new__ gerado em Python, que custava mais
+# que o casamento da regex
+_new = tuple.__new__
+
+
+def _unit(word: str) -> str:
+    if word.startswith("dia"):
+        return "day"
+    if word.startswith("semana"):
+        return "week"
+    if word.startswith("ano"):
+        return "year"
+    return "month"
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _next_weekday(today: date, weekday: int) -> date:
+    return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+
+
+def _relative(word: str, today: date) -> date:
+    word = " ".join(word.split())
+    if word.startswith("depois"):
+        return today + timedelta(days=2)
+    if word.startswith("amanh"):
+        return today + timedelta(days=1)
+    if word == "ontem":
+        return today - timedelta(days=1)
+    if "semana" in word:
+        return today + timedelta(days=7)
+    if word.startswith(("mês", "mes", "próximo", "proximo")):
+        return _add_months(today, 1)
+    return today
+
+
+def _day_of_month(day: int, today: date) -> Optional[date]:
+    """"dia 10": this month if it hasn't passed yet, otherwise next month."""
+    if not 1 <= day <= 31:
+        return None
+    base = today if day >= today.day else _add_months(today.replace(day=1), 1)
+    return base.replace(day=min(day, calendar.monthrange(base.year, base.month)[1]))
+
+
+def _scan(text: str, today: date) -> Parsed:
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # lower() que muda o tamanho ("İ") desalinharia os spans
+        lowered = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+    if _MAYBE_VALUE.search(lowered) is None:
+        return _NOTHING
+    amounts, durations, dates = [], [], []
+    for m in _SCANNER.finditer(lowered):
+        # O último grupo fechado diz o tipo: "num"/"mult"/"cur2" é valor, "dur_unit" prazo...
+        kind = m.lastgroup
+        if kind in _DROPPED:
+            continue
+        start, end = m.span()
+        if kind in _AFTER_NUMBER:
+            if lowered[start - 1:start] == "#":
+                continue  # cursor "#12"
+            if kind == "dur_unit":
+                durations.append(_new(Duration, (parse_number(m["num"]), _unit(m["dur_unit"]), start, end)))
+            elif kind == "d_month" or kind == "d_year":
+                day, month, year = m.group("num", "d_month", "d_year")
+                year = today.year if year is None else int(year) + (2000 if len(year) == 2 else 0)
+                try:
+                    dates.append(_new(DateMention, (date(year, int(month), int(day)), start, end)))
+                except ValueError:
+                    pass  # 31/02, 10/13: nem data nem valor
+            else:
+                cur, num, mult, cur2 = m.group("cur", "num", "mult", "cur2")
+                value = parse_number(num)
+                if mult:
+                    value *= MULTIPLIERS[mult]
+                amounts.append(_new(Amount, (value, start, end, bool(cur or cur2))))
+        elif kind == "dia_n":
+            found = _day_of_month(int(m["dia_n"]), today)
+            if found:
+                dates.append(_new(DateMention, (found, start, end)))
+        elif kind == "relative":
+            dates.append(_new(DateMention, (_relative(m["relative"], today), start, end)))
+        elif kind == "word_unit":
+            durations.append(_new(Duration, (NUMBER_WORDS[m["word_n"]], _unit(m["word_unit"]), start, end)))
+        else:  # wd1, wd2, wd3
+            dates.append(_new(DateMention, (_next_weekday(today, WEEKDAYS[m[kind]]), start, end)))
+    return _new(Parsed, (tuple(amounts), tuple(durations), tuple(dates)))
+
+
+def parse_values(text: str, today: Optional[date] = None) -> Parsed:
+    """Amounts, durations and dates in `text`, in order, with their spans."""
+    return _scan(text, today or date.today())
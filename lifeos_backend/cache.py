@@ -0,0 +1,77 @@
+"""
+LifeOS Cache
+Cache em memória LRU com expiração por entrada, seguro entre threads.
+
+Cada entrada expira após o TTL padrão do cache ou num instante próprio
+(expires_at, em time.time()); ao passar de maxsize sai a menos usada.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire after `ttl` seconds or at their own deadline."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None) -> None:
+        """Store `value`; `expires_at` wins over `ttl`, which defaults to the cache's TTL."""
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
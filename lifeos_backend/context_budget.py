@@ -0,0 +1,207 @@
+"""
+LifeOS Context Budget
+Histórico do chat dentro de um orçamento de tokens, com resumo rolante por usuário.
+
+O custo de cada mensagem é contado uma vez (cache por texto): o mesmo
+histórico volta a cada turno. A janela vai da mensagem mais nova para a mais
+velha até o orçamento acabar; o que fica de fora é dobrado num resumo por
+usuário, refeito em segundo plano (uma task asyncio por usuário) e guardado
+num TTLCache. O turno nunca espera o resumo: usa o último pronto. Assim o
+prompt fica limitado, não importa o tamanho da conversa.
+
+Conta com tiktoken quando instalado; senão estima (palavras em pedaços de até
+4 letras + pontuação), o que fica perto do BPE em português.
+"""
+
+import asyncio
+import re
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from cache import TTLCache
+from structured_log import get_logger
+
+log = get_logger("context")
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # não instalado, ou sem o arquivo BPE (baixado no primeiro uso)
+    _ENCODING = None
+
+HISTORY_BUDGET = 1500  # tokens do histórico (fora system prompt e mensagem atual)
+SUMMARY_TOKENS = 200  # teto do resumo rolante
+SUMMARY_MIN_NEW = 4  # mensagens novas fora da janela antes de refazer o resumo
+MESSAGE_OVERHEAD = 4  # tokens de formatação por mensagem no formato de chat
+TOKEN_CACHE_SIZE = 8192
+SUMMARY_CACHE_SIZE = 4096
+SUMMARY_TTL = 24 * 3600
+
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+SUMMARY_PROMPT = (
+    "Resuma a conversa entre o usuário e o assistente em até 5 frases curtas, em português. "
+    "Mantenha valores (renda, despesas, dívidas, prazos), decisões e pendências. "
+    "Integre o resumo anterior, se houver. Responda só com o resumo."
+)
+
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def fit_to_budget(messages: Sequence[dict], budget: int) -> int:
+    """Index of the first message kept: the newest messages whose total cost fits in `budget`."""
+    total = 0
+    start = len(messages)
+    while start > 0:
+        cost = message_tokens(messages[start - 1])
+        if total + cost > budget:
+            break
+        total += cost
+        start -= 1
+    return start
+
+
+def keep_tail(text: str, max_tokens: int) -> str:
+    """Last words of `text` that fit in `max_tokens`, "... " marker included (the summary grows at the end)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    total = count_tokens("...")
+    start = len(words)
+    while start > 0 and total + count_tokens(words[start - 1]) <= max_tokens:
+        total += count_tokens(words[start - 1])
+        start -= 1
+    return "... " + " ".join(words[start:])
+
+
+def extractive_summary(previous: str, messages: List[dict], max_tokens: int = SUMMARY_TOKENS) -> str:
+    """Summary without an LLM: the previous one plus what the user said, oldest words dropped first."""
+    lines = [previous] if previous else []
+    lines += [" ".join(m["content"].split()) for m in messages if m["role"] == "user"]
+    return keep_tail(" | ".join(lines), max_tokens)
+
+
+def llm_summarizer(gateway, model: str, max_tokens: int = SUMMARY_TOKENS) -> Summarizer:
+    """Summarizer that asks the app's LLMGateway; errors fall back to extractive_summary in the budgeter."""
+    async def summarize(previous: str, messages: List[dict]) -> str:
+        conversation = "\n".join(
+            f"{'Usuário' if m['role'] == 'user' else 'Assistente'}: {m['content']}" for m in messages
+        )
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Resumo anterior: {previous or '(nenhum)'}\n\nConversa:\n{conversation}"},
+            ],
+            "temperature": 0,
+            "max_tokens": max_tokens,
+        }
+        response = await gateway.complete(payload)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+    return summarize
+
+
+class RollingSummary(NamedTuple):
+    text: str
+    covered: Optional[int]  # seq da última mensagem já dobrada no resumo
+
+
+class ContextBudgeter:
+    """Fits chat history into a token budget; messages that fall out are folded into a per-user rolling summary."""
+
+    def __init__(self, budget: int = HISTORY_BUDGET, summarize: Optional[Summarizer] = None,
+                 summary_tokens: int = SUMMARY_TOKENS, min_new: int = SUMMARY_MIN_NEW,
+                 cache_size: int = SUMMARY_CACHE_SIZE, ttl: float = SUMMARY_TTL):
+        self.budget = budget
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.min_new = min_new
+        self.summaries = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self.turns = 0
+        self.dropped = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_history_tokens = 0
+        self.max_history_tokens = 0
+
+    def select(self, key: Hashable, messages: Sequence[Tuple[int, dict]]) -> Tuple[str, List[dict]]:
+        """(summary, messages to send) for one turn.
+
+        `messages` are (seq, message) oldest first, seq increasing (e.g. the
+        chat_history id). Schedules a summary refresh when enough messages
+        fell out of the window; call it from the event loop.
+        """
+        history = [message for _, message in messages]
+        start = fit_to_budget(history, self.budget)
+        kept = history[start:]
+        tokens = sum(message_tokens(m) for m in kept)
+        self.turns += 1
+        self.dropped += start
+        self.last_history_tokens = tokens
+        self.max_history_tokens = max(self.max_history_tokens, tokens)
+
+        summary = self.summaries.get(key) or RollingSummary("", None)
+        new = [(seq, m) for seq, m in messages[:start] if summary.covered is None or seq > summary.covered]
+        if new and (len(new) >= self.min_new or not summary.text):
+            summary = self._refresh(key, summary, new) or summary
+        return summary.text, kept
+
+    def _refresh(self, key: Hashable, summary: RollingSummary, new: List[Tuple[int, dict]]) -> Optional[RollingSummary]:
+        covered = new[-1][0]
+        if self.summarize is None:
+            # Sem LLM o resumo extrativo é barato: refeito aqui mesmo e já vale neste turno
+            updated = RollingSummary(extractive_summary(summary.text, [m for _, m in new], self.summary_tokens), covered)
+            self.summaries.set(key, updated)
+            self.refreshes += 1
+            return updated
+        if key not in self._refreshing:
+            task = asyncio.get_running_loop().create_task(self._summarize(key, summary, new))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return None
+
+    async def _summarize(self, key: Hashable, summary: RollingSummary, new: List[Tuple[int, dict]]) -> None:
+        messages = [m for _, m in new]
+        try:
+            text = await self.summarize(summary.text, messages)
+        except Exception as e:
+            self.refresh_errors += 1
+            log.warning("Resumo via IA falhou; usando resumo extrativo", key=key, error=repr(e))
+            text = extractive_summary(summary.text, messages, self.summary_tokens)
+        self.summaries.set(key, RollingSummary(keep_tail(text, self.summary_tokens), new[-1][0]))
+        self.refreshes += 1
+
+    async def aclose(self) -> None:
+        """Cancel summaries still being refreshed (shutdown)."""
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "budget": self.budget,
+            "tokenizer": "tiktoken" if _ENCODING is not None else "approx",
+            "turns": self.turns,
+            "dropped_messages": self.dropped,
+            "last_history_tokens": self.last_history_tokens,
+            "max_history_tokens": self.max_history_tokens,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "refreshing": len(self._refreshing),
+            "summaries": self.summaries.stats(),
+            "token_cache": count_tokens.cache_info()._asdict(),
+        }
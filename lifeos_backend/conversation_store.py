@@ -0,0 +1,235 @@
+"""
+LifeOS Conversation Store
+Memória do chat por usuário, em memória, gravada em lote (write-behind).
+
+Cada usuário tem uma Conversation: o resumo e as últimas mensagens num ring
+buffer de capacidade fixa (deque com maxlen: a mais antiga sai sozinha quando
+chega uma nova, sem fatiar lista). Os usuários ativos ficam num LRU; editar a
+conversa só mexe em memória e marca o usuário como sujo. Uma thread de fundo
+grava os sujos a cada FLUSH_INTERVAL, todos numa chamada de `save` (um commit),
+e tira da memória quem ficou IDLE_TTL sem uso. Passar de MAX_USERS tira o
+menos usado na hora; se ele ainda não foi gravado, o documento espera o
+próximo flush e é ele que volta se o usuário reaparecer antes disso.
+
+O disco só é lido no primeiro acesso de um usuário (ou depois de despejado).
+close() grava o que faltar no shutdown.
+"""
+
+import atexit
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from structured_log import get_logger
+
+log = get_logger("memory")
+
+RING_CAPACITY = 40  # mensagens guardadas por usuário
+MAX_USERS = 1024
+IDLE_TTL = 1800.0  # segundos sem uso até sair da memória
+FLUSH_INTERVAL = 2.0
+
+
+class Conversation:
+    """A user's rolling summary and last `capacity` messages; the oldest drop off as new ones arrive."""
+
+    __slots__ = ("summary", "messages", "message_count")
+
+    def __init__(self, capacity: int = RING_CAPACITY, summary: str = "",
+                 messages: List[Dict[str, str]] = (), message_count: int = 0):
+        self.summary = summary
+        self.messages: Deque[Dict[str, str]] = deque(messages, maxlen=capacity)
+        self.message_count = message_count  # total já adicionado: dá a posição (seq) de cada mensagem
+
+    @property
+    def recent_messages(self) -> List[Dict[str, str]]:
+        return list(self.messages)
+
+    def append(self, role: str, content: str) -> None:
+        self.messages.append({"role": role, "content": content})
+        self.message_count += 1
+
+    def copy(self) -> "Conversation":
+        return Conversation(self.messages.maxlen, self.summary, self.messages, self.message_count)
+
+    def to_dict(self) -> dict:
+        """Stored document (same shape as the old `memory` entity)."""
+        return {"summary": self.summary, "recent_messages": list(self.messages), "message_count": self.message_count}
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict], capacity: int = RING_CAPACITY) -> "Conversation":
+        data = data or {}
+        return cls(capacity, data.get("summary", ""), data.get("recent_messages", []), data.get("message_count", 0))
+
+
+class ConversationStore:
+    """Per-user conversations held in memory (LRU), flushed to disk in batches by a background thread."""
+
+    def __init__(self, load: Callable[[str], Optional[dict]], save: Callable[[Dict[str, dict]], None],
+                 capacity: int = RING_CAPACITY, max_users: int = MAX_USERS, idle_ttl: float = IDLE_TTL,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.load = load
+        self.save = save
+        self.capacity = capacity
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # um flush por vez (thread de fundo x close)
+        self._users: "OrderedDict[str, Tuple[Conversation, float]]" = OrderedDict()  # -> (conversa, último uso)
+        self._dirty: Set[str] = set()
+        self._evicted: Dict[str, dict] = {}  # despejados antes de gravar: esperam o próximo flush
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.users_written = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        atexit.register(self.close)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if (self._thread is None or not self._thread.is_alive()) and not self._stop.is_set():
+                    self._thread = threading.Thread(target=self._run, name="conversation-flush", daemon=True)
+                    self._thread.start()
+
+    def _resident(self, user_id: str) -> Conversation:
+        """The live conversation of `user_id`, loading it on first access (call without the lock)."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users[user_id] = (entry[0], time.monotonic())
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            pending = self._evicted.get(user_id)
+            if pending is not None:
+                return self._admit(user_id, Conversation.from_dict(pending, self.capacity))
+        conversation = Conversation.from_dict(self.load(user_id), self.capacity)  # disco fora do lock
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:  # outra thread carregou antes
+                return entry[0]
+            self.loads += 1
+            return self._admit(user_id, conversation)
+
+    def _admit(self, user_id: str, conversation: Conversation) -> Conversation:
+        self._users[user_id] = (conversation, time.monotonic())
+        while len(self._users) > self.max_users:
+            self._evict(next(iter(self._users)))
+        return conversation
+
+    def _evict(self, user_id: str) -> None:
+        conversation, _ = self._users.pop(user_id)
+        if user_id in self._dirty:
+            self._dirty.discard(user_id)
+            self._evicted[user_id] = conversation.to_dict()
+        self.evictions += 1
+
+    def view(self, user_id: str) -> Conversation:
+        """A copy of the user's conversation, safe to read while others edit it."""
+        conversation = self._resident(user_id)
+        with self._lock:
+            return conversation.copy()
+
+    @contextmanager
+    def edit(self, user_id: str) -> Iterator[Conversation]:
+        """The live conversation, locked for the block and marked for the next flush."""
+        while True:
+            conversation = self._resident(user_id)
+            with self._lock:
+                entry = self._users.get(user_id)
+                if entry is None or entry[0] is not conversation:
+                    continue  # despejada entre o carregamento e o lock
+                try:
+                    yield conversation
+                finally:
+                    self._dirty.add(user_id)
+                    self._evicted.pop(user_id, None)
+                break
+        self._ensure_thread()
+
+    def flush(self) -> int:
+        """Write every dirty (and evicted-before-written) conversation in one `save` call."""
+        with self._flush_lock:
+            with self._lock:
+                documents = dict(self._evicted)
+                for user_id in self._dirty:
+                    documents[user_id] = self._users[user_id][0].to_dict()
+                self._dirty.clear()
+            if not documents:
+                return 0
+            started = time.perf_counter()
+            try:
+                self.save(documents)
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                    for user_id, document in documents.items():
+                        if user_id in self._users:
+                            self._dirty.add(user_id)
+                        else:
+                            self._evicted.setdefault(user_id, document)
+                raise
+            with self._lock:
+                # Sai da espera só o que foi gravado; um despejo mais novo fica para o próximo flush
+                for user_id, document in documents.items():
+                    if self._evicted.get(user_id) is document:
+                        del self._evicted[user_id]
+                self.flushes += 1
+                self.users_written += len(documents)
+                self.last_flush_ms = (time.perf_counter() - started) * 1000
+            return len(documents)
+
+    def evict_idle(self) -> int:
+        """Drop users unused for `idle_ttl` seconds (LRU order: the idle ones are at the front)."""
+        deadline = time.monotonic() - self.idle_ttl
+        evicted = 0
+        with self._lock:
+            while self._users:
+                user_id, (_, last_used) = next(iter(self._users.items()))
+                if last_used > deadline:
+                    break
+                self._evict(user_id)
+                evicted += 1
+        return evicted
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.evict_idle()
+            except Exception:
+                log.exception("Erro ao gravar conversas")
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop the flush thread and write what is still pending."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        try:
+            self.flush()
+        except Exception:
+            log.exception("Erro ao gravar conversas no shutdown")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "dirty": len(self._dirty),
+                "evicted_pending": len(self._evicted),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "flushes": self.flushes,
+                "users_written": self.users_written,
+                "errors": self.errors,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+            }
@@ -0,0 +1,155 @@
+"""
+LifeOS DB Pool
+Pool limitado de conexões SQLite reaproveitadas entre requests.
+
+Cada conexão é aberta uma vez com WAL, busy_timeout e synchronous=NORMAL, e
+mantém seu cache de statements preparados (cached_statements). Uma thread
+volta a receber a mesma conexão que usou por último quando ela está livre.
+Checkouts aninhados no mesmo contexto (ContextVar, como o unit of work do
+storage) compartilham a conexão do mais externo: duas tasks asyncio na mesma
+thread não se enxergam, e asyncio.to_thread leva o contexto de quem chamou.
+
+    with db_pool.connection() as conn:
+        conn.execute(...)
+
+O bloco externo faz commit ao sair (rollback se levantar exceção).
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import List, Optional
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 256
+ACQUIRE_TIMEOUT = 10.0  # segundos esperando uma conexão livre
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections with thread affinity and per-context reentrant checkouts."""
+
+    def __init__(self, path: Path, size: int = POOL_SIZE, busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+                 cached_statements: int = CACHED_STATEMENTS, acquire_timeout: float = ACQUIRE_TIMEOUT):
+        self.path = Path(path)
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle: List[sqlite3.Connection] = []
+        self._open = 0
+        self._local = threading.local()
+        self._current: ContextVar[Optional[sqlite3.Connection]] = ContextVar(f"db_pool_{id(self)}", default=None)
+        self.created = 0
+        self.checkouts = 0
+        self.affine_hits = 0
+        self.waits = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Conexões migram entre threads do threadpool, mas nunca são usadas por duas ao mesmo tempo
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        preferred = getattr(self._local, "last", None)
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            self.checkouts += 1
+            while True:
+                if preferred is not None and preferred in self._idle:
+                    self._idle.remove(preferred)
+                    self.affine_hits += 1
+                    return preferred
+                if self._idle:
+                    return self._idle.pop()
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Nenhuma conexão livre em {self.acquire_timeout}s (pool={self.size})")
+                self.waits += 1
+                self._cond.wait(remaining)
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        self._local.last = conn
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        if getattr(self._local, "last", None) is conn:
+            self._local.last = None
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; the outermost block of a context commits (or rolls back) on exit."""
+        current = self._current.get()
+        if current is not None:
+            yield current
+            return
+        conn = self._acquire()
+        token = self._current.set(conn)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            self._current.reset(token)
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+                raise
+            self._release(conn)
+            raise
+        self._current.reset(token)
+        self._release(conn)
+
+    def close(self) -> None:
+        """Close the idle connections (used at shutdown)."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "affine_hits": self.affine_hits,
+                "waits": self.waits,
+            }
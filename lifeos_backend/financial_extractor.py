@@ -0,0 +1,204 @@
+"""
+LifeOS Financial Extractor
+Extração incremental de renda, despesas e dívidas da conversa de consultoria.
+
+Cada usuário tem uma marca d'água (id da última mensagem do chat já lida) e os
+fatos parciais extraídos até ela. Uma extração só lê as mensagens depois da
+marca, dobra o que achou nos fatos que já tinha e grava fatos + marca juntos:
+o custo de um turno não cresce com o tamanho da conversa.
+
+O trabalho roda fora do request, numa thread de fundo (BackgroundExtractor):
+o /chat só enfileira o usuário, e pedidos repetidos do mesmo usuário enquanto
+ele ainda espera na fila viram uma execução só.
+"""
+
+import atexit
+import json
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from br_parser import parse_values
+from structured_log import get_logger
+
+log = get_logger("extract")
+
+FALLBACK_NUMBERS = 2  # o último recurso só usa os dois primeiros valores distintos da conversa
+WAIT_TIMEOUT = 5.0  # segundos que uma leitura espera a extração pendente do usuário
+
+# Palavras que ancoram o valor seguinte da mensagem (o valor em si vem do br_parser)
+INCOME_WORDS = re.compile(r"\b(?:renda|ganho|salário|salario|recebo)\b", re.IGNORECASE)
+EXPENSE_WORDS = re.compile(r"\b(?:despesas?|gastos?|custos?)\b", re.IGNORECASE)
+DEBT_WORDS = [
+    re.compile(r"cartão|cartao|nubank", re.IGNORECASE),
+    re.compile(r"multa", re.IGNORECASE),
+    re.compile(r"empréstim|emprestim", re.IGNORECASE),
+    re.compile(r"dívida|divida", re.IGNORECASE),
+]
+
+
+class FinancialFacts:
+    """Facts folded from a user's chat history, up to and including `last_message_id`."""
+
+    def __init__(self, last_message_id: int = 0, income: float = 0, expenses: float = 0,
+                 debts: Iterable[float] = (), numbers: Iterable[float] = ()):
+        self.last_message_id = last_message_id
+        self.income = income
+        self.expenses = expenses
+        # dicts como conjuntos ordenados: dedupe O(1) mantendo a ordem em que apareceram
+        self.debts: Dict[float, None] = dict.fromkeys(debts)
+        self.numbers: Dict[float, None] = dict.fromkeys(numbers)
+
+    @classmethod
+    def from_row(cls, row: Optional[tuple]) -> "FinancialFacts":
+        """From a `financial_facts` row (last_message_id, income, expenses, debts, numbers), or empty."""
+        if row is None:
+            return cls()
+        last_message_id, income, expenses, debts, numbers = row
+        return cls(last_message_id, income, expenses, json.loads(debts), json.loads(numbers))
+
+    def to_row(self, user_id: int) -> tuple:
+        return (user_id, self.last_message_id, self.income, self.expenses,
+                json.dumps(list(self.debts)), json.dumps(list(self.numbers)))
+
+    def feed(self, message_id: int, content: str, role: str) -> None:
+        """Fold one chat message in; messages must arrive in id order."""
+        self.last_message_id = message_id
+        # Valores ("R$ 1.234,56", "2 mil") já sem prazos/datas/percentuais, numa passada
+        values = parse_values(content)
+        if not values.amounts:
+            return
+        for amount in values.amounts:
+            if len(self.numbers) >= FALLBACK_NUMBERS:
+                break
+            if amount.value > 0:
+                self.numbers[amount.value] = None
+        if role != "user":
+            return
+
+        # Renda: primeiro valor depois da palavra, ou o da mensagem ("3000 é minha renda")
+        renda_match = INCOME_WORDS.search(content)
+        if renda_match and not self.income:
+            self.income = values.amount_after(renda_match.end()) or values.first_amount()
+
+        despesa_match = EXPENSE_WORDS.search(content)
+        if despesa_match and not self.expenses:
+            self.expenses = values.amount_after(despesa_match.end()) or 0
+
+        # Dívidas mencionadas (cartão, multa, etc)
+        for pattern in DEBT_WORDS:
+            debt_match = pattern.search(content)
+            if debt_match:
+                amount = values.amount_after(debt_match.end())
+                if amount:
+                    self.debts[amount] = None
+
+    def result(self) -> Tuple[float, float, List[float]]:
+        """(income, expenses, debts), filling gaps with the first distinct amounts of the conversation."""
+        income, expenses = self.income, self.expenses
+        numbers = list(self.numbers)
+        if not income and numbers:
+            income = numbers[0]
+        if not expenses and len(numbers) > 1:
+            expenses = numbers[1]
+        # Renda > despesas em geral: provável que os valores estão trocados
+        if income > 0 and expenses > income * 5:
+            income, expenses = expenses, income
+        return income, expenses, list(self.debts)
+
+
+class BackgroundExtractor:
+    """Runs `extract(user_id, save)` on a worker thread; queued requests for a user are coalesced."""
+
+    def __init__(self, extract: Callable[[int, bool], None]):
+        self.extract = extract
+        self._cond = threading.Condition()
+        self._pending: Dict[int, bool] = {}  # user_id -> save (qualquer pedido com save=True vence)
+        self._running: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.runs = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_run_ms = 0.0
+        self.max_run_ms = 0.0
+        atexit.register(self.close)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="financial-extractor", daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id: int, save: bool = False) -> None:
+        """Queue an extraction for `user_id` and return immediately."""
+        with self._cond:
+            if not self._closed:
+                if user_id in self._pending:
+                    self.coalesced += 1
+                self._pending[user_id] = self._pending.get(user_id, False) or save
+                self._ensure_thread()
+                self._cond.notify_all()
+                return
+        self._execute(user_id, save)  # já fechado (shutdown): roda aqui mesmo
+
+    def wait(self, user_id: int, timeout: float = WAIT_TIMEOUT) -> bool:
+        """Block until nothing is queued or running for `user_id`; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while user_id in self._pending or self._running == user_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _execute(self, user_id: int, save: bool) -> None:
+        started = time.perf_counter()
+        try:
+            self.extract(user_id, save)
+        except Exception:
+            self.errors += 1
+            log.exception("Erro na extração", user_id=user_id)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.runs += 1
+        self.last_run_ms = elapsed_ms
+        self.max_run_ms = max(self.max_run_ms, elapsed_ms)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                user_id = next(iter(self._pending))
+                save = self._pending.pop(user_id)
+                self._running = user_id
+            try:
+                self._execute(user_id, save)
+            finally:
+                with self._cond:
+                    self._running = None
+                    self._cond.notify_all()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Finish the queued extractions and stop the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "last_run_ms": round(self.last_run_ms, 3),
+            "max_run_ms": round(self.max_run_ms, 3),
+        }
@@ -0,0 +1,547 @@
+"""
+LifeOS History Store
+Log append-only de eventos financeiros, particionado por usuário.
+
+Cada partição tem dois arquivos:
+- <particao>.log: um evento JSON por linha (NDJSON), nunca reescrito
+- <particao>.idx: índice binário de tamanho fixo (event_id -> byte offset,
+  timestamp e tipo), usado para paginação e filtros sem ler o log
+- <particao>.tipos: dicionário dos tipos de evento referenciados no índice
+
+Registrar um evento é um append O(1) nos dois arquivos; o índice é derivado
+do log e pode ser reconstruído a qualquer momento.
+
+Eventos de mudança guardam só o delta do financeiro (campos alterados e
+dívidas adicionadas/removidas). A cada SNAPSHOT_EVERY eventos o estado
+completo vai junto, e o estado em qualquer ponto do histórico é refeito a
+partir do snapshot mais próximo.
+"""
+
+import copy
+import json
+import os
+import struct
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from structured_log import get_logger
+
+log = get_logger("history")
+
+GLOBAL_PARTITION = "global"
+
+# Cabeçalho do .idx; versão diferente => índice reconstruído a partir do log
+INDEX_MAGIC = b"LIDX\x02\x00\x00\x00"
+# (event_id, byte offset no .log, timestamp, código do tipo em <particao>.tipos)
+INDEX_RECORD = struct.Struct("<QQqH")
+SCAN_CHUNK = 1024  # registros de índice lidos por vez nas consultas
+SNAPSHOT_EVERY = 20  # eventos entre snapshots completos do financeiro
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def _item_id(item):
+    return _canonical(item["id"]) if isinstance(item, dict) and "id" in item else None
+
+
+def _item_ref(item, id_counts: Counter):
+    """Compact reference to a list item: its id when no other item shares it, else the item itself."""
+    key = _item_id(item)
+    if key is not None and id_counts[key] == 1:
+        return {"id": item["id"]}
+    return item
+
+
+def _item_matches(item, ref) -> bool:
+    if isinstance(item, dict) and isinstance(ref, dict) and "id" in item and set(ref) == {"id"}:
+        return item["id"] == ref["id"]
+    return _canonical(item) == _canonical(ref)
+
+
+def diff_state(before: dict, after: dict) -> dict:
+    """Compact delta between two financeiro dicts.
+
+    Scalars go to "set"/"unset"; list fields (dividas) record only the items
+    removed (by id, when no other item shares it) and added, so the delta
+    doesn't grow with the size of the list.
+    """
+    delta: dict = {}
+    for key, new in after.items():
+        old = before.get(key)
+        if key in before and _canonical(old) == _canonical(new):
+            continue
+        if isinstance(old, list) and isinstance(new, list):
+            id_counts = Counter(_item_id(i) for i in old)
+            unmatched_new = Counter(_canonical(i) for i in new)
+            removed = []
+            for item in old:
+                canon = _canonical(item)
+                if unmatched_new[canon]:
+                    unmatched_new[canon] -= 1
+                else:
+                    removed.append(_item_ref(item, id_counts))
+            unmatched_old = Counter(_canonical(i) for i in old)
+            added = []
+            for item in new:
+                canon = _canonical(item)
+                if unmatched_old[canon]:
+                    unmatched_old[canon] -= 1
+                else:
+                    added.append(item)
+            if removed or added:
+                change = {}
+                if removed:
+                    change["remove"] = removed
+                if added:
+                    change["add"] = added
+                delta.setdefault("lists", {})[key] = change
+            continue
+        delta.setdefault("set", {})[key] = new
+    unset = [key for key in before if key not in after]
+    if unset:
+        delta["unset"] = unset
+    return delta
+
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    """Apply a delta produced by diff_state, returning a new dict."""
+    state = copy.deepcopy(state)
+    for key, value in delta.get("set", {}).items():
+        state[key] = copy.deepcopy(value)
+    for key in delta.get("unset", []):
+        state.pop(key, None)
+    for key, change in delta.get("lists", {}).items():
+        items = list(state.get(key) or [])
+        for ref in change.get("remove", []):
+            for i, item in enumerate(items):
+                if _item_matches(item, ref):
+                    del items[i]
+                    break
+        items.extend(copy.deepcopy(change.get("add", [])))
+        state[key] = items
+    return state
+
+
+def partition_key(user_id) -> str:
+    """Partition name for a user id; events without user go to the global partition."""
+    if user_id is None:
+        return GLOBAL_PARTITION
+    key = str(user_id)
+    if not key.replace("-", "").replace("_", "").isalnum():
+        raise ValueError(f"user_id inválido para partição: {user_id!r}")
+    return key
+
+
+class _Partition:
+    """Open handles and cached tail position of a single user log."""
+
+    def __init__(self, root: Path, key: str):
+        self.log_path = root / f"{key}.log"
+        self.idx_path = root / f"{key}.idx"
+        self.tipos_path = root / f"{key}.tipos"
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.log_size = 0
+        self.count = 0
+        # Estado após o último evento e quantos deltas desde o último snapshot
+        # (carregado sob demanda pelo HistoryStore)
+        self.last_state: Optional[dict] = None
+        self.since_snapshot = 0
+        self.tipos: List[str] = []
+        if self.tipos_path.exists():
+            self.tipos = self.tipos_path.read_text(encoding="utf-8").splitlines()
+        self.tipo_codes = {tipo: code for code, tipo in enumerate(self.tipos)}
+        self._recover()
+        self.log = open(self.log_path, "ab")
+        self.idx = open(self.idx_path, "ab")
+
+    def tipo_code(self, tipo: str) -> int:
+        code = self.tipo_codes.get(tipo)
+        if code is None:
+            code = len(self.tipos)
+            with open(self.tipos_path, "a", encoding="utf-8") as f:
+                f.write(tipo + "\n")
+            self.tipos.append(tipo)
+            self.tipo_codes[tipo] = code
+        return code
+
+    def _index_entry(self, event: dict, offset: int) -> bytes:
+        return INDEX_RECORD.pack(
+            int(event["id"]), offset, int(event.get("timestamp") or 0), self.tipo_code(str(event.get("tipo", "")))
+        )
+
+    def _recover(self) -> None:
+        """Drop torn writes and index any log tail the index is missing."""
+        self.log_path.touch(exist_ok=True)
+        self.idx_path.touch(exist_ok=True)
+
+        # Log: descarta linha final incompleta (crash no meio do append)
+        with open(self.log_path, "rb+") as log:
+            data_end = log.seek(0, os.SEEK_END)
+            if data_end:
+                pos = data_end
+                while pos > 0:
+                    step = min(4096, pos)
+                    log.seek(pos - step)
+                    chunk = log.read(step)
+                    nl = chunk.rfind(b"\n")
+                    if nl != -1:
+                        data_end = pos - step + nl + 1
+                        break
+                    pos -= step
+                else:
+                    data_end = 0
+                log.truncate(data_end)
+        self.log_size = data_end
+
+        # Índice: versão antiga é refeita; descarta registro parcial e entradas além do log
+        with open(self.idx_path, "rb+") as idx:
+            if idx.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                idx.seek(0)
+                idx.truncate(0)
+                idx.write(INDEX_MAGIC)
+            idx_size = idx.seek(0, os.SEEK_END)
+            count = (idx_size - len(INDEX_MAGIC)) // INDEX_RECORD.size
+            resume_offset = 0
+            while count:
+                idx.seek(len(INDEX_MAGIC) + (count - 1) * INDEX_RECORD.size)
+                event_id, offset, _, _ = INDEX_RECORD.unpack(idx.read(INDEX_RECORD.size))
+                if offset < self.log_size:
+                    self.last_id = event_id
+                    resume_offset = offset
+                    break
+                count -= 1
+            idx.truncate(len(INDEX_MAGIC) + count * INDEX_RECORD.size)
+
+            # Reindexa eventos gravados no log mas não no índice
+            with open(self.log_path, "rb") as log:
+                log.seek(resume_offset)
+                if count:
+                    log.readline()  # último evento já indexado
+                offset = log.tell()
+                idx.seek(0, os.SEEK_END)
+                for line in log:
+                    event = json.loads(line)
+                    self.last_id = int(event["id"])
+                    idx.write(self._index_entry(event, offset))
+                    offset += len(line)
+                    count += 1
+        self.count = count
+
+    def append(self, event: dict, durable: bool) -> None:
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        offset = self.log_size
+        entry = self._index_entry(event, offset)
+        self.log.write(line)
+        self.log.flush()
+        if durable:
+            os.fsync(self.log.fileno())
+        self.idx.write(entry)
+        self.idx.flush()
+        self.log_size += len(line)
+        self.last_id = event["id"]
+        self.count += 1
+
+    def close(self) -> None:
+        self.log.close()
+        self.idx.close()
+
+
+class HistoryStore:
+    """Append-only event log partitioned per user, with an id -> offset index."""
+
+    def __init__(self, root: Path, durable: bool = True, snapshot_every: int = SNAPSHOT_EVERY):
+        self.root = Path(root)
+        self.durable = durable
+        self.snapshot_every = snapshot_every
+        self._partitions: Dict[str, _Partition] = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, key: str) -> _Partition:
+        part = self._partitions.get(key)
+        if part is None:
+            with self._lock:
+                part = self._partitions.get(key)
+                if part is None:
+                    self.root.mkdir(parents=True, exist_ok=True)
+                    part = _Partition(self.root, key)
+                    self._partitions[key] = part
+        return part
+
+    def append(self, user_id, event: dict) -> dict:
+        """Append an event, assigning the next id of the user's partition."""
+        part = self._partition(partition_key(user_id))
+        with part.lock:
+            event = {"id": part.last_id + 1, **{k: v for k, v in event.items() if k != "id"}}
+            part.append(event, self.durable)
+        return event
+
+    def _append_change(self, part: _Partition, event: dict, before: dict, after: dict, durable: bool) -> dict:
+        """Append a change event as a delta, with a full snapshot when due (caller holds part.lock)."""
+        if part.last_state is None and part.count:
+            part.last_state, part.since_snapshot = self._reconstruct(part, part.count - 1)
+        event = {"id": part.last_id + 1, **{k: v for k, v in event.items() if k != "id"}}
+        event["delta"] = diff_state(before, after)
+        # Snapshot quando vence o intervalo ou quando o "antes" não bate com o
+        # último estado registrado (mudança feita fora do histórico)
+        if (
+            part.last_state is None
+            or part.since_snapshot + 1 >= self.snapshot_every
+            or _canonical(part.last_state) != _canonical(before)
+        ):
+            event["snapshot"] = after
+            part.since_snapshot = 0
+        else:
+            part.since_snapshot += 1
+        part.append(event, durable)
+        part.last_state = copy.deepcopy(after)
+        return event
+
+    def append_change(self, user_id, event: dict, before: dict, after: dict) -> dict:
+        """Append an event that changed the financeiro from `before` to `after`."""
+        part = self._partition(partition_key(user_id))
+        with part.lock:
+            return self._append_change(part, event, before, after, self.durable)
+
+    def count(self, user_id) -> int:
+        return self._partition(partition_key(user_id)).count
+
+    def last_id(self, user_id) -> int:
+        return self._partition(partition_key(user_id)).last_id
+
+    @staticmethod
+    def _record(idx, pos: int) -> Tuple[int, int, int, int]:
+        idx.seek(len(INDEX_MAGIC) + pos * INDEX_RECORD.size)
+        return INDEX_RECORD.unpack(idx.read(INDEX_RECORD.size))
+
+    def _bisect(self, idx, count: int, event_id: int) -> int:
+        """Position of the first index record with id >= event_id (ids are increasing)."""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(idx, mid)[0] < event_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @staticmethod
+    def _records(idx, start: int, stop: int, reverse: bool = False) -> Iterator[Tuple[int, int, int, int]]:
+        """Index records in [start, stop), read in chunks; no event is parsed."""
+        if reverse:
+            while stop > start:
+                begin = max(start, stop - SCAN_CHUNK)
+                idx.seek(len(INDEX_MAGIC) + begin * INDEX_RECORD.size)
+                chunk = list(INDEX_RECORD.iter_unpack(idx.read((stop - begin) * INDEX_RECORD.size)))
+                yield from reversed(chunk)
+                stop = begin
+        else:
+            idx.seek(len(INDEX_MAGIC) + start * INDEX_RECORD.size)
+            while start < stop:
+                n = min(SCAN_CHUNK, stop - start)
+                yield from INDEX_RECORD.iter_unpack(idx.read(n * INDEX_RECORD.size))
+                start += n
+
+    def _matches(
+        self,
+        part: _Partition,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        tipo: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        reverse: bool = False,
+    ) -> Iterator[Tuple[int, int]]:
+        """(event_id, offset) of the events matching the filters, using only the index."""
+        code = None
+        if tipo is not None:
+            code = part.tipo_codes.get(tipo)
+            if code is None:
+                return
+        count = part.count
+        with open(part.idx_path, "rb") as idx:
+            start = self._bisect(idx, count, after_id + 1) if after_id else 0
+            stop = self._bisect(idx, count, before_id) if before_id else count
+            for event_id, offset, ts, tipo_code in self._records(idx, start, stop, reverse):
+                if code is not None and tipo_code != code:
+                    continue
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    continue
+                yield event_id, offset
+
+    def _reconstruct(self, part: _Partition, pos: int) -> Tuple[dict, int]:
+        """State after the event at index position `pos` and how many deltas were replayed.
+
+        Walks back to the nearest snapshot (at most snapshot_every events), then
+        replays the deltas forward. Legacy events carry estado_depois, which also
+        works as a snapshot.
+        """
+        deltas = []
+        state: dict = {}
+        with open(part.idx_path, "rb") as idx, open(part.log_path, "rb") as log:
+            while pos >= 0:
+                _, offset, _, _ = self._record(idx, pos)
+                log.seek(offset)
+                event = json.loads(log.readline())
+                base = event.get("snapshot", event.get("estado_depois"))
+                if base is not None:
+                    state = base
+                    break
+                deltas.append(event.get("delta", {}))
+                pos -= 1
+        for delta in reversed(deltas):
+            state = apply_delta(state, delta)
+        return state, len(deltas)
+
+    def state_at(
+        self, user_id, event_id: Optional[int] = None, timestamp: Optional[int] = None
+    ) -> Tuple[Optional[int], Optional[dict]]:
+        """Financeiro as it was right after `event_id` (or the last event at/before `timestamp`).
+
+        Without arguments returns the state after the newest event. Returns
+        (None, None) when there is no event at or before the given point.
+        """
+        part = self._partition(partition_key(user_id))
+        count = part.count
+        with open(part.idx_path, "rb") as idx:
+            if event_id is not None:
+                pos = self._bisect(idx, count, event_id + 1) - 1
+            elif timestamp is not None:
+                lo, hi = 0, count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self._record(idx, mid)[2] <= timestamp:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                pos = lo - 1
+            else:
+                pos = count - 1
+            if pos < 0:
+                return None, None
+            found_id = self._record(idx, pos)[0]
+        state, _ = self._reconstruct(part, pos)
+        return found_id, state
+
+    def get(self, user_id, event_id: int) -> Optional[dict]:
+        """Read a single event by id without scanning the log."""
+        part = self._partition(partition_key(user_id))
+        with open(part.idx_path, "rb") as idx:
+            pos = self._bisect(idx, part.count, event_id)
+            if pos == part.count:
+                return None
+            found_id, offset, _, _ = self._record(idx, pos)
+        if found_id != event_id:
+            return None
+        with open(part.log_path, "rb") as log:
+            log.seek(offset)
+            return json.loads(log.readline())
+
+    def query(
+        self,
+        user_id,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: int = 50,
+        tipo: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """One page of events in id order, plus the cursor for the next page (or None).
+
+        With after_id the page moves forward and the cursor is the next after_id;
+        with before_id (and no after_id) it moves backward from the newest events
+        and the cursor is the next before_id.
+        """
+        part = self._partition(partition_key(user_id))
+        backward = before_id is not None and after_id is None
+        hits = []
+        for hit in self._matches(part, after_id, before_id, tipo, since, until, reverse=backward):
+            hits.append(hit)
+            if len(hits) > limit:
+                break
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+        if backward:
+            hits.reverse()
+        eventos = []
+        with open(part.log_path, "rb") as log:
+            for _, offset in hits:
+                log.seek(offset)
+                eventos.append(json.loads(log.readline()))
+        cursor = None
+        if has_more and hits:
+            cursor = hits[0][0] if backward else hits[-1][0]
+        return eventos, cursor
+
+    def tail(self, user_id, limit: int) -> Tuple[List[dict], Optional[int]]:
+        """Newest `limit` events; the cursor is the before_id for older ones."""
+        return self.query(user_id, before_id=self.last_id(user_id) + 1, limit=limit)
+
+    def iter_lines(
+        self,
+        user_id,
+        after_id: Optional[int] = None,
+        tipo: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+    ) -> Iterator[bytes]:
+        """Raw NDJSON lines for streaming exports; events are never decoded."""
+        part = self._partition(partition_key(user_id))
+        end = part.log_size
+        with open(part.log_path, "rb") as log:
+            if not (after_id or tipo or since is not None or until is not None):
+                while log.tell() < end:
+                    yield log.readline()
+                return
+            for _, offset in self._matches(part, after_id, None, tipo, since, until):
+                log.seek(offset)
+                yield log.readline()
+
+    def iter_events(self, user_id) -> Iterator[dict]:
+        """Iterate a user's events in id order."""
+        for line in self.iter_lines(user_id):
+            yield json.loads(line)
+
+    def load(self, user_id) -> dict:
+        """Legacy shape: {"eventos": [...]} with every event of the user."""
+        return {"eventos": list(self.iter_events(user_id))}
+
+    def import_legacy(self, legacy_file: Path, user_id=None) -> int:
+        """Import a legacy {"eventos": [...]} file in one pass; returns how many were imported.
+
+        Full estado_antes/estado_depois are converted to deltas plus periodic
+        snapshots. Only imports into an empty partition, so running it twice is harmless.
+        Legacy files carry no user ids: without `user_id` the events go to the
+        global partition, which only reads with user_id=None see.
+        """
+        legacy_file = Path(legacy_file)
+        if not legacy_file.exists():
+            return 0
+        part = self._partition(partition_key(user_id))
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            eventos: List[dict] = json.load(f).get("eventos", [])
+        with part.lock:
+            if part.last_id:
+                return 0
+            for evento in eventos:
+                evento = dict(evento)
+                before = evento.pop("estado_antes", None) or {}
+                after = evento.pop("estado_depois", None) or {}
+                self._append_change(part, evento, before, after, durable=False)
+            part.log.flush()
+            os.fsync(part.log.fileno())
+        log.info("Eventos importados do arquivo legado", count=len(eventos), file=str(legacy_file))
+        return len(eventos)
+
+    def close(self) -> None:
+        with self._lock:
+            for part in self._partitions.values():
+                part.close()
+            self._partitions.clear()
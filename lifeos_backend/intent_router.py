@@ -0,0 +1,153 @@
+"""
+LifeOS Intent Router
+Detecção de intenções por palavra-chave, compilada uma vez.
+
+Cada intenção tem uma lista de palavras-chave (com acento, como se escreve);
+todas viram uma única regex. A mensagem é normalizada uma vez (casefold + sem
+acentos) e percorrida numa passada só, então "Dívida", "divida" e "DIVIDAS"
+caem na mesma intenção.
+
+Sintaxe das palavras-chave:
+    "sim"           palavra inteira ("assim" não conta)
+    "dívida*"       radical: dívida, dívidas, ...
+    "pode apagar"   expressão de várias palavras, com qualquer espaço entre elas
+"""
+
+import re
+import unicodedata
+from enum import Enum
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Tuple
+
+MATCH_CACHE_SIZE = 4096
+
+
+class Intent(str, Enum):
+    FINANCE = "finance"            # assunto financeiro em geral (orquestrador do main.py)
+    DEBT = "debt"
+    FINANCE_AREA = "finance_area"  # a página/seção "financeiro"
+    READ_FINANCE = "read_finance"
+    URGENCY = "urgency"            # informação de urgência da dívida (fase 1 -> 2)
+    OVERDUE = "overdue"
+    DUE_SOON = "due_soon"
+    CONFIRM = "confirm"
+    DELETE = "delete"
+    ADD = "add"
+    HISTORY = "history"
+    STRATEGY = "strategy"          # pedido de estratégia/plano
+    SAVE_VERB = "save_verb"        # "adicione", "salva", "coloca" ...
+    SAVE_TARGET = "save_target"    # ... "na página", "no controle", "o plano"
+    TASK = "task"
+    ROUTINE = "routine"
+    CALENDAR = "calendar"
+
+
+# Mensagens do usuário
+MESSAGE_KEYWORDS: Dict[Intent, Tuple[str, ...]] = {
+    Intent.FINANCE: ("dívida*", "endividad*", "financeiro*", "devo", "devend*", "pagar*", "quit*",
+                     "débito*", "empréstimo*", "cartão*", "cartões", "nubank", "credor*"),
+    Intent.DEBT: ("dívida*", "endividad*"),
+    Intent.FINANCE_AREA: ("financeiro*",),
+    Intent.READ_FINANCE: ("como está", "o que tem", "mostre", "mostra", "status", "meu financeiro"),
+    Intent.URGENCY: ("atrasad*", "atraso*", "juros", "venc*", "urgent*", "dias"),
+    Intent.OVERDUE: ("atrasad*", "atraso*", "juros", "urgent*"),
+    Intent.DUE_SOON: ("venc*", "próxim*", "breve"),
+    Intent.CONFIRM: ("sim", "ok", "yes", "claro", "pode", "confirmo", "confirmar", "confirma"),
+    Intent.DELETE: ("apagar", "apague", "remover", "remova", "excluir", "exclua"),
+    Intent.ADD: ("adicionar", "criar", "crie", "nova"),
+    Intent.HISTORY: ("histórico*", "extrato*", "pago"),
+    Intent.STRATEGY: ("estratégia*", "plano*", "criar", "ajuda*", "dívidas"),
+    Intent.SAVE_VERB: ("adicione", "adiciona*", "salve", "salva*", "coloque", "coloca*", "guarde", "guarda*"),
+    Intent.SAVE_TARGET: ("financeiro*", "página", "controle*", "estratégia*", "plano*"),
+    Intent.TASK: ("tarefa*", "fazer", "preciso", "tenho que"),
+    Intent.ROUTINE: ("rotina*", "acordar", "dormir", "sempre", "todo dia"),
+    Intent.CALENDAR: ("reunião", "reuniões", "evento*", "compromisso*", "amanhã", "hoje", "calendário*"),
+}
+
+# Respostas da IA: só o tema explícito conta ("hoje"/"sempre" aparecem em qualquer resposta)
+REPLY_KEYWORDS: Dict[Intent, Tuple[str, ...]] = {
+    Intent.FINANCE: ("financeiro*", "dívida*"),
+    Intent.TASK: ("tarefa*",),
+    Intent.ROUTINE: ("rotina*",),
+    Intent.CALENDAR: ("calendário*",),
+}
+
+
+def fold(text: str) -> str:
+    """Casefold and strip accents ("Dívida" -> "divida")."""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def _keyword_pattern(keyword: str) -> str:
+    stem = keyword.endswith("*")
+    words = fold(keyword.rstrip("*")).split()
+    return r"\s+".join(re.escape(word) for word in words) + (r"\w*" if stem else r"\b")
+
+
+class Route(NamedTuple):
+    """Intents found in a text and the keywords (folded) that triggered them."""
+
+    intents: FrozenSet[Intent]
+    keywords: FrozenSet[str]
+
+    def __contains__(self, intent: Intent) -> bool:
+        return intent in self.intents
+
+    def any(self, *intents: Intent) -> bool:
+        return not self.intents.isdisjoint(intents)
+
+
+class IntentRouter:
+    """All keyword sets compiled into one regex, matched in a single pass over the folded text."""
+
+    def __init__(self, keywords: Dict[Intent, Iterable[str]]):
+        self._intents_by_keyword: Dict[str, set] = {}
+        for intent, words in keywords.items():
+            for word in words:
+                self._intents_by_keyword.setdefault(fold(word), set()).add(intent)
+        self._patterns = {word: re.compile(_keyword_pattern(word)) for word in self._intents_by_keyword}
+        # Mais longas primeiro: numa posição vence "pode apagar" sobre "pode"; as mais curtas
+        # que também casam ali são recuperadas em _keywords_at
+        ordered = sorted(self._patterns, key=lambda w: len(w.rstrip("*")), reverse=True)
+        alternatives = "|".join(self._patterns[word].pattern for word in ordered)
+        # Lookahead em cada início de palavra: acha expressões que se sobrepõem ("pode apagar" e "apagar")
+        self.regex = re.compile(rf"\b(?=({alternatives}))")
+        self._match_cache: Dict[str, Tuple[FrozenSet[Intent], FrozenSet[str]]] = {}
+
+    def _keywords_at(self, matched: str) -> Tuple[FrozenSet[Intent], FrozenSet[str]]:
+        """Every keyword that matches at the start of `matched` (the longest hit at a position)."""
+        cached = self._match_cache.get(matched)
+        if cached is None:
+            words = frozenset(word for word, pattern in self._patterns.items() if pattern.match(matched))
+            intents = frozenset(i for word in words for i in self._intents_by_keyword[word])
+            if len(self._match_cache) >= MATCH_CACHE_SIZE:
+                self._match_cache.clear()
+            cached = self._match_cache[matched] = (intents, words)
+        return cached
+
+    def route(self, text: str) -> Route:
+        intents: set = set()
+        keywords: set = set()
+        for match in self.regex.finditer(fold(text)):
+            found_intents, found_words = self._keywords_at(match.group(1))
+            intents |= found_intents
+            keywords |= found_words
+        return Route(frozenset(intents), frozenset(keywords))
+
+
+message_router = IntentRouter(MESSAGE_KEYWORDS)
+reply_router = IntentRouter(REPLY_KEYWORDS)
+
+
+@lru_cache(maxsize=1024)
+def route_message(text: str) -> Route:
+    """Intents of a user message (memoized: the same message is routed by several handlers)."""
+    return message_router.route(text)
+
+
+def route_reply(text: str) -> Route:
+    """Intents explicitly named in an AI reply."""
+    return reply_router.route(text)
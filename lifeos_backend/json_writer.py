@@ -0,0 +1,154 @@
+"""
+LifeOS JSON Writer
+Escrita atômica e com group commit para os arquivos de estado JSON.
+
+Cada arquivo é gravado num temporário no mesmo diretório, com fsync, e só
+então renomeado por cima do original: um crash nunca deixa JSON truncado.
+Escritas que chegam dentro de uma janela curta são agrupadas num único commit
+(a última versão de cada arquivo vence) e quem chamou espera o commit.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+COMMIT_WINDOW = 0.005  # segundos esperando outras escritas antes do commit
+
+
+def atomic_write_text(path: Path, data: str) -> None:
+    """Write to a temp file, fsync it and rename it over `path`."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def fsync_dir(directory: Path) -> None:
+    """Persist renames in `directory` (no-op where directories can't be opened, e.g. Windows)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _PendingWrite:
+    def __init__(self, data: str):
+        self.data = data
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitWriter:
+    """Background committer that coalesces writes per file into atomic group commits."""
+
+    def __init__(self, window: float = COMMIT_WINDOW):
+        self.window = window
+        self._cond = threading.Condition()
+        self._pending: Dict[Path, _PendingWrite] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.commits = 0
+        self.files_written = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self._total_commit_ms = 0.0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="json-group-commit", daemon=True)
+            self._thread.start()
+
+    def write(self, path: Path, data: str, wait: bool = True) -> None:
+        """Queue `data` for `path`; with wait=True, block until it is durably on disk."""
+        path = Path(path).resolve()
+        with self._cond:
+            self.writes += 1
+            pending = self._pending.get(path)
+            if pending is None:
+                pending = self._pending[path] = _PendingWrite(data)
+            else:
+                pending.data = data
+                self.coalesced += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+        if wait:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+            self._commit(batch)
+
+    def _commit(self, batch: Dict[Path, _PendingWrite]) -> None:
+        started = time.perf_counter()
+        directories = set()
+        for path, pending in batch.items():
+            try:
+                atomic_write_text(path, pending.data)
+                directories.add(path.parent)
+            except BaseException as e:
+                pending.error = e
+        for directory in directories:
+            fsync_dir(directory)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self.commits += 1
+            self.files_written += len(batch)
+            self.last_commit_ms = elapsed_ms
+            self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+            self._total_commit_ms += elapsed_ms
+        for pending in batch.values():
+            pending.done.set()
+
+    def flush(self) -> None:
+        """Commit anything still pending in the calling thread (used at shutdown)."""
+        with self._cond:
+            batch, self._pending = self._pending, {}
+        if batch:
+            self._commit(batch)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "writes": self.writes,
+                "coalesced": self.coalesced,
+                "commits": self.commits,
+                "files_written": self.files_written,
+                "last_commit_ms": round(self.last_commit_ms, 3),
+                "avg_commit_ms": round(self._total_commit_ms / self.commits, 3) if self.commits else 0.0,
+                "max_commit_ms": round(self.max_commit_ms, 3),
+            }
+
+
+writer = GroupCommitWriter()
+atexit.register(writer.flush)
+
+
+def write_json(path: Path, data, wait: bool = True) -> None:
+    """Serialize in the caller (a snapshot of `data`) and commit it through the shared writer."""
+    writer.write(path, json.dumps(data, ensure_ascii=False, indent=2), wait=wait)
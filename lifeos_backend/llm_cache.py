@@ -0,0 +1,113 @@
+"""
+LifeOS LLM Cache
+Cache de respostas do OpenRouter na frente do gateway.
+
+A chave é um hash do array `messages` normalizado (espaços colapsados), do
+modelo e de temperature/max_tokens, com escopo por usuário: dois payloads
+iguais do mesmo usuário dão a mesma resposta sem ida à rede. Como o contexto
+(perfil financeiro, histórico) faz parte das mensagens, qualquer mudança de
+estado muda a chave sozinha.
+
+As entradas vivem num TTLCache (LRU + TTL) e, quando `path` é dado, também
+numa tabela SQLite, para sobreviver a restarts; um miss em memória consulta o
+disco e promove a entrada.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Hashable, Optional
+
+from cache import TTLCache
+
+CACHE_SIZE = 2048
+CACHE_TTL = 3600.0  # segundos
+PRUNE_EVERY = 256  # gravações entre limpezas das linhas expiradas no disco
+
+
+def normalize_messages(messages: list) -> list:
+    return [[m.get("role", ""), " ".join(str(m.get("content", "")).split())] for m in messages]
+
+
+def cache_key(payload: dict, scope: Optional[Hashable] = None) -> str:
+    """Hash of what determines the model's answer: messages, model, temperature, max_tokens."""
+    material = {
+        "scope": scope,
+        "model": payload.get("model"),
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens"),
+        "messages": normalize_messages(payload.get("messages", [])),
+    }
+    raw = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """LRU+TTL cache of completion replies, optionally persisted to SQLite."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL, path: Optional[Path] = None):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.disk_hits = 0
+        if self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+
+    def get(self, payload: dict, scope: Optional[Hashable] = None) -> Optional[str]:
+        key = cache_key(payload, scope)
+        reply = self.memory.get(key)
+        if reply is not None or self._conn is None:
+            return reply
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reply, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, row[0], expires_at=row[1])
+        return row[0]
+
+    def set(self, payload: dict, reply: str, scope: Optional[Hashable] = None) -> None:
+        key = cache_key(payload, scope)
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, reply, expires_at=expires_at)
+        if self._conn is None:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, reply, expires_at) VALUES (?, ?, ?)",
+                    (key, reply, expires_at),
+                )
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self._conn is not None:
+            with self._lock:
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_cache")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {**self.memory.stats(), "persistent": self.path is not None, "disk_hits": self.disk_hits}
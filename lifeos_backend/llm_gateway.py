@@ -0,0 +1,170 @@
+"""
+LifeOS LLM Gateway
+Cliente HTTP único (por processo) para o OpenRouter.
+
+Um httpx.AsyncClient vive do startup ao shutdown da aplicação: conexões
+keep-alive ficam no pool e são reaproveitadas entre chats (sem DNS + TLS a
+cada mensagem). Usa HTTP/2 quando o pacote h2 está instalado
+(`pip install httpx[http2]`) e aquece uma conexão na subida.
+
+Cada request leva um trace do httpcore que conta conexões TCP/TLS novas, então
+stats() mostra quantas chamadas reaproveitaram uma conexão já aberta. O
+warm-up entra na conta: é a chamada que abre a conexão que o primeiro chat reusa.
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from structured_log import get_logger
+
+log = get_logger("llm")
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+WARMUP_URL = "https://openrouter.ai/api/v1/models"
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE = 20
+KEEPALIVE_EXPIRY = 60.0
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+
+
+class LLMGateway:
+    """Application-lifetime async client for chat completions."""
+
+    def __init__(self, api_key: str, url: str = OPENROUTER_URL, headers: Optional[Dict[str, str]] = None,
+                 http2: bool = HTTP2_AVAILABLE,
+                 max_connections: int = MAX_CONNECTIONS, max_keepalive: int = MAX_KEEPALIVE,
+                 keepalive_expiry: float = KEEPALIVE_EXPIRY, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT):
+        self.api_key = api_key
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json", **(headers or {})}
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self.requests = 0
+        self.warmups = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout,
+                headers=self.headers,
+            )
+        return self._client
+
+    async def start(self, warmup: bool = True) -> None:
+        """Create the client and, optionally, open a first connection in the background."""
+        _ = self.client
+        if warmup:
+            self._warmup_task = asyncio.create_task(self.warmup())
+            self._warmup_task.add_done_callback(self._warmup_done)
+
+    async def warmup(self) -> bool:
+        """Open (DNS + TLS) a pooled connection before the first chat; failures are only logged."""
+        self.warmups += 1
+        try:
+            await self.client.get(WARMUP_URL, timeout=CONNECT_TIMEOUT, extensions={"trace": self._trace})
+            log.info("Conexão aquecida", url=WARMUP_URL, http2=self.http2)
+            return True
+        except httpx.HTTPError as e:
+            log.warning("Warm-up falhou", error=repr(e))
+            return False
+
+    @staticmethod
+    def _warmup_done(task: asyncio.Task) -> None:
+        # Erros HTTP já saem no warmup(); aqui só o que escapou dele
+        error = None if task.cancelled() else task.exception()
+        if error is not None:
+            log.error("Warm-up levantou exceção", error=repr(error))
+
+    async def _trace(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    async def complete(self, payload: dict) -> httpx.Response:
+        """POST a chat completion; the caller inspects status and body."""
+        self.requests += 1
+        try:
+            return await self.client.post(self.url, json=payload, extensions={"trace": self._trace})
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    async def stream(self, payload: dict) -> AsyncIterator[str]:
+        """Chat completion with `stream: true`, yielding content deltas as they arrive.
+
+        Non-200 answers raise httpx.HTTPStatusError before anything is yielded.
+        """
+        self.requests += 1
+        try:
+            async with self.client.stream(
+                "POST", self.url, json={**payload, "stream": True}, extensions={"trace": self._trace}
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    # Linhas ": ..." são keep-alive do OpenRouter
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    async def aclose(self) -> None:
+        """Cancel a warm-up still in flight, then close the client."""
+        task, self._warmup_task = self._warmup_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass  # uma exceção do warm-up já foi logada pelo _warmup_done
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        calls = self.requests + self.warmups
+        reused = max(calls - self.connections_opened, 0)
+        return {
+            "http2": self.http2,
+            "requests": self.requests,
+            "warmups": self.warmups,
+            "errors": self.errors,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "reused": reused,
+            "reuse_rate": round(reused / calls, 4) if calls else 0.0,
+        }
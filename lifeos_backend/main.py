@@ -1,21 +1,69 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, ConfigDict
+import asyncio
 import httpx
 import os
-import json
 from pathlib import Path
 from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Import do system prompt definitivo
 import sys
 sys.path.insert(0, str(Path(__file__).parent))
-from system_prompt import LIFEOS_SYSTEM_PROMPT
+from prompt_templates import lifeos_system_message, next_revision, prompt_blocks
+from storage import Repository
+from llm_gateway import LLMGateway
+from llm_cache import LLMResponseCache
+from intent_router import Intent, route_message, route_reply
+from br_parser import parse_values
+from sse import SSE_HEADERS, sse_event
+from context_budget import ContextBudgeter, llm_summarizer
+from conversation_store import Conversation, ConversationStore
+import structured_log
+from structured_log import RequestIdMiddleware, get_logger
 
 load_dotenv()
+structured_log.configure()  # LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE
+log = get_logger("chat")
+action_log = get_logger("action")
+
+CHAT_MODEL = "openai/gpt-4o-mini"
+CONTEXT_BUDGET = int(os.getenv("CONTEXT_BUDGET", "1500"))  # tokens de histórico por prompt
+DEFAULT_USER = "default"  # request sem user_id: a memória única de antes
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Um gateway (pool de conexões keep-alive com o OpenRouter) para toda a vida do app
+    api_key = os.getenv("OPENROUTER_API_KEY", "")
+    app.state.llm_gateway = LLMGateway(
+        api_key,
+        headers={"HTTP-Referer": "http://localhost:5173", "X-Title": "LifeOS"},
+    )
+    await app.state.llm_gateway.start(warmup=bool(api_key))
+    # Histórico dentro do orçamento; o que sai da janela vira resumo rolante (via IA, se houver chave)
+    app.state.context_budgeter = ContextBudgeter(
+        CONTEXT_BUDGET, summarize=llm_summarizer(app.state.llm_gateway, CHAT_MODEL) if api_key else None
+    )
+    get_logger("startup").info("Backend LifeOS iniciado", cors="http://localhost:5173",
+                               chat="http://127.0.0.1:8000/chat")
+    yield
+    conversations.close()
+    await app.state.context_budgeter.aclose()
+    await app.state.llm_gateway.aclose()
+
+
+def get_llm_gateway(request: Request) -> LLMGateway:
+    return request.app.state.llm_gateway
+
+
+def get_context_budgeter(request: Request) -> ContextBudgeter:
+    return request.app.state.context_budgeter
 
-app = FastAPI(title="LifeOS Backend")
+
+app = FastAPI(title="LifeOS Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,22 +74,29 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=600,
 )
+app.add_middleware(RequestIdMiddleware)
 
+DB_FILE = Path("lifeos_backend.db")
+MAX_RECENT_MESSAGES = 40  # guardadas; o orçamento de tokens decide quantas vão para a IA
 
-@app.on_event("startup")
-async def startup_event():
-    print("[STARTUP] BACKEND LIFEOS INICIADO COM CORS ATIVO (http://localhost:5173)")
-    print("[STARTUP] Endpoint /chat disponivel em http://127.0.0.1:8000/chat")
+# Estado do backend num único SQLite (WAL); os JSON antigos são importados na primeira execução
+repository = Repository(DB_FILE)
+repository.import_json_files()
 
-MEMORY_FILE = Path("memory.json")
-FINANCE_FILE = Path("financeiro.json")
-FINANCE_CONV_FILE = Path("financial_conversation_state.json")
-MAX_RECENT_MESSAGES = 10
+# Respostas da IA por usuário e payload (mensagens normalizadas + modelo); LLM_CACHE_DB persiste em SQLite
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+llm_cache = LLMResponseCache(
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+    path=Path(LLM_CACHE_DB) if LLM_CACHE_DB else None,
+)
 
 
 class ChatRequest(BaseModel):
     message: str
     context: Optional[dict] = None
+    # Só separa as memórias; não é autenticação: quem souber o id lê e escreve nessa conversa
+    user_id: str = Field(default=DEFAULT_USER, max_length=64, pattern=r"^[\w-]+$")
 
 
 class PendingAction(BaseModel):
@@ -62,11 +117,6 @@ class ChatResponse(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
 
-class Memory(BaseModel):
-    summary: str = ""
-    recent_messages: List[Dict[str, str]] = []
-
-
 class FinanceiroState(BaseModel):
     id: int = 1  # singleton
     faseAtual: Optional[int] = None  # 1=Parar sangria | 2=Definir total e prazo | 3=Calcular ritmo | 4=Executar | 5=Dívida zerada
@@ -77,6 +127,7 @@ class FinanceiroState(BaseModel):
     focoAtual: Optional[str] = None
     atualizadoEm: int = 0  # timestamp
     ultimaAtualizacao: int = 0
+    revision: int = 0  # carimbada a cada gravação; chave do bloco financeiro memoizado no prompt
 
 
 class FinancialConversationState(BaseModel):
@@ -94,50 +145,48 @@ class FinancialConversationState(BaseModel):
     executed: bool = False
 
 
-def load_memory() -> Memory:
-    """Load memory from file or create empty memory."""
-    if MEMORY_FILE.exists():
-        try:
-            with open(MEMORY_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return Memory(**data)
-        except Exception:
-            pass
-    return Memory()
+def memory_entity(user_id: str) -> str:
+    return "memory" if user_id == DEFAULT_USER else f"memory:{user_id}"
 
 
-def save_memory(memory: Memory) -> None:
-    """Save memory to file."""
+def load_memory(user_id: str) -> Optional[dict]:
+    """Stored conversation of a user (first access only; the store keeps it in memory after that)."""
     try:
-        with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(memory.model_dump(), f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass
+        return repository.get(memory_entity(user_id))
+    except Exception as e:
+        get_logger("memory").error("Erro ao carregar memória", user_id=user_id, error=str(e))
+        return None
+
+
+def save_memories(documents: Dict[str, dict]) -> None:
+    """Write a batch of conversations in one commit (called by the store's flush thread)."""
+    with repository.transaction():
+        for user_id, data in documents.items():
+            repository.put(memory_entity(user_id), data)
+
+
+# Memória do chat por usuário: editada em memória, gravada em lote fora do request
+conversations = ConversationStore(load_memory, save_memories, capacity=MAX_RECENT_MESSAGES)
 
 
 def load_financeiro() -> FinanceiroState:
-    """Load financeiro state from file; initialize empty if missing."""
-    if FINANCE_FILE.exists():
-        try:
-            with open(FINANCE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return FinanceiroState(**data)
-        except Exception:
-            pass
-    # initialize empty
-    state = FinanceiroState(ultimaAtualizacao=int(__import__("time").time()))
+    """Load financeiro state from the repository; initialize empty if missing."""
     try:
-        with open(FINANCE_FILE, "w", encoding="utf-8") as f:
-            json.dump(state.model_dump(), f, ensure_ascii=False, indent=2)
+        data = repository.get("financeiro")
+        if data is not None:
+            return FinanceiroState(**data)
     except Exception:
         pass
+    # initialize empty
+    state = FinanceiroState(ultimaAtualizacao=int(__import__("time").time()))
+    save_financeiro(state)
     return state
 
 
 def save_financeiro(state: FinanceiroState) -> None:
+    state.revision = next_revision()
     try:
-        with open(FINANCE_FILE, "w", encoding="utf-8") as f:
-            json.dump(state.model_dump(), f, ensure_ascii=False, indent=2)
+        repository.put("financeiro", state.model_dump())
     except Exception:
         pass
 
@@ -165,22 +214,20 @@ def delete_financial_debt(amount: Optional[float] = None) -> bool:
 
 
 def load_conversation_state() -> FinancialConversationState:
-    """Load financial conversation state from file."""
-    if FINANCE_CONV_FILE.exists():
-        try:
-            with open(FINANCE_CONV_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return FinancialConversationState(**data)
-        except Exception:
-            pass
+    """Load financial conversation state from the repository."""
+    try:
+        data = repository.get("financial_conversation_state")
+        if data is not None:
+            return FinancialConversationState(**data)
+    except Exception:
+        pass
     return FinancialConversationState()
 
 
 def save_conversation_state(state: FinancialConversationState):
     """Save financial conversation state."""
     try:
-        with open(FINANCE_CONV_FILE, "w", encoding="utf-8") as f:
-            json.dump(state.model_dump(), f, ensure_ascii=False, indent=2)
+        repository.put("financial_conversation_state", state.model_dump())
     except Exception:
         pass
 
@@ -209,12 +256,10 @@ def determine_financial_phase(state: FinanceiroState, user_message: str) -> int:
     """Determine which phase the user is in based on state and message."""
     import re
     
-    user_lower = user_message.lower()
+    intents = route_message(user_message)
     
     # Detect financial intent
-    has_financial_intent = any(word in user_lower for word in ["dívida", "divida", "financeiro", "devo", "pagar", "débito", "cartão", "nubank", "credores"])
-    
-    if not has_financial_intent:
+    if Intent.FINANCE not in intents:
         return state.faseAtual or 0
     
     # If no phase yet, start at phase 1
@@ -223,8 +268,7 @@ def determine_financial_phase(state: FinanceiroState, user_message: str) -> int:
     
     # If in phase 1, check if we have urgency info (mention of delay, interest, etc)
     if state.faseAtual == 1:
-        has_urgency_info = any(word in user_lower for word in ["atrasado", "atraso", "juros", "vence", "urgente", "dias"])
-        if has_urgency_info and state.totalDivida:
+        if Intent.URGENCY in intents and state.totalDivida:
             return 2  # Move to phase 2
         return 1
     
@@ -249,23 +293,15 @@ def orchestrate_financeiro(state: FinanceiroState, user_message: str) -> tuple[F
     Orchestrate financial strategy with persistent conversation state.
     Returns: (updated_state, response_text_for_chat)
     """
-    import re
-    
-    user_lower = user_message.lower()
+    intents = route_message(user_message)
+    values = parse_values(user_message)
     
     # Load conversation state
     conv_state = load_conversation_state()
     
     # Deletion intent handling: "apagar/remover/excluir dívida [de X]"
-    delete_intent = re.search(r"(apagar|remover|excluir).+d[ií]vida(?:\s+de\s*r?\$?\s*(\d+(?:[.,]\d+)?))?", user_lower)
-    if delete_intent and not conv_state.collectedData.get("awaitingConfirmation"):
-        amt = None
-        if delete_intent.group(2):
-            amt_str = delete_intent.group(2).replace(',', '.')
-            try:
-                amt = float(amt_str)
-            except Exception:
-                amt = None
+    if Intent.DELETE in intents and Intent.DEBT in intents and not conv_state.collectedData.get("awaitingConfirmation"):
+        amt = values.first_amount()
         # Store pending deletion and ask confirmation
         conv_state.collectedData["pendingDeleteAmount"] = amt
         conv_state.collectedData["awaitingConfirmation"] = True
@@ -277,7 +313,7 @@ def orchestrate_financeiro(state: FinanceiroState, user_message: str) -> tuple[F
     
     # Confirmation handling
     if conv_state.collectedData.get("awaitingConfirmation"):
-        if any(word in user_lower for word in ["confirmo", "confirmar", "sim", "pode apagar", "ok", "pode remover", "pode excluir"]):
+        if Intent.CONFIRM in intents:
             # Delete unconditionally if a debt exists
             success = delete_financial_debt(conv_state.collectedData.get("pendingDeleteAmount"))
             # Clear pending flags
@@ -297,9 +333,7 @@ def orchestrate_financeiro(state: FinanceiroState, user_message: str) -> tuple[F
                 return new_state, "Não consegui apagar a dívida. Ela continua registrada."
     
     # Detect if this is a financial reading request
-    is_read_request = any(word in user_lower for word in ["como está", "o que tem", "mostre", "status", "meu financeiro"])
-    
-    if is_read_request:
+    if Intent.READ_FINANCE in intents:
         # Read financial state
         if state.totalDivida or state.faseAtual:
             parts = []
@@ -319,9 +353,7 @@ def orchestrate_financeiro(state: FinanceiroState, user_message: str) -> tuple[F
             return state, "Seu financeiro ainda não tem dados. Quer começar a organizar?"
     
     # Detect if this is a financial conversation
-    has_financial_intent = any(word in user_lower for word in ["dívida", "divida", "financeiro", "devo", "pagar", "débito", "cartão", "nubank", "credores"])
-    
-    if not has_financial_intent:
+    if Intent.FINANCE not in intents:
         return state, None  # Not a financial topic
     
     # Load conversation state
@@ -338,33 +370,23 @@ def orchestrate_financeiro(state: FinanceiroState, user_message: str) -> tuple[F
         save_conversation_state(conv_state)
     
     # Extract data from message
-    amount_match = re.search(r'r?\$?\s*(\d+(?:[.,]\d+)?)', user_lower)
-    if amount_match and "totalDivida" not in conv_state.questionsAsked:
-        amount_str = amount_match.group(1).replace(',', '.')
-        conv_state.collectedData["totalDivida"] = float(amount_str)
-        state.totalDivida = float(amount_str)
+    amount = values.first_amount()
+    if amount is not None and "totalDivida" not in conv_state.questionsAsked:
+        conv_state.collectedData["totalDivida"] = amount
+        state.totalDivida = amount
     
     # Extract urgency
-    if any(word in user_lower for word in ["atrasado", "atraso", "juros", "urgente"]):
+    if Intent.OVERDUE in intents:
         if "urgencia" not in conv_state.questionsAsked:
             conv_state.collectedData["urgencia"] = "atrasada"
-    elif any(word in user_lower for word in ["vence", "próximo", "breve"]):
+    elif Intent.DUE_SOON in intents:
         if "urgencia" not in conv_state.questionsAsked:
             conv_state.collectedData["urgencia"] = "vence_em_breve"
     
     # Extract deadline
-    days_match = re.search(r'(\d+)\s*(dias?|semanas?|meses?)', user_lower)
-    if days_match and "prazo" not in conv_state.questionsAsked:
-        num = int(days_match.group(1))
-        unit = days_match.group(2).lower()
-        
-        if 'dia' in unit:
-            conv_state.collectedData["prazo"] = max(1, num // 30)
-        elif 'semana' in unit:
-            conv_state.collectedData["prazo"] = max(1, (num * 7) // 30)
-        else:
-            conv_state.collectedData["prazo"] = num
-        
+    if values.durations and "prazo" not in conv_state.questionsAsked:
+        # Dias/semanas viram meses inteiros (mínimo 1)
+        conv_state.collectedData["prazo"] = values.durations[0].months
         state.prazoAlvoMeses = conv_state.collectedData["prazo"]
     
     # Check if data is complete
@@ -413,78 +435,37 @@ def orchestrate_financeiro(state: FinanceiroState, user_message: str) -> tuple[F
     return state, response
 
 
-def build_context_messages(memory: Memory, user_message: str, context: Optional[dict], financeiro: FinanceiroState) -> List[Dict[str, str]]:
-    """Build messages array with full context including financial state."""
-    messages = []
-    
-    # Core LifeOS system prompt - definição raiz do sistema
-    system_core = LIFEOS_SYSTEM_PROMPT
-    
-    # Compose system context including app state
-    system_parts: List[str] = [system_core]
-    
-    if memory.summary:
-        system_parts.append(f"Contexto da conversa: {memory.summary}")
-
-    # Financial context
-    if financeiro.faseAtual or financeiro.totalDivida or financeiro.focoAtual:
-        fin_parts = []
-        if financeiro.faseAtual:
-            fin_parts.append(f"Fase: {financeiro.faseAtual}")
-        if financeiro.totalDivida is not None:
-            fin_parts.append(f"Dívida total: R$ {financeiro.totalDivida:.2f}")
-        if financeiro.prazoAlvoMeses is not None:
-            fin_parts.append(f"Prazo: {financeiro.prazoAlvoMeses} meses")
-        if financeiro.ritmoMensal is not None:
-            fin_parts.append(f"Ritmo mensal: R$ {financeiro.ritmoMensal:.2f}")
-        if financeiro.ritmoDiario is not None:
-            fin_parts.append(f"Ritmo diário: R$ {financeiro.ritmoDiario:.2f}")
-        if financeiro.focoAtual:
-            fin_parts.append(f"Foco: {financeiro.focoAtual}")
-        system_parts.append(f"ESTRATÉGIA FINANCEIRA ATIVA: {'; '.join(fin_parts)}")
-    else:
-        system_parts.append("FINANCEIRO: Nenhuma estratégia definida ainda.")
-
-    # Tasks, routines, calendar context
-    if context:
-        rotina_list = context.get("routines", [])
-        tasks = context.get("tasks", [])
-        events = context.get("calendar", [])
-
-        rotina_text = (
-            "Rotina: vazia" if not rotina_list else f"Rotina: {', '.join([str(x) for x in rotina_list])}"
-        )
-        task_titles = [t.get("title") for t in tasks if isinstance(t, dict)]
-        tasks_text = (
-            f"Tarefas: {', '.join([str(x) for x in task_titles])}" if task_titles else "Tarefas: nenhuma"
-        )
-        event_titles = [e.get("title") for e in events if isinstance(e, dict)]
-        cal_text = (
-            f"Calendário: {', '.join([str(x) for x in event_titles])}" if event_titles else "Calendário: sem eventos"
-        )
+def build_context_messages(memory: Conversation, user_message: str, context: Optional[dict], financeiro: FinanceiroState,
+                           budgeter: Optional[ContextBudgeter] = None, user_id: str = DEFAULT_USER) -> List[Dict[str, str]]:
+    """Build messages array with full context including financial state.
 
-        system_parts.append(f"{rotina_text} | {tasks_text} | {cal_text}")
-
-    if system_parts:
-        messages.append({"role": "system", "content": "\n\n".join(system_parts)})
+    With a budgeter, history is the newest messages that fit its token budget
+    plus the rolling summary of the older ones; without one, the last 6.
+    """
+    recent = memory.recent_messages[-6:]
+    history_summary = ""
+    if budgeter is not None:
+        first_seq = memory.message_count - len(memory.messages)
+        history_summary, recent = budgeter.select(
+            user_id, [(first_seq + i, msg) for i, msg in enumerate(memory.messages)]
+        )
+    # Prompt raiz e bloco financeiro (memoizado na revisão) primeiro: o prefixo
+    # estável entre turnos pode ser reaproveitado pelo cache de prompt do provedor
+    messages = [{"role": "system", "content": lifeos_system_message(financeiro, context, memory.summary, history_summary)}]
     
-    for msg in memory.recent_messages[-6:]:
-        messages.append(msg)
+    messages.extend(recent)
     
     messages.append({"role": "user", "content": user_message})
     
     return messages
 
 
-def update_memory(memory: Memory, user_message: str, ai_reply: str) -> None:
-    """Update memory with new interaction."""
-    memory.recent_messages.append({"role": "user", "content": user_message})
-    memory.recent_messages.append({"role": "assistant", "content": ai_reply})
+def update_memory(memory: Conversation, user_message: str, ai_reply: str) -> None:
+    """Update memory with new interaction (the ring drops the oldest messages past MAX_RECENT_MESSAGES)."""
+    memory.append("user", user_message)
+    memory.append("assistant", ai_reply)
     
-    if len(memory.recent_messages) > MAX_RECENT_MESSAGES:
-        memory.recent_messages = memory.recent_messages[-MAX_RECENT_MESSAGES:]
-    
-    if len(memory.recent_messages) >= 4:
+    if len(memory.messages) >= 4:
         facts = []
         if "lifeos" in user_message.lower() or "lifeos" in ai_reply.lower():
             facts.append("trabalhando no projeto LifeOS")
@@ -504,25 +485,20 @@ def update_memory(memory: Memory, user_message: str, ai_reply: str) -> None:
 
 def parse_action_from_reply(ai_reply: str, user_message: str, financeiro: FinanceiroState) -> Optional[PendingAction]:
     """Parse AI reply and user message to detect and structure action proposals."""
-    import re
-    
-    user_lower = user_message.lower()
-    reply_lower = ai_reply.lower()
+    intents = route_message(user_message)
+    reply_intents = route_reply(ai_reply)
     
-    print(f"[PARSE_ACTION] user_msg='{user_message[:50]}' reply='{ai_reply[:100]}'")
+    action_log.debug("Analisando resposta", user_message=user_message[:50], reply=ai_reply[:100])
     
     # Financial actions
-    if any(word in user_lower for word in ["dívida", "divida", "financeiro", "devo", "pagar"]) or \
-       any(word in reply_lower for word in ["financeiro", "dívida", "registrar no financeiro"]):
-        print("[PARSE_ACTION] Detected financial intent")
+    if Intent.FINANCE in intents or Intent.FINANCE in reply_intents:
+        action_log.debug("Intenção financeira")
         
         # Try to extract amount from user message first, then from reply
-        for text in [user_lower, reply_lower]:
-            amount_match = re.search(r'r?\$?\s*(\d+(?:[.,]\d+)?)', text)
-            if amount_match:
-                amount_str = amount_match.group(1).replace(',', '.')
-                amount = float(amount_str)
-                print(f"[PARSE_ACTION] Extracted amount: {amount}")
+        for text in [user_message, ai_reply]:
+            amount = parse_values(text).first_amount()
+            if amount is not None:
+                action_log.debug("Valor extraído", amount=amount)
                 
                 description = user_message[:100]
                 
@@ -534,9 +510,8 @@ def parse_action_from_reply(ai_reply: str, user_message: str, financeiro: Financ
                 )
     
     # Task actions
-    if any(word in user_lower for word in ["tarefa", "fazer", "preciso", "tenho que"]) or \
-       "tarefa" in reply_lower:
-        print("[PARSE_ACTION] Detected task intent")
+    if Intent.TASK in intents or Intent.TASK in reply_intents:
+        action_log.debug("Intenção de tarefa")
         return PendingAction(
             type="tarefa",
             operation="create",
@@ -545,9 +520,8 @@ def parse_action_from_reply(ai_reply: str, user_message: str, financeiro: Financ
         )
     
     # Routine actions
-    if any(word in user_lower for word in ["rotina", "acordar", "dormir", "sempre", "todo dia"]) or \
-       "rotina" in reply_lower:
-        print("[PARSE_ACTION] Detected routine intent")
+    if Intent.ROUTINE in intents or Intent.ROUTINE in reply_intents:
+        action_log.debug("Intenção de rotina")
         return PendingAction(
             type="rotina",
             operation="create",
@@ -556,9 +530,8 @@ def parse_action_from_reply(ai_reply: str, user_message: str, financeiro: Financ
         )
     
     # Calendar actions
-    if any(word in user_lower for word in ["reunião", "reuniao", "evento", "compromisso", "amanhã", "hoje"]) or \
-       "calendário" in reply_lower or "calendario" in reply_lower:
-        print("[PARSE_ACTION] Detected calendar intent")
+    if Intent.CALENDAR in intents or Intent.CALENDAR in reply_intents:
+        action_log.debug("Intenção de calendário")
         return PendingAction(
             type="calendario",
             operation="create",
@@ -566,7 +539,7 @@ def parse_action_from_reply(ai_reply: str, user_message: str, financeiro: Financ
             description=f"Criar evento: {user_message[:50]}"
         )
     
-    print("[PARSE_ACTION] No action detected")
+    action_log.debug("Nenhuma ação detectada")
     return None
 
 
@@ -575,6 +548,15 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics(gateway: LLMGateway = Depends(get_llm_gateway), budgeter: ContextBudgeter = Depends(get_context_budgeter)):
+    """Internal counters (repository commits, LLM connection reuse, etc.)."""
+    return {"repository": repository.stats(), "llm_gateway": gateway.stats(), "llm_cache": llm_cache.stats(),
+            "context_budget": budgeter.stats(), "prompt_blocks": prompt_blocks.stats(),
+            "conversations": conversations.stats(),
+            "logging": structured_log.stats()}
+
+
 @app.get("/financeiro", response_model=FinanceiroState)
 def get_financeiro_state():
     """Return current financeiro singleton state (read-only)."""
@@ -590,98 +572,158 @@ def get_financeiro_state():
     )
 
 
+@repository.transaction()
+def orchestrate_turn(message: str) -> tuple[FinanceiroState, str]:
+    """Load the financeiro and run the orchestrator for one message (one commit).
+
+    Called with asyncio.to_thread: the SQLite reads, writes and the commit stay off
+    the event loop, and the commit happens before the AI call, so an AI failure
+    doesn't undo the turn or hold the write open.
+    """
+    return orchestrate_financeiro(load_financeiro(), message)
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response, gateway: LLMGateway = Depends(get_llm_gateway),
+               budgeter: ContextBudgeter = Depends(get_context_budgeter)):
     """Pure AI chat endpoint - intelligent orchestration without showing JSON to user."""
-    print("[CHAT] User message:", request.message)
+    log.info("Mensagem recebida", user_id=request.user_id, chars=len(request.message))
+    log.debug("Conteúdo da mensagem", message=request.message)
     
-    # Load current state
-    financeiro_state = load_financeiro()
-    
-    # Orchestrate financial conversation (if applicable)
-    orchestrated_state, fin_response = orchestrate_financeiro(financeiro_state, request.message)
+    # Estado do turno num commit só, numa thread e antes da chamada à IA (ver orchestrate_turn).
+    # A memória do chat fica no ConversationStore e vai para o disco em lote, fora do request
+    orchestrated_state, fin_response = await asyncio.to_thread(orchestrate_turn, request.message)
     
     # If financial orchestration provided a response, use it directly
     if fin_response:
-        print(f"[ORCHESTRATOR] Using financial response: {fin_response}")
-        response = ChatResponse(reply=fin_response, action=None)
-        update_memory(load_memory(), request.message, fin_response)
-        save_memory(load_memory())
-        return response.model_dump()
+        log.info("Resposta do orquestrador financeiro", reply=fin_response)
+        chat_response = ChatResponse(reply=fin_response, action=None)
+        with conversations.edit(request.user_id) as memory:
+            update_memory(memory, request.message, fin_response)
+        return chat_response.model_dump()
     
     # Otherwise, call AI for general conversation
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        print("[ERROR] OPENROUTER_API_KEY not configured in .env")
+    if not gateway.api_key:
+        log.error("OPENROUTER_API_KEY não configurada no .env")
         raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY not configured in .env")
 
-    memory = load_memory()
-
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:5173",
-        "X-Title": "LifeOS",
-    }
+    memory = conversations.view(request.user_id)
 
-    messages = build_context_messages(memory, request.message, request.context, orchestrated_state)
-    payload = {"model": "openai/gpt-4o-mini", "messages": messages}
+    messages = build_context_messages(memory, request.message, request.context, orchestrated_state, budgeter,
+                                      request.user_id)
+    payload = {"model": CHAT_MODEL, "messages": messages}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(url, json=payload, headers=headers, timeout=30.0)
+    try:
+        reply = await asyncio.to_thread(llm_cache.get, payload, request.user_id)
+        response.headers["X-LLM-Cache"] = "hit" if reply is not None else "miss"
+        if reply is None:
+            resp = await gateway.complete(payload)
             resp.raise_for_status()
             data = resp.json()
             reply = data.get("choices", [{}])[0].get("message", {}).get("content", "")
             if not reply:
                 raise HTTPException(status_code=500, detail="Empty response from AI")
-            
+            await asyncio.to_thread(llm_cache.set, payload, reply, request.user_id)
+    
+        # Edita a conversa viva (não a cópia do prompt): turnos simultâneos não se sobrescrevem
+        with conversations.edit(request.user_id) as memory:
             update_memory(memory, request.message, reply)
-            save_memory(memory)
-            
-            # For now, never show actions to user (all orchestrated via backend)
-            response = ChatResponse(reply=reply.strip(), action=None)
-            print(f"[RESPONSE] Returning: action={response.action}")
-            result = response.model_dump()
-            print(f"[RESPONSE] Serialized: {result}")
-            return result
+    
+        # For now, never show actions to user (all orchestrated via backend)
+        chat_response = ChatResponse(reply=reply.strip(), action=None)
+        result = chat_response.model_dump()
+        log.debug("Resposta", result=result)
+        return result
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"OpenRouter error: {e.response.text}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, gateway: LLMGateway = Depends(get_llm_gateway),
+                      budgeter: ContextBudgeter = Depends(get_context_budgeter)):
+    """Streaming (SSE) variant of /chat: `delta` events, then `done` with the ChatResponse.
+
+    Memory is updated once the full reply has arrived.
+    """
+    log.info("Mensagem recebida (stream)", user_id=request.user_id, chars=len(request.message))
+    log.debug("Conteúdo da mensagem", message=request.message)
+    orchestrated_state, fin_response = await asyncio.to_thread(orchestrate_turn, request.message)
+
+    if fin_response:
+        log.info("Resposta do orquestrador financeiro", reply=fin_response)
+        with conversations.edit(request.user_id) as memory:
+            update_memory(memory, request.message, fin_response)
+        done = sse_event(ChatResponse(reply=fin_response, action=None).model_dump(), "done")
+        return StreamingResponse(iter([done]), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    if not gateway.api_key:
+        log.error("OPENROUTER_API_KEY não configurada no .env")
+        raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY not configured in .env")
+
+    messages = build_context_messages(conversations.view(request.user_id), request.message, request.context,
+                                      orchestrated_state, budgeter, request.user_id)
+    payload = {"model": CHAT_MODEL, "messages": messages}
+    cached_reply = await asyncio.to_thread(llm_cache.get, payload, request.user_id)
+
+    async def events():
+        parts = []
+        try:
+            if cached_reply is not None:
+                parts.append(cached_reply)
+                yield sse_event({"delta": cached_reply})
+            else:
+                async for delta in gateway.stream(payload):
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+            reply = "".join(parts).strip()
+            if not reply:
+                yield sse_event({"detail": "Empty response from AI"}, "error")
+                return
+            if cached_reply is None:
+                await asyncio.to_thread(llm_cache.set, payload, "".join(parts), request.user_id)
+            with conversations.edit(request.user_id) as memory:
+                update_memory(memory, request.message, reply)
+            yield sse_event(ChatResponse(reply=reply, action=None).model_dump(), "done")
         except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail=f"OpenRouter error: {e.response.text}")
+            yield sse_event({"detail": f"OpenRouter error: {e.response.text}"}, "error")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            yield sse_event({"detail": str(e)}, "error")
+
+    headers = {**SSE_HEADERS, "X-LLM-Cache": "hit" if cached_reply is not None else "miss"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
 
 
 @app.post("/action/confirm")
-async def confirm_action(action: PendingAction):
-    """Execute a confirmed action from user."""
-    print(f"[ACTION CONFIRMED] type={action.type} operation={action.operation} payload={action.payload}")
+@repository.transaction()
+def confirm_action(action: PendingAction):
+    """Execute a confirmed action from user (one commit)."""
+    action_log.info("Ação confirmada", type=action.type, operation=action.operation, payload=action.payload)
     
     try:
         if action.type == "financeiro":
             state = load_financeiro()
-            print(f"[DEBUG] Loaded state: totalDivida={state.totalDivida}")
-            
+            action_log.debug("Estado carregado", totalDivida=state.totalDivida)
+        
             if action.operation == "update":
                 # Update financial data
                 if "totalDivida" in action.payload:
                     state.totalDivida = float(action.payload["totalDivida"])
-                    print(f"[DEBUG] Updated totalDivida to {state.totalDivida}")
+                    action_log.debug("totalDivida atualizado", totalDivida=state.totalDivida)
                 if "prazoAlvoMeses" in action.payload:
                     state.prazoAlvoMeses = action.payload["prazoAlvoMeses"]
                 if "faseAtual" in action.payload:
                     state.faseAtual = action.payload["faseAtual"]
                 if "focoAtual" in action.payload:
                     state.focoAtual = action.payload["focoAtual"]
-                
+            
                 state.ultimaAtualizacao = int(__import__("time").time())
                 save_financeiro(state)
-                print(f"[DEBUG] Saved financeiro state to file")
-                
-                # Reload to verify
-                state_verify = load_financeiro()
-                print(f"[DEBUG] Verification - totalDivida={state_verify.totalDivida}")
-                
+                # Releitura de conferência só quando o debug está ligado
+                if action_log.enabled():
+                    action_log.debug("Financeiro salvo", totalDivida=load_financeiro().totalDivida)
+            
                 return {"status": "success", "message": "Financeiro atualizado."}
             elif action.operation == "delete":
                 # Delete a debt by amount
@@ -701,7 +743,7 @@ async def confirm_action(action: PendingAction):
                     return {"status": "success", "message": "Dívida removida."}
                 else:
                     return {"status": "error", "message": "Falha ao remover a dívida."}
-        
+    
         elif action.type == "tarefa":
             tasks = load_tasks()
             if action.operation == "create":
@@ -719,29 +761,26 @@ async def confirm_action(action: PendingAction):
                 tasks = [t for t in tasks if t.id != task_id]
                 save_tasks(tasks)
                 return {"status": "success", "message": "Tarefa removida."}
-        
+    
         elif action.type == "rotina":
             if action.operation == "create":
                 # Save to routines via db (IndexedDB on frontend will handle)
                 # For now, just acknowledge - frontend will handle via context
                 return {"status": "success", "message": "Rotina registrada."}
-        
+    
         elif action.type == "calendario":
             if action.operation == "create":
                 # Save to calendar events
                 return {"status": "success", "message": "Evento criado."}
-        
+    
         return {"status": "error", "message": "Tipo de ação não suportado"}
     
     except Exception as e:
-        print(f"[ERROR] {str(e)}")
+        action_log.exception("Erro ao executar ação", type=action.type)
         raise HTTPException(status_code=500, detail=f"Erro ao executar ação: {str(e)}")
 
 
 # ===== Action Execution: Focus on essentials =====
-TASKS_FILE = Path("tasks.json")
-
-
 class Task(BaseModel):
     id: int
     title: str
@@ -751,25 +790,17 @@ class Task(BaseModel):
 
 
 def load_tasks() -> List[Task]:
-    if TASKS_FILE.exists():
-        try:
-            with open(TASKS_FILE, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-                # Accept either list of dicts or wrapped object
-                if isinstance(raw, dict) and "tasks" in raw:
-                    raw_list = raw.get("tasks", [])
-                else:
-                    raw_list = raw
-                return [Task(**t) for t in raw_list if isinstance(t, dict)]
-        except Exception:
-            pass
+    try:
+        raw_list = repository.get("tasks") or []
+        return [Task(**t) for t in raw_list if isinstance(t, dict)]
+    except Exception:
+        pass
     return []
 
 
 def save_tasks(tasks: List[Task]) -> None:
     try:
-        with open(TASKS_FILE, "w", encoding="utf-8") as f:
-            json.dump([t.model_dump() for t in tasks], f, ensure_ascii=False, indent=2)
+        repository.put("tasks", [t.model_dump() for t in tasks])
     except Exception:
         pass
 
@@ -794,6 +825,7 @@ class ActionRequest(BaseModel):
 
 
 @app.post("/action")
+@repository.transaction()
 def execute_action(req: ActionRequest):
     if req.type != "FOCUS_ESSENTIALS":
         raise HTTPException(status_code=400, detail="Unsupported action type")
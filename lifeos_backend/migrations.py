@@ -0,0 +1,85 @@
+"""
+LifeOS Migrations
+Migrações versionadas de schema SQLite e auditoria de planos de consulta.
+
+Cada migração é (versão, descrição, [statements]) e roda uma única vez, em
+ordem, numa transação própria; a versão aplicada fica na tabela
+schema_version. Na subida do servidor, audit_queries roda EXPLAIN QUERY PLAN
+nas consultas do caminho quente e aponta as que varrem a tabela inteira ou
+precisam ordenar o resultado num B-tree temporário.
+"""
+
+import sqlite3
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from structured_log import get_logger
+
+log = get_logger("db")
+
+Migration = Tuple[int, str, Sequence[str]]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at INTEGER NOT NULL
+        )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> List[int]:
+    """Apply pending migrations in version order; returns the versions applied now."""
+    versions = [m[0] for m in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError(f"Versões de migração fora de ordem ou repetidas: {versions}")
+    if conn.in_transaction:
+        conn.commit()
+    applied = []
+    for version, description, statements in migrations:
+        # BEGIN IMMEDIATE: dois processos subindo juntos não aplicam a mesma versão
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, int(time.time())),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+        log.info("Migração aplicada", version=version, description=description)
+    return applied
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> List[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def is_full_scan(detail: str) -> bool:
+    """`SCAN` walks a whole table or index (even `USING COVERING INDEX`); `SEARCH` is a keyed lookup."""
+    return detail.startswith("SCAN ") and "CONSTANT ROW" not in detail
+
+
+def audit_queries(conn: sqlite3.Connection, queries: Dict[str, Tuple[str, Sequence]]) -> Dict[str, List[str]]:
+    """EXPLAIN QUERY PLAN each named query; returns {name: [offending steps]} for full scans and temp sorts."""
+    flagged = {}
+    for name, (sql, params) in queries.items():
+        problems = [
+            detail for detail in query_plan(conn, sql, params)
+            if is_full_scan(detail) or "TEMP B-TREE" in detail
+        ]
+        if problems:
+            flagged[name] = problems
+            log.warning("Consulta sem índice adequado", query=name, plan=problems)
+    return flagged
@@ -0,0 +1,141 @@
+"""
+LifeOS Password Hasher
+Pool próprio e limitado para bcrypt, fora do threadpool compartilhado.
+
+bcrypt libera o GIL enquanto calcula, então um pool de threads dedicado roda
+hashes em paralelo sem ocupar as threads que atendem os outros endpoints sync.
+Quando há mais de max_pending trabalhos (rodando + na fila), novos pedidos
+são recusados com PasswordHasherBusy, que os endpoints devolvem como 503.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = 12
+HASH_WORKERS = 2
+MAX_PENDING = 32
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing queue is full; the caller should answer 503 and let the client retry."""
+
+
+class _Timing:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def add(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.last_ms = elapsed_ms
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "last_ms": round(self.last_ms, 3),
+        }
+
+
+def hash_cost(password_hash: str) -> int:
+    """Work factor of a `$2b$12$...` hash (0 if it can't be read)."""
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    """bcrypt hash/verify on a dedicated, bounded thread pool, awaited from async endpoints."""
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = HASH_WORKERS, max_pending: int = MAX_PENDING):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._timings = {"hash": _Timing(), "verify": _Timing()}
+
+    def _run(self, op: str, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._timings[op].add(elapsed_ms)
+
+    def _done(self, _future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, op: str, fn, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy(f"{self._pending} hashes pendentes (limite {self.max_pending})")
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._run, op, fn, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _hashpw(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds)).decode("utf-8")
+
+    @staticmethod
+    def _checkpw(password: str, password_hash: str) -> bool:
+        try:
+            return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+        except ValueError:
+            # Hash corrompido/formato desconhecido conta como senha errada
+            return False
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit("hash", self._hashpw, password))
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await asyncio.wrap_future(self._submit("verify", self._checkpw, password, password_hash))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True when the hash was made with a different work factor than the configured one."""
+        return hash_cost(password_hash) != self.rounds
+
+    async def rehash(self, password: str) -> str:
+        """New hash at the current cost, for upgrading a stored hash after a successful login."""
+        new_hash = await self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return new_hash
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "hash": self._timings["hash"].as_dict(),
+                "verify": self._timings["verify"].as_dict(),
+            }
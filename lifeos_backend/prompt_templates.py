@@ -0,0 +1,153 @@
+"""
+LifeOS Prompt Templates
+Prompts montados a partir de templates compilados uma vez, estático primeiro.
+
+Cada PromptTemplate é analisado na importação (campos e o texto estático antes
+do primeiro campo); render() é um format_map. Mensagens de sistema seguem uma
+ordem fixa: primeiro o que nunca muda (prompt raiz, instruções), depois os
+blocos dinâmicos, do que muda menos para o que muda mais. O prefixo estático
+sai idêntico em todas as chamadas, e o cache de prompt do provedor pode
+reaproveitá-lo.
+
+Blocos dinâmicos são memoizados em BlockCache por (bloco, versão). A versão é
+uma revisão carimbada no estado a cada gravação (next_revision): viaja junto
+com os dados, então um rollback ou um restart nunca serve um bloco de outro
+estado.
+"""
+
+import itertools
+import string
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from system_prompt import LIFEOS_SYSTEM_PROMPT
+
+BLOCK_CACHE_SIZE = 4096
+
+# Começa no relógio: revisões de um processo novo nunca repetem as já gravadas
+_revisions = itertools.count(time.time_ns())
+
+
+def next_revision() -> int:
+    """Unique, increasing stamp for a saved state; dynamic blocks are keyed on it."""
+    return next(_revisions)
+
+
+class PromptTemplate:
+    """A prompt with {fields}, parsed once: field names and the static text before the first field."""
+
+    def __init__(self, text: str):
+        self.text = text
+        parsed = list(string.Formatter().parse(text))
+        self.fields = frozenset(name for _, name, _, _ in parsed if name)
+        self.static_prefix = parsed[0][0] if parsed and parsed[0][1] is not None else text
+        self._format_map = text.format_map
+
+    def render(self, **values) -> str:
+        return self._format_map(values)
+
+
+class BlockCache:
+    """Rendered dynamic prompt blocks memoized on (block name, state version).
+
+    A hit is one dict lookup, without a lock (dict reads are atomic under the
+    GIL): the blocks are short, and a TTLCache hit (lock + LRU reordering) cost
+    about as much as rebuilding them. Only a miss takes the lock, and past
+    maxsize the oldest block goes.
+    """
+
+    def __init__(self, maxsize: int = BLOCK_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._blocks: Dict[Tuple[str, Hashable], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, name: str, version: Hashable, build: Callable[[], str]) -> str:
+        block = self._blocks.get((name, version))
+        if block is not None:
+            self.hits += 1
+            return block
+        block = build()
+        with self._lock:
+            self.misses += 1
+            self._blocks[(name, version)] = block
+            while len(self._blocks) > self.maxsize:
+                del self._blocks[next(iter(self._blocks))]
+                self.evictions += 1
+        return block
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._blocks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def compose(*parts: str) -> str:
+    """Join the non-empty parts of a prompt with blank lines."""
+    return "\n\n".join([part for part in parts if part])
+
+
+prompt_blocks = BlockCache()
+
+# Blocos dinâmicos do system prompt do lifeos_backend (main.py). São curtos:
+# f-strings (já compiladas pelo Python) saem mais baratas que format_map
+FINANCE_EMPTY = "FINANCEIRO: Nenhuma estratégia definida ainda."
+
+
+def financial_block(financeiro) -> str:
+    if not (financeiro.faseAtual or financeiro.totalDivida or financeiro.focoAtual):
+        return FINANCE_EMPTY
+    fin_parts = []
+    if financeiro.faseAtual:
+        fin_parts.append(f"Fase: {financeiro.faseAtual}")
+    if financeiro.totalDivida is not None:
+        fin_parts.append(f"Dívida total: R$ {financeiro.totalDivida:.2f}")
+    if financeiro.prazoAlvoMeses is not None:
+        fin_parts.append(f"Prazo: {financeiro.prazoAlvoMeses} meses")
+    if financeiro.ritmoMensal is not None:
+        fin_parts.append(f"Ritmo mensal: R$ {financeiro.ritmoMensal:.2f}")
+    if financeiro.ritmoDiario is not None:
+        fin_parts.append(f"Ritmo diário: R$ {financeiro.ritmoDiario:.2f}")
+    if financeiro.focoAtual:
+        fin_parts.append(f"Foco: {financeiro.focoAtual}")
+    return f"ESTRATÉGIA FINANCEIRA ATIVA: {'; '.join(fin_parts)}"
+
+
+def context_block(context: dict) -> str:
+    """Routines, tasks and calendar sent by the frontend (per request: no server-side version)."""
+    routines = context.get("routines", [])
+    task_titles = [str(t.get("title")) for t in context.get("tasks", []) if isinstance(t, dict)]
+    event_titles = [str(e.get("title")) for e in context.get("calendar", []) if isinstance(e, dict)]
+    rotina_text = f"Rotina: {', '.join([str(x) for x in routines])}" if routines else "Rotina: vazia"
+    tasks_text = f"Tarefas: {', '.join(task_titles)}" if task_titles else "Tarefas: nenhuma"
+    cal_text = f"Calendário: {', '.join(event_titles)}" if event_titles else "Calendário: sem eventos"
+    return f"{rotina_text} | {tasks_text} | {cal_text}"
+
+
+def lifeos_system_message(financeiro, context: Optional[dict] = None, memory_summary: str = "",
+                          history_summary: str = "", blocks: BlockCache = prompt_blocks) -> str:
+    """main.py system message: static root prompt first, then blocks from least to most volatile.
+
+    Root prompt + financial block are memoized together on `financeiro.revision`.
+    """
+    parts = [blocks.render("financeiro", financeiro.revision,
+                           lambda: LIFEOS_SYSTEM_PROMPT + "\n\n" + financial_block(financeiro))]
+    if context:
+        parts.append(context_block(context))
+    if memory_summary:
+        parts.append(f"Contexto da conversa: {memory_summary}")
+    if history_summary:
+        parts.append(f"Resumo das mensagens anteriores: {history_summary}")
+    return "\n\n".join(parts)
@@ -0,0 +1,171 @@
+"""
+LifeOS Session Store
+Sessões por cookie com cache em memória e expiração deslizante.
+
+token -> user_id fica num cache LRU; um hit não toca o banco. O last_seen de
+cada sessão usada é anotado em memória e gravado em lote (write-behind) a cada
+FLUSH_INTERVAL, empurrando expires_at para last_seen + ttl. Uma thread de
+manutenção também apaga sessões expiradas em blocos de SWEEP_CHUNK linhas,
+cada bloco numa transação curta.
+"""
+
+import atexit
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from cache import TTLCache
+from structured_log import get_logger
+
+log = get_logger("sessions")
+
+SESSION_TTL = 30 * 24 * 3600  # expira após 30 dias sem uso
+CACHE_TTL = 300  # segundos até revalidar a sessão no banco (logout em outro processo)
+CACHE_SIZE = 4096
+FLUSH_INTERVAL = 5.0
+SWEEP_INTERVAL = 600.0
+SWEEP_CHUNK = 500
+
+
+class SessionStore:
+    """Token sessions cached in memory, with write-behind last_seen and a chunked expiry sweeper."""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], ttl: int = SESSION_TTL,
+                 cache_ttl: float = CACHE_TTL, cache_size: int = CACHE_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, sweep_interval: float = SWEEP_INTERVAL,
+                 sweep_chunk: int = SWEEP_CHUNK):
+        self.connect = connect
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.sweep_chunk = sweep_chunk
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self._touched: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._last_sweep = 0.0
+        self.flushes = 0
+        self.rows_touched = 0
+        self.swept = 0
+        atexit.register(self.flush)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="session-maintenance", daemon=True)
+                    self._thread.start()
+
+    def _cache(self, token: str, user_id: int, expires_at: float) -> None:
+        self.cache.set(token, user_id, expires_at=min(expires_at, time.time() + self.cache_ttl))
+
+    def create(self, user_id: int, token: str) -> None:
+        now = int(time.time())
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO sessions (user_id, token, last_seen, expires_at) VALUES (?, ?, ?, ?)",
+                    (user_id, token, now, now + self.ttl),
+                )
+        finally:
+            conn.close()
+        self._cache(token, user_id, now + self.ttl)
+        self._ensure_thread()
+
+    def lookup(self, token: str) -> Optional[int]:
+        """user_id of a live session (and mark it as seen), or None."""
+        now = int(time.time())
+        user_id = self.cache.get(token)
+        if user_id is None:
+            conn = self.connect()
+            try:
+                row = conn.execute("SELECT user_id, expires_at FROM sessions WHERE token = ?", (token,)).fetchone()
+            finally:
+                conn.close()
+            if not row or (row[1] is not None and row[1] <= now):
+                return None
+            user_id = row[0]
+        self._cache(token, user_id, now + self.ttl)
+        with self._lock:
+            self._touched[token] = now
+        self._ensure_thread()
+        return user_id
+
+    def revoke(self, token: str) -> None:
+        with self._lock:
+            self._touched.pop(token, None)
+        self.cache.invalidate(token)
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+        finally:
+            conn.close()
+
+    def flush(self) -> int:
+        """Write pending last_seen/expires_at updates in one transaction."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return 0
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "UPDATE sessions SET last_seen = ?, expires_at = ? WHERE token = ?",
+                    [(seen, seen + self.ttl, token) for token, seen in touched.items()],
+                )
+        finally:
+            conn.close()
+        self.flushes += 1
+        self.rows_touched += len(touched)
+        return len(touched)
+
+    def sweep(self) -> int:
+        """Delete expired sessions, SWEEP_CHUNK rows per transaction."""
+        now = int(time.time())
+        total = 0
+        conn = self.connect()
+        try:
+            while True:
+                with conn:
+                    deleted = conn.execute(
+                        "DELETE FROM sessions WHERE id IN "
+                        "(SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                        (now, self.sweep_chunk),
+                    ).rowcount
+                total += deleted
+                if deleted < self.sweep_chunk:
+                    break
+                time.sleep(0)  # deixa writers do request passarem entre os blocos
+        finally:
+            conn.close()
+        self.swept += total
+        if total:
+            log.info("Sessões expiradas removidas", count=total)
+        return total
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                    self._last_sweep = time.monotonic()
+                    self.sweep()
+            except sqlite3.Error as e:
+                log.error("Erro na manutenção", error=str(e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._touched)
+        return {
+            **self.cache.stats(),
+            "pending_touches": pending,
+            "flushes": self.flushes,
+            "rows_touched": self.rows_touched,
+            "swept": self.swept,
+        }
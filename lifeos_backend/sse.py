@@ -0,0 +1,52 @@
+"""
+LifeOS SSE
+Formatação de Server-Sent Events para o /chat/stream.
+
+O stream manda eventos `delta` ({"delta": "..."}) com os pedaços da resposta e
+termina com um `done` ({"reply": ..., "action": ...}) contendo a resposta final
+já tratada, ou um `error` ({"detail": ...}). MarkerFilter segura o texto que
+pode ser o começo de um marcador (ex.: SALVAR_ESTRATEGIA) para que o marcador
+nunca apareça para o usuário durante o stream.
+"""
+
+import json
+from typing import Iterable, Optional
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class MarkerFilter:
+    """Drops control markers from streamed text, holding back a possible partial marker."""
+
+    def __init__(self, markers: Iterable[str]):
+        self.markers = sorted(markers, key=len, reverse=True)
+        self._buffer = ""
+
+    def _held_back(self, text: str) -> int:
+        """Length of the longest suffix of `text` that is a proper prefix of some marker."""
+        longest = 0
+        for marker in self.markers:
+            for size in range(min(len(marker) - 1, len(text)), longest, -1):
+                if marker.startswith(text[-size:]):
+                    longest = size
+                    break
+        return longest
+
+    def feed(self, chunk: str) -> str:
+        """Text that is safe to show now."""
+        text = self._buffer + chunk
+        for marker in self.markers:
+            text = text.replace(marker, "")
+        keep = self._held_back(text)
+        self._buffer = text[len(text) - keep:] if keep else ""
+        return text[:len(text) - keep] if keep else text
+
+    def flush(self) -> str:
+        rest, self._buffer = self._buffer, ""
+        return rest
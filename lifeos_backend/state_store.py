@@ -0,0 +1,166 @@
+"""
+LifeOS State Store
+Cache write-through em processo para arquivos de estado JSON (lifeos_state.json)
+e shards por usuário (lifeos_state/users/<id>.json).
+
+O dict parseado fica em memória e é atualizado a cada save. Cada load só faz
+um os.stat: se mtime/tamanho do arquivo mudaram (edição externa), o arquivo é
+lido de novo; caso contrário devolve uma cópia do que está em cache. A escrita
+em disco passa pelo group commit atômico de json_writer.
+"""
+
+import copy
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from json_writer import writer
+from structured_log import get_logger
+
+log = get_logger("state")
+
+
+class JsonStateCache:
+    """Parsed JSON file kept in memory, revalidated against the file's mtime and size."""
+
+    def __init__(self, path: Path, default: Callable[[], dict]):
+        self.path = Path(path)
+        self.default = default
+        self._lock = threading.Lock()
+        self._state: Optional[dict] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._generation = 0
+        self._in_flight = 0
+        self.parses = 0
+        self.hits = 0
+        self.writes = 0
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def load(self) -> dict:
+        """Return a private copy of the state; callers may mutate it freely."""
+        with self._lock:
+            if self._in_flight and self._state is not None:
+                # Save em andamento: a memória já é a versão mais nova
+                self.hits += 1
+                return copy.deepcopy(self._state)
+            stamp = self._file_stamp()
+            if stamp is None:
+                return self.default()
+            if self._state is None or stamp != self._stamp:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._state = json.load(f)
+                self._stamp = stamp
+                self.parses += 1
+            else:
+                self.hits += 1
+            return copy.deepcopy(self._state)
+
+    def save(self, state: dict) -> None:
+        """Write the state through to disk and keep it as the cached copy.
+
+        If the write fails the cached copy is dropped (the file is re-read) and the error re-raised.
+        """
+        data = json.dumps(state, ensure_ascii=False, indent=2)
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._in_flight += 1
+            self._state = copy.deepcopy(state)
+            self.writes += 1
+        try:
+            writer.write(self.path, data)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+                # Não chegou ao disco: descarta a cópia em memória e o próximo load relê o
+                # arquivo; a geração nova impede que um save anterior em voo carimbe o cache
+                self._generation += 1
+                self._state = None
+                self._stamp = None
+            raise
+        with self._lock:
+            self._in_flight -= 1
+            if generation == self._generation:
+                self._stamp = self._file_stamp()
+            elif not self._in_flight:
+                # Um save mais novo terminou antes deste: revalida pelo disco
+                self._state = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._state = None
+            self._stamp = None
+
+    def stats(self) -> dict:
+        return {"parses": self.parses, "hits": self.hits, "writes": self.writes}
+
+
+class UserShardStore:
+    """One JSON shard per user (root/<user_id>.json), each loaded lazily through its own cache.
+
+    Saving a user's state writes only that user's file instead of the whole
+    tenant base.
+    """
+
+    def __init__(self, root: Path, default: Callable[[], dict]):
+        self.root = Path(root)
+        self.default = default
+        self._lock = threading.Lock()
+        self._shards: Dict[str, JsonStateCache] = {}
+
+    def _shard(self, user_id) -> JsonStateCache:
+        key = str(user_id)
+        if not key.isdigit():
+            raise ValueError(f"user_id inválido para shard: {user_id!r}")
+        shard = self._shards.get(key)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(key)
+                if shard is None:
+                    shard = self._shards[key] = JsonStateCache(self.root / f"{key}.json", self.default)
+        return shard
+
+    def exists(self, user_id) -> bool:
+        return (self.root / f"{user_id}.json").exists()
+
+    def load(self, user_id) -> dict:
+        return self._shard(user_id).load()
+
+    def save(self, user_id, state: dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._shard(user_id).save(state)
+
+    def migrate_from(self, state_cache: JsonStateCache, key: str = "users") -> int:
+        """Split the `key` map of a monolithic state file into shards (one-time).
+
+        Users that already have a shard are left alone; the map is then removed
+        from the original file, which keeps its other top-level keys.
+        """
+        state = state_cache.load()
+        users = state.pop(key, None)
+        if not users:
+            return 0
+        for user_id, user_state in users.items():
+            if not self.exists(user_id):
+                self.save(user_id, user_state)
+        state_cache.save(state)
+        log.info("Usuários migrados para shards", count=len(users), root=str(self.root))
+        return len(users)
+
+    def stats(self) -> dict:
+        with self._lock:
+            shards = list(self._shards.values())
+        return {
+            "shards_loaded": len(shards),
+            "parses": sum(s.parses for s in shards),
+            "hits": sum(s.hits for s in shards),
+            "writes": sum(s.writes for s in shards),
+        }
@@ -0,0 +1,150 @@
+"""
+LifeOS Storage
+Repositório único em SQLite (modo WAL) para o estado do backend.
+
+Cada entidade (memory, financeiro, financial_conversation_state, tasks) é um
+documento JSON numa linha da tabela `entities`. Dentro de `transaction()` as
+escritas ficam num unit of work do request e são gravadas num único commit
+no final; leituras no mesmo request já enxergam o que foi escrito.
+
+Migração dos arquivos JSON antigos:
+    python storage.py migrate [--db lifeos_backend.db] [--dir .]
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DB_FILE = Path("lifeos_backend.db")
+
+# Arquivos JSON de antes do SQLite, por entidade
+LEGACY_JSON_FILES = {
+    "memory": "memory.json",
+    "financeiro": "financeiro.json",
+    "financial_conversation_state": "financial_conversation_state.json",
+    "tasks": "tasks.json",
+}
+
+# Escritas pendentes do request atual (entity -> JSON); None fora de transaction()
+_unit_of_work: ContextVar[Optional[Dict[str, str]]] = ContextVar("lifeos_unit_of_work", default=None)
+
+
+class Repository:
+    """JSON documents keyed by entity name in one SQLite database (WAL)."""
+
+    def __init__(self, path: Path = DB_FILE):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.commits = 0
+        self.entities_written = 0
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entities (
+                    name TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at INTEGER NOT NULL
+                )
+            """)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, name: str) -> Any:
+        """Decoded document, or None when the entity was never saved."""
+        pending = _unit_of_work.get()
+        if pending is not None and name in pending:
+            return json.loads(pending[name])
+        row = self._connection().execute("SELECT data FROM entities WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, name: str, value: Any) -> None:
+        """Save a document; inside transaction() it is committed with the rest of the request."""
+        data = json.dumps(value, ensure_ascii=False)
+        pending = _unit_of_work.get()
+        if pending is not None:
+            pending[name] = data
+        else:
+            self._write({name: data})
+
+    def _write(self, documents: Dict[str, str]) -> None:
+        conn = self._connection()
+        now = int(time.time())
+        with conn:
+            conn.executemany(
+                "INSERT INTO entities (name, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(name, data, now) for name, data in documents.items()],
+            )
+        with self._stats_lock:
+            self.commits += 1
+            self.entities_written += len(documents)
+
+    @contextmanager
+    def transaction(self):
+        """Group every put() of the block into one commit; nested blocks join the outer one.
+
+        Nothing is written if the block raises.
+        """
+        if _unit_of_work.get() is not None:
+            yield
+            return
+        pending: Dict[str, str] = {}
+        token = _unit_of_work.set(pending)
+        try:
+            yield
+            if pending:
+                self._write(pending)
+        finally:
+            _unit_of_work.reset(token)
+
+    def import_json_files(self, directory: Path = Path("."), files: Dict[str, str] = LEGACY_JSON_FILES) -> Dict[str, bool]:
+        """Import legacy JSON files for entities the database doesn't have yet."""
+        imported = {}
+        with self.transaction():
+            for name, filename in files.items():
+                path = Path(directory) / filename
+                if not path.exists() or self.get(name) is not None:
+                    imported[name] = False
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if name == "tasks" and isinstance(data, dict):
+                    data = data.get("tasks", [])
+                self.put(name, data)
+                imported[name] = True
+        return imported
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"commits": self.commits, "entities_written": self.entities_written}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LifeOS storage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="importa os arquivos JSON antigos para o SQLite")
+    migrate.add_argument("--db", default=str(DB_FILE))
+    migrate.add_argument("--dir", default=".")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        result = Repository(Path(args.db)).import_json_files(Path(args.dir))
+        for name, done in result.items():
+            print(f"[MIGRATE] {name}: {'importado' if done else 'ignorado (sem arquivo ou já existe)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+LifeOS Strategy Parser
+Estratégia da IA em seções estruturadas, parseada uma vez quando a resposta chega.
+
+O prompt pede a estratégia em quatro seções numeradas ("1." a "4."): análise
+da situação, passos práticos, foco do mês e meta diária. parse_strategy
+reconhece as seções pelo título (com ou sem **negrito**), ignora a introdução
+e a pergunta final ("Ficou alguma dúvida sobre o plano?") e devolve um
+Strategy, ou None quando a resposta não é uma estratégia.
+
+Listas numeradas dentro de uma seção ("1. Negociar o cartão", "2. ...") não
+abrem seção nova. Um número só abre seção quando é o próximo da sequência e o
+título é de uma das SECTIONS ainda não aberta, ou, sem título conhecido, quando
+está sem recuo logo depois de uma linha em branco. Entre candidatos ao mesmo
+número ganha o que tem as duas coisas, depois o de título conhecido.
+"""
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from intent_router import fold
+
+MAX_STRATEGY_CHARS = 1200  # o que cabe no card de foco do Controle Financeiro
+MIN_SECTIONS = 2  # menos que isso é uma lista qualquer, não uma estratégia
+
+# Campo -> (título ao renderizar, radicais do título no texto da IA, já sem acento)
+SECTIONS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "analysis": ("Análise da situação", ("analise", "situacao", "diagnostico")),
+    "steps": ("Passos práticos", ("passo", "acao", "acoes", "plano")),
+    "monthly_focus": ("Foco do mês", ("foco",)),
+    "daily_goal": ("Meta diária", ("meta", "diari")),
+}
+
+_FIELD_ORDER = {field: i for i, field in enumerate(SECTIONS)}
+_SECTION_START = re.compile(r"^([ \t]*)(?:\*\*)?([1-9])[.)][ \t]*(.*)$", re.MULTILINE)
+
+
+class Strategy(NamedTuple):
+    analysis: str
+    steps: str
+    monthly_focus: str
+    daily_goal: str
+
+    def render(self) -> str:
+        """Plain-text strategy, numbered sections separated by blank lines (capped at MAX_STRATEGY_CHARS)."""
+        filled = [(SECTIONS[field][0], body) for field, body in self._asdict().items() if body]
+        text = "\n\n".join(f"{n}. {title}:\n{body}" for n, (title, body) in enumerate(filled, 1))
+        return text if len(text) <= MAX_STRATEGY_CHARS else text[:MAX_STRATEGY_CHARS] + "..."
+
+
+def _section_field(title: str) -> Optional[str]:
+    folded = fold(title)
+    for field, (_, stems) in SECTIONS.items():
+        if any(stem in folded for stem in stems):
+            return field
+    return None
+
+
+def _strip_closing(body: str) -> str:
+    """Drop the trailing question lines the prompt asks for ("Ficou alguma dúvida...?")."""
+    lines = body.rstrip().splitlines()
+    while lines and (lines[-1].strip().endswith("?") or not lines[-1].strip()):
+        lines.pop()
+    return "\n".join(lines).strip()
+
+
+def _header(match: "re.Match") -> Tuple[str, str]:
+    """(title, rest of the line) of a numbered line, without bold markers."""
+    title, _, rest = match.group(3).replace("*", "").strip().partition(":")
+    return title.strip(), rest.strip()
+
+
+def _after_blank_line(text: str, pos: int) -> bool:
+    head = text[:pos]
+    return not head.strip() or not head[:-1].rsplit("\n", 1)[-1].strip()
+
+
+def _section_starts(text: str) -> List["re.Match"]:
+    """Numbered lines that open a section, in order.
+
+    Only the next number of the sequence counts, and only with a known title (of
+    a section after the ones already open) or unindented right after a blank
+    line. Among the candidates for a number the one with both wins, then a known
+    title; the choice is made when the next number shows up.
+    """
+    starts: List["re.Match"] = []
+    opened = -1  # posição em SECTIONS da última seção aberta com título conhecido
+    best, best_score, best_order = None, 0, -1
+    for match in _SECTION_START.finditer(text):
+        number = int(match.group(2))
+        if best is not None and number == len(starts) + 2:
+            starts.append(best)
+            opened = max(opened, best_order)
+            best, best_score, best_order = None, 0, -1
+        if number != len(starts) + 1:
+            continue
+        field = _section_field(_header(match)[0])
+        order = _FIELD_ORDER[field] if field else -1
+        score = (2 if order > opened else 0) + (
+            1 if not match.group(1) and _after_blank_line(text, match.start()) else 0)
+        if score > best_score:
+            best, best_score, best_order = match, score, order
+    if best is not None:
+        starts.append(best)
+    return starts
+
+
+def _split_sections(text: str) -> List[Tuple[str, str]]:
+    """(title, body) for each top-level numbered section, in order."""
+    starts = _section_starts(text)
+    sections = []
+    for i, match in enumerate(starts):
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(text)
+        title, rest = _header(match)
+        body = "\n".join(part for part in (rest, text[match.end():end].strip()) if part).replace("**", "")
+        sections.append((title, body))
+    if sections:
+        title, body = sections[-1]
+        sections[-1] = (title, _strip_closing(body))
+    return sections
+
+
+def parse_strategy(text: str) -> Optional[Strategy]:
+    """Structured strategy from an AI reply, or None if the reply isn't one."""
+    fields: Dict[str, str] = {}
+    sections = _split_sections(text.replace("SALVAR_ESTRATEGIA", ""))
+    for title, body in sections:
+        field = _section_field(title)
+        if field and field not in fields:
+            fields[field] = body
+    if len(fields) < MIN_SECTIONS:
+        return None
+    return Strategy(**{field: fields.get(field, "") for field in SECTIONS})
@@ -0,0 +1,248 @@
+"""
+LifeOS Structured Log
+Logs estruturados por categoria, escritos por uma thread de fundo, com amostragem.
+
+Cada módulo pega um Log da sua categoria ("chat", "db", "auth"...) e registra
+um evento curto mais campos:
+
+    log = get_logger("chat")
+    log.info("Mensagem recebida", user_id=user_id, chars=len(message))
+    log.debug("Estado antes", state=before_state)
+
+O nível é checado antes de qualquer trabalho: um debug desligado custa uma
+chamada e um `if`. No request só se enfileira uma tupla (evento, campos, hora,
+request id); a thread do QueueListener monta o LogRecord, serializa (texto ou
+JSON por linha) e escreve no stdout. Por isso os campos devem ser valores que
+ninguém vai mexer depois (load_state já devolve cópias). Sem configure(), os
+registros seguem o caminho normal do logging.
+
+Cada registro leva o request id do request atual (RequestIdMiddleware: o
+X-Request-ID recebido ou um novo, devolvido na resposta). Debug e info podem
+ser amostrados por categoria; avisos e erros passam sempre.
+
+Configuração por ambiente:
+    LOG_LEVEL=INFO          DEBUG | INFO | WARNING | ERROR
+    LOG_FORMAT=text         text | json
+    LOG_SAMPLE=health=0,chat=0.1   fração mantida de debug/info por categoria
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from logging.handlers import QueueListener
+from typing import Dict, Optional, TextIO
+
+ROOT = "lifeos"
+# Padrões; configure() lê o ambiente na hora (depois do load_dotenv dos servidores)
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
+LOG_QUEUE_SIZE = 10000  # cheia: descarta e conta, nunca bloqueia o request
+
+DEBUG, INFO, WARNING, ERROR = logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR
+
+request_id: ContextVar[Optional[str]] = ContextVar("lifeos_request_id", default=None)
+
+_sample_rates: Dict[str, float] = {}
+_sampled_out: Counter = Counter()
+_dropped: Counter = Counter()
+_loggers: Dict[str, "Log"] = {}
+_queue: Optional[queue.SimpleQueue] = None
+_queue_size = LOG_QUEUE_SIZE
+_listener: Optional[QueueListener] = None
+_format = "text"
+
+
+def new_request_id() -> str:
+    return secrets.token_hex(6)
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """"health=0,chat=0.1" -> {"health": 0.0, "chat": 0.1}."""
+    rates = {}
+    for item in spec.split(","):
+        category, _, rate = item.partition("=")
+        if category.strip() and rate.strip():
+            rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class Log:
+    """Structured logger for one category: level check first, then sampling, fields serialized off-thread."""
+
+    __slots__ = ("category", "logger")
+
+    def __init__(self, category: str):
+        self.category = category
+        self.logger = logging.getLogger(f"{ROOT}.{category}")
+
+    def enabled(self, level: int = DEBUG) -> bool:
+        """For fields that are expensive to compute: `if log.enabled(): log.debug(..., x=costly())`."""
+        return self.logger.isEnabledFor(level)
+
+    def debug(self, event: str, **fields) -> None:
+        if self.logger.isEnabledFor(DEBUG):
+            self._emit(DEBUG, event, fields)
+
+    def info(self, event: str, **fields) -> None:
+        if self.logger.isEnabledFor(INFO):
+            self._emit(INFO, event, fields)
+
+    def warning(self, event: str, **fields) -> None:
+        if self.logger.isEnabledFor(WARNING):
+            self._emit(WARNING, event, fields)
+
+    def error(self, event: str, **fields) -> None:
+        if self.logger.isEnabledFor(ERROR):
+            self._emit(ERROR, event, fields)
+
+    def exception(self, event: str, **fields) -> None:
+        """Error with the traceback of the exception being handled."""
+        if self.logger.isEnabledFor(ERROR):
+            self._emit(ERROR, event, fields, sys.exc_info())
+
+    def _emit(self, level: int, event: str, fields: dict, exc_info=None) -> None:
+        if level < WARNING:
+            rate = _sample_rates.get(self.category)
+            if rate is not None and random.random() >= rate:
+                _sampled_out[self.category] += 1
+                return
+        pending = _queue
+        if pending is None:
+            # Sem configure(): makeRecord direto, sem o findCaller (caminhada na pilha) do Logger.log
+            self.logger.handle(self.logger.makeRecord(self.logger.name, level, "", 0, event, (), exc_info,
+                                                      extra={"fields": fields, "request_id": request_id.get()}))
+        elif pending.qsize() >= _queue_size:  # cheia: descarta e conta, nunca bloqueia o request
+            _dropped[self.category] += 1
+        else:
+            pending.put_nowait((self.logger.name, level, event, fields, request_id.get(), time.time(), exc_info))
+
+
+def get_logger(category: str) -> Log:
+    log = _loggers.get(category)
+    if log is None:
+        log = _loggers.setdefault(category, Log(category))
+    return log
+
+
+def _encode(value) -> str:
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False) if (not value or " " in value or "=" in value) else value
+    if value is None or isinstance(value, (bool, int, float)):
+        return str(value)
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: `time LEVEL [category] request_id event k=v...`, or a JSON object."""
+
+    def __init__(self, json_lines: bool = False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        category = record.name[len(ROOT) + 1:] if record.name.startswith(ROOT + ".") else record.name
+        fields = getattr(record, "fields", None) or {}
+        rid = getattr(record, "request_id", None)
+        exc_text = record.exc_text or (self.formatException(record.exc_info) if record.exc_info else None)
+        if self.json_lines:
+            document = {"ts": round(record.created, 3), "level": record.levelname.lower(), "category": category,
+                        "event": record.getMessage()}
+            if rid:
+                document["request_id"] = rid
+            document.update(fields)
+            if exc_text:
+                document["exc"] = exc_text
+            return json.dumps(document, ensure_ascii=False, default=str)
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+        line = f"{stamp}.{int(record.msecs):03d} {record.levelname:<7} [{category}] {rid or '-'} {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={_encode(value)}" for key, value in fields.items())
+        return line + ("\n" + exc_text if exc_text else "")
+
+
+class _RecordWriter(QueueListener):
+    """QueueListener that builds the LogRecord on its own thread from the tuple the request enqueued."""
+
+    def prepare(self, item: tuple) -> logging.LogRecord:
+        name, level, event, fields, rid, created, exc_info = item
+        record = logging.LogRecord(name, level, "", 0, event, (), exc_info)
+        record.created, record.msecs = created, (created - int(created)) * 1000
+        record.fields, record.request_id = fields, rid
+        return record
+
+
+def configure(level: Optional[str] = None, fmt: Optional[str] = None, sample: Optional[str] = None,
+              stream: Optional[TextIO] = None) -> None:
+    """Route the `lifeos.*` loggers through the background writer (again if already configured)."""
+    global _queue, _queue_size, _listener, _format
+    shutdown()
+    _format = (fmt or os.getenv("LOG_FORMAT", LOG_FORMAT)).lower()
+    _sample_rates.clear()
+    _sample_rates.update(parse_sample_rates(os.getenv("LOG_SAMPLE", "") if sample is None else sample))
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(StructuredFormatter(json_lines=_format == "json"))
+    _queue_size = int(os.getenv("LOG_QUEUE_SIZE", LOG_QUEUE_SIZE))
+    # SimpleQueue: put sem lock de Condition; o limite é checado pelo qsize
+    _listener = _RecordWriter(queue.SimpleQueue(), output)
+    root = logging.getLogger(ROOT)
+    root.setLevel((level or os.getenv("LOG_LEVEL", LOG_LEVEL)).upper())
+    root.propagate = False  # não duplica no logger raiz (uvicorn)
+    _listener.start()
+    _queue = _listener.queue
+
+
+def shutdown() -> None:
+    """Write what is still queued and stop the writer thread."""
+    global _queue, _listener
+    if _listener is not None:
+        _queue = None
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
+
+
+class RequestIdMiddleware:
+    """ASGI middleware: a request id per HTTP request (incoming X-Request-ID or a new one), echoed in the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = next((value.decode("latin-1")[:64] for name, value in scope["headers"] if name == b"x-request-id"),
+                   None) or new_request_id()
+        header = (b"x-request-id", rid.encode("latin-1"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        token = request_id.set(rid)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+def stats() -> dict:
+    return {
+        "level": logging.getLevelName(logging.getLogger(ROOT).getEffectiveLevel()),
+        "format": _format,
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "dropped": dict(_dropped),
+        "sample_rates": dict(_sample_rates),
+        "sampled_out": dict(_sampled_out),
+    }
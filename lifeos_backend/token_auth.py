@@ -0,0 +1,102 @@
+"""
+LifeOS Token Auth
+Verificação de JWT com cache e revogação (logout).
+
+Um token verificado fica em cache (chave = hash do token) até o seu exp, então
+requests seguintes não refazem decode + HMAC. Tokens revogados ficam num
+conjunto compacto hash -> exp, opcionalmente persistido em JSON; cada entrada
+é descartada quando o token expiraria de qualquer forma.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import jwt
+
+from cache import TTLCache
+from json_writer import write_json
+
+TOKEN_CACHE_SIZE = 4096
+NO_EXP_REVOCATION_TTL = 30 * 24 * 3600  # tokens sem exp ficam revogados por 30 dias
+
+
+def token_key(token: str) -> str:
+    """Stable short key for a token (the raw token is never kept as a key or on disk)."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+
+class RevocationList:
+    """Revoked token keys with their exp; persisted to `path` when given."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._revoked: Dict[str, float] = {}
+        if self.path and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._revoked = json.load(f)
+            self._prune(time.time())
+
+    def _prune(self, now: float) -> None:
+        self._revoked = {key: exp for key, exp in self._revoked.items() if exp > now}
+
+    def revoke(self, key: str, exp: float) -> None:
+        with self._lock:
+            self._prune(time.time())
+            self._revoked[key] = exp
+            snapshot = dict(self._revoked)
+        if self.path:
+            write_json(self.path, snapshot)
+
+    def __contains__(self, key: str) -> bool:
+        exp = self._revoked.get(key)
+        return exp is not None and exp > time.time()
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+class TokenVerifier:
+    """HS256 verification with a verified-token cache valid until each token's exp."""
+
+    def __init__(self, secret: str, algorithm: str = "HS256", revocations: Optional[RevocationList] = None,
+                 cache_size: int = TOKEN_CACHE_SIZE):
+        self.secret = secret
+        self.algorithm = algorithm
+        self.revocations = revocations if revocations is not None else RevocationList()
+        self.cache = TTLCache(maxsize=cache_size, ttl=None)
+        self.failures = 0
+
+    def verify(self, token: str) -> Optional[dict]:
+        """Claims of a valid, unrevoked token; None otherwise."""
+        key = token_key(token)
+        if key in self.revocations:
+            return None
+        payload = self.cache.get(key)
+        if payload is None:
+            try:
+                payload = jwt.decode(token, self.secret, algorithms=[self.algorithm])
+            except jwt.PyJWTError:
+                self.failures += 1
+                return None
+            exp = payload.get("exp")
+            if exp is not None:
+                self.cache.set(key, payload, expires_at=float(exp))
+        return dict(payload)
+
+    def revoke(self, token: str) -> bool:
+        """Revoke a token until its exp; False when it wasn't valid to begin with."""
+        payload = self.verify(token)
+        if payload is None:
+            return False
+        key = token_key(token)
+        self.revocations.revoke(key, float(payload.get("exp") or time.time() + NO_EXP_REVOCATION_TTL))
+        self.cache.invalidate(key)
+        return True
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "failures": self.failures, "revoked": len(self.revocations)}
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Casos fixos, fuzz e microbenchmark do br_parser.
+
+O fuzz gera mensagens com valores em todos os formatos que aparecem no chat
+("R$ 1.234,56", "2 mil", "1,5k", "3000 reais"), misturados com prazos,
+percentuais, horários e parcelas que não podem virar valor, e compara o
+parser com as regexes antigas dos handlers. O benchmark exige que o parser
+seja mais rápido que elas nas mensagens do corpus do roteador (o chat de
+verdade, em que a maioria não tem número); nas mensagens do fuzz, todas
+cheias de valores, ele só mede.
+
+    python test_br_parser.py [seed]
+"""
+
+import json
+import random
+import re
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+import br_parser
+from br_parser import parse_values
+
+CORPUS_FILE = Path(__file__).parent / "lifeos_backend" / "intent_corpus.jsonl"
+TODAY = date(2026, 10, 18)  # um domingo
+FUZZ_MESSAGES = 5000
+BENCH_ROUNDS = 15
+CHAT_REPEAT = 50  # o corpus tem ~100 mensagens: repetido para cada passada durar o bastante
+
+# (texto, valores, prazos em meses, datas)
+CASES = [
+    ("R$ 1.234,56", [1234.56], [], []),
+    ("R$1.234,56 no cartão", [1234.56], [], []),
+    ("devo 2 mil no nubank", [2000.0], [], []),
+    ("1,5k de fatura", [1500.0], [], []),
+    ("3000 reais", [3000.0], [], []),
+    ("10.000", [10000.0], [], []),
+    ("1.5", [1.5], [], []),
+    ("a parcela é 1,234.56", [1234.56], [], []),
+    ("R$ 2 milhões", [2_000_000.0], [], []),
+    ("quitar em 6 meses", [], [6], []),
+    ("em 90 dias", [], [3], []),
+    ("em 10 dias", [], [1], []),
+    ("uma semana", [], [1], []),
+    ("1,5 ano", [], [18], []),
+    ("R$ 500 em 10 meses", [500.0], [10], []),
+    ("juros de 12% ao mês", [], [], []),
+    ("reunião às 10 amanhã", [], [], [date(2026, 10, 19)]),
+    ("pago às 14h", [], [], []),
+    ("em 10x de R$ 50", [50.0], [], []),
+    ("histórico antes de #12", [], [], []),
+    ("vence dia 5", [], [], [date(2026, 11, 5)]),
+    ("vence dia 25", [], [], [date(2026, 10, 25)]),
+    ("próxima segunda", [], [], [date(2026, 10, 19)]),
+    ("na sexta-feira pago 300 reais", [300.0], [], [date(2026, 10, 23)]),
+    ("sábado", [], [], [date(2026, 10, 24)]),
+    ("segunda parcela de 200", [200.0], [], []),
+    ("10/11/2025 paguei 1.200", [1200.0], [], [date(2025, 11, 10)]),
+    ("31/02", [], [], []),
+    ("depois de amanhã", [], [], [date(2026, 10, 20)]),
+    ("mês que vem", [], [], [date(2026, 11, 18)]),
+    ("ganho 3000 e gasto 1800 por mês", [3000.0, 1800.0], [], []),
+    ("apagar dívida de 300", [300.0], [], []),
+    ("oi tudo bem", [], [], []),
+]
+
+# Regexes como estavam nos handlers (orchestrate_financeiro / extract_and_save_financial_data)
+LEGACY_AMOUNT = re.compile(r'r?\$?\s*(\d+(?:[.,]\d+)?)')
+LEGACY_DAYS = re.compile(r'(\d+)\s*(dias?|semanas?|meses?)')
+LEGACY_NUMBERS = re.compile(r'(\d+(?:[.,]\d{2})?)')
+LEGACY_EXTRACT = [
+    re.compile(r'(?:renda|ganho|salário|recebo|ganho)\s+(?:de\s+)?(?:um?|R\$)?\s*(\d+(?:[.,]\d{2})?)', re.I),
+    re.compile(r'(?:despesa|gasto|total.*gasto|custo)\s+(?:total|fixa|d)?(?:.*?)(?:de\s+|é\s+)?(?:R\$)?\s*(\d+(?:[.,]\d{2})?)', re.I),
+    re.compile(r'(?:cartão|nubank).*?(\d+(?:[.,]\d{2})?)', re.I),
+    re.compile(r'(?:multa).*?(\d+(?:[.,]\d{2})?)', re.I),
+    re.compile(r'(?:empréstim).*?(\d+(?:[.,]\d{2})?)', re.I),
+    re.compile(r'(?:dívida?).*?(\d+(?:[.,]\d{2})?)', re.I),
+]
+
+
+def legacy_amounts(text):
+    return [float(m.group(1).replace(",", ".")) for m in LEGACY_NUMBERS.finditer(text)]
+
+
+def legacy_scan(text):
+    """O que um turno do chat fazia: valor, prazo e a varredura de números."""
+    LEGACY_AMOUNT.search(text.lower())
+    LEGACY_DAYS.search(text.lower())
+    return legacy_amounts(text)
+
+
+def legacy_extract(text):
+    """O que extract_and_save_financial_data fazia com cada mensagem do usuário."""
+    for pattern in LEGACY_EXTRACT:
+        pattern.search(text)
+    return LEGACY_NUMBERS.findall(text)
+
+
+def format_br(value, thousands=True):
+    whole, cents = f"{value:.2f}".split(".")
+    if thousands:
+        whole = f"{int(whole):,}".replace(",", ".")
+    return whole if cents == "00" and random.random() < 0.5 else f"{whole},{cents}"
+
+
+def random_amount():
+    """(texto, valor esperado) num dos formatos aceitos."""
+    kind = random.randrange(6)
+    if kind == 0:
+        value = round(random.uniform(1, 99999), 2)
+        return f"R$ {format_br(value)}", value
+    if kind == 1:
+        value = random.randint(1, 99999)
+        return f"R${format_br(value)}", float(value)
+    if kind == 2:
+        value = random.randint(1, 999)
+        return f"{value} mil", float(value * 1000)
+    if kind == 3:
+        tenths = random.randint(1, 99)
+        text = f"{tenths // 10},{tenths % 10}k" if tenths % 10 else f"{tenths // 10}k"
+        if tenths < 10:
+            text = f"0,{tenths}k"
+        return text, tenths * 100.0
+    if kind == 4:
+        value = random.randint(1, 50000)
+        return f"{value} reais", float(value)
+    value = round(random.uniform(1, 9999), 2)
+    return f"{value:.2f}".replace(".", ","), float(f"{value:.2f}")
+
+
+NOISE = ["juros de {n}% ao mês", "em {n} meses", "em {n} dias", "às {h}", "pago às {h}h",
+         "em {n}x", "vence dia {d}", "daqui a {n} semanas", "próxima segunda"]
+TEMPLATES = ["tenho uma dívida de {a}", "devo {a} no cartão", "minha renda é {a}", "gasto {a} por mês",
+             "{a} no nubank", "paguei {a}", "a fatura veio {a}, dá pra pagar?"]
+
+
+def fuzz_corpus(n):
+    corpus = []
+    for _ in range(n):
+        amount_text, value = random_amount()
+        parts = [random.choice(TEMPLATES).format(a=amount_text)]
+        for _ in range(random.randint(0, 2)):
+            noise = random.choice(NOISE).format(n=random.randint(2, 36), h=random.randint(7, 22), d=random.randint(1, 28))
+            parts.insert(random.randint(0, len(parts)), noise)
+        corpus.append((", ".join(parts), value))
+    return corpus
+
+
+def check_cases():
+    failures = 0
+    for text, amounts, months, dates in CASES:
+        parsed = parse_values(text, TODAY)
+        got = ([a.value for a in parsed.amounts], [d.months for d in parsed.durations], [d.date for d in parsed.dates])
+        if got != (amounts, months, dates):
+            failures += 1
+            print(f"[ERRO] {text!r}: esperado {(amounts, months, dates)}, veio {got}")
+    return failures
+
+
+def fuzz(corpus):
+    """Mensagens em que o único valor extraído é exatamente o esperado (parser, antigo)."""
+    ok = legacy_ok = 0
+    for text, value in corpus:
+        amounts = [a.value for a in parse_values(text, TODAY).amounts]
+        if len(amounts) == 1 and abs(amounts[0] - value) < 0.005:
+            ok += 1
+        elif ok < 5:
+            print(f"[FUZZ] {text!r}: esperado {value}, veio {amounts}")
+        legacy = legacy_amounts(text)
+        legacy_ok += len(legacy) == 1 and abs(legacy[0] - value) < 0.005
+    return ok / len(corpus), legacy_ok / len(corpus)
+
+
+def load_chat():
+    with open(CORPUS_FILE, "r", encoding="utf-8") as f:
+        return [row["text"] for row in map(json.loads, f) if row]
+
+
+def check_shortcut(texts):
+    """Messages skipped by the no-digit/no-keyword shortcut have nothing for the scanner."""
+    lost = [text for text in texts
+            if not br_parser._MAYBE_VALUE.search(text.lower()) and any(br_parser._SCANNER.finditer(text.lower()))]
+    for text in lost[:5]:
+        print(f"[ERRO] atalho pulou {text!r}")
+    return not lost
+
+
+def pruned_word_starts(texts):
+    """Share of word starts the scanner's lookaheads reject before trying any alternative."""
+    starts = kept = 0
+    lookaheads = re.compile(rf"\b(?={br_parser._FIRST_CHARS})(?={br_parser._STARTS})")
+    for text in texts:
+        lowered = text.lower()
+        starts += len(re.findall(r"\b\w", lowered))
+        kept += len(lookaheads.findall(lowered))
+    return 1 - kept / starts
+
+
+def throughput(fns, texts):
+    """Messages/s of each function, best of BENCH_ROUNDS passes taken in turns (noise hits all alike)."""
+    best = [0.0] * len(fns)
+    for _ in range(BENCH_ROUNDS):
+        for i, fn in enumerate(fns):
+            started = time.perf_counter()
+            for text in texts:
+                fn(text)
+            best[i] = max(best[i], len(texts) / (time.perf_counter() - started))
+    return best
+
+
+if __name__ == "__main__":
+    random.seed(int(sys.argv[1]) if len(sys.argv) > 1 else 1234)
+
+    failures = check_cases()
+    print(f"[TEST] Casos fixos: {len(CASES) - failures}/{len(CASES)}")
+
+    corpus = fuzz_corpus(FUZZ_MESSAGES)
+    parser_rate, legacy_rate = fuzz(corpus)
+    print(f"[TEST] Fuzz ({len(corpus)} mensagens): parser {parser_rate:.1%} | regexes antigas {legacy_rate:.1%}")
+
+    texts = [text for text, _ in corpus]
+    chat = load_chat()
+    shortcut_ok = check_shortcut(chat + texts + [text for text, *_ in CASES])
+    print(f"[TEST] Atalho sem dígito nem palavra-chave não pula nenhum valor: {'OK' if shortcut_ok else 'FALHOU'}")
+    print(f"[BENCH] Lookaheads descartam {pruned_word_starts(chat + texts):.0%} dos começos de palavra")
+
+    # Mensagens sempre novas: é assim que o chat e a extração incremental chamam o parser
+    fns = [lambda t: parse_values(t, TODAY), legacy_scan, legacy_extract]
+    faster = True
+    for label, bench_texts, required in (("chat (corpus do roteador)", chat * CHAT_REPEAT, True),
+                                         ("fuzz (só mensagens com valores)", texts, False)):
+        parser, scan, extract = throughput(fns, bench_texts)
+        ok = parser > scan and parser > extract
+        faster &= ok or not required
+        verdict = ("OK" if ok else "FALHOU") if required else "pior caso, só medido"
+        print(f"[BENCH] {label}: parser {parser:,.0f} msg/s | regexes antigas (valor + prazo + números) {scan:,.0f} | "
+              f"extract (renda/despesa/dívidas) {extract:,.0f} {verdict}")
+
+    if failures or parser_rate < 1.0 or not shortcut_ok:
+        print("[ERROR] br_parser errou casos fixos, do fuzz ou pulou valores no atalho")
+        sys.exit(1)
+    if not faster:
+        print("[ERROR] br_parser ficou mais lento que as regexes antigas no chat")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
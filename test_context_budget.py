@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Orçamento de tokens do context_budget e o resumo rolante por usuário.
+
+Simula uma conversa que cresce turno a turno e confere que o histórico
+enviado nunca passa do orçamento (e é o maior sufixo que cabe), que toda
+mensagem que sai da janela acaba no resumo, em lotes de min_new, e que o
+resumo via IA roda em segundo plano: o turno não espera, há uma task por
+usuário e um erro cai no resumo extrativo.
+
+    python test_context_budget.py
+"""
+
+import asyncio
+import io
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+import structured_log
+from context_budget import ContextBudgeter, count_tokens, fit_to_budget, message_tokens
+
+BUDGET = 300
+SUMMARY_TOKENS = 60
+MIN_NEW = 4
+TURNS = 200
+
+WORDS = ("renda despesas dívida cartão parcela juros meta reserva plano mês semana "
+         "salário aluguel mercado transporte economia R$ 1.500,00 2 mil 350 30% dezembro").split()
+
+
+def chat(rng, turns=TURNS):
+    """(seq, message) pairs of a conversation with messages of very different sizes."""
+    messages = []
+    for seq in range(1, 2 * turns + 1):
+        size = rng.choice([3, 8, 20, 60, 150])
+        content = " ".join(rng.choice(WORDS) for _ in range(size))
+        messages.append((seq, {"role": "user" if seq % 2 else "assistant", "content": content}))
+    return messages
+
+
+def check_window_fits_budget():
+    """Every turn sends the longest suffix of the history that fits in the budget."""
+    rng = random.Random(5)
+    messages = chat(rng)
+    budgeter = ContextBudgeter(budget=BUDGET, summary_tokens=SUMMARY_TOKENS, min_new=MIN_NEW)
+    ok = True
+    for turn in range(1, len(messages) + 1):
+        history = messages[:turn]
+        _, kept = budgeter.select("u", history)
+        start = turn - len(kept)
+        cost = sum(message_tokens(m) for m in kept)
+        ok &= kept == [m for _, m in history[start:]] and cost <= BUDGET
+        ok &= start == 0 or cost + message_tokens(history[start - 1][1]) > BUDGET
+    oversized = [(1, {"role": "user", "content": " ".join(WORDS * 20)})]
+    ok &= fit_to_budget([m for _, m in oversized], BUDGET) == 1  # nem a mais nova cabe: janela vazia
+    return ok and budgeter.stats()["max_history_tokens"] <= BUDGET
+
+
+def check_rolling_summary():
+    """Messages leaving the window are folded in batches of min_new; the summary stays under its cap."""
+    rng = random.Random(6)
+    messages = chat(rng)
+    budgeter = ContextBudgeter(budget=BUDGET, summary_tokens=SUMMARY_TOKENS, min_new=MIN_NEW)
+    ok = True
+    for turn in range(1, len(messages) + 1):
+        history = messages[:turn]
+        summary, kept = budgeter.select("u", history)
+        dropped = history[: turn - len(kept)]
+        covered = (budgeter.summaries.get("u") or (None, 0))[1] or 0
+        uncovered = [seq for seq, _ in dropped if seq > covered]
+        # O que saiu da janela está no resumo, ou espera um lote de min_new
+        ok &= len(uncovered) < MIN_NEW and (not dropped or bool(summary))
+        ok &= count_tokens(summary) <= SUMMARY_TOKENS
+    other, _ = budgeter.select("outro", [(1, {"role": "user", "content": "oi"})])  # resumo é por usuário
+    stats = budgeter.stats()
+    return ok and other == "" and 0 < stats["refreshes"] <= stats["dropped_messages"]
+
+
+def check_background_refresh():
+    """The LLM summary runs as one task per user; the turn never waits and errors fall back."""
+    calls = []
+    release = asyncio.Event()
+
+    async def summarize(previous, new):
+        calls.append(len(new))
+        await release.wait()
+        if len(calls) == 2:
+            raise RuntimeError("IA fora do ar")
+        return f"resumo {len(calls)}"
+
+    async def main():
+        rng = random.Random(7)
+        messages = chat(rng, 40)
+        budgeter = ContextBudgeter(budget=BUDGET, summarize=summarize, summary_tokens=SUMMARY_TOKENS,
+                                   min_new=MIN_NEW)
+        first = [budgeter.select("u", messages[:turn])[0] for turn in range(20, 26)]
+        await asyncio.sleep(0)
+        pending = budgeter.stats()["refreshing"]
+        release.set()
+        await asyncio.sleep(0.01)
+        ready = budgeter.select("u", messages[:26])[0]
+        await asyncio.sleep(0.01)
+        fallback = budgeter.select("u", messages)[0]  # segunda chamada falha: resumo extrativo
+        await asyncio.sleep(0.01)
+
+        release.clear()
+        calls.clear()
+        budgeter.summaries.invalidate("v")
+        budgeter.select("v", messages)
+        await budgeter.aclose()
+        return first, pending, ready, fallback, budgeter.stats()
+
+    stream = io.StringIO()
+    structured_log.configure(stream=stream)
+    first, pending, ready, fallback, stats = asyncio.run(main())
+    structured_log.shutdown()
+    return (first == [""] * 6 and pending == 1 and ready == "resumo 1" and fallback != ""
+            and stats["refresh_errors"] == 1 and stats["refreshing"] == 0
+            and "Resumo via IA falhou" in stream.getvalue())
+
+
+if __name__ == "__main__":
+    checks = [
+        (f"Janela nunca passa de {BUDGET} tokens e é o maior sufixo que cabe", check_window_fits_budget),
+        ("Mensagens fora da janela vão para o resumo, em lotes", check_rolling_summary),
+        ("Resumo via IA em segundo plano, uma task por usuário, com fallback", check_background_refresh),
+    ]
+    failures = 0
+    for name, check in checks:
+        ok = check()
+        failures += not ok
+        print(f"[TEST] {name}: {'OK' if ok else 'FALHOU'}")
+
+    if failures:
+        print("[ERROR] context_budget estourou o orçamento ou perdeu mensagens do resumo")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
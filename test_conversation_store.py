@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Concorrência, lote e despejo do ConversationStore, e microbenchmark por turno.
+
+Compara o turno novo (editar a conversa em memória; o disco fica para o flush
+em lote) com o antigo (carregar o documento, fatiar a lista e gravar a cada
+turno no Repository).
+
+    python test_conversation_store.py
+"""
+
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from conversation_store import ConversationStore
+from storage import Repository
+
+THREADS = 8
+TURNS_PER_THREAD = 200
+BENCH_TURNS = 2000
+USERS = 50
+
+
+class FakeDisk:
+    """Documents by user plus a log of save() batches."""
+
+    def __init__(self):
+        self.documents = {}
+        self.batches = []
+
+    def load(self, user_id):
+        return self.documents.get(user_id)
+
+    def save(self, documents):
+        self.batches.append(sorted(documents))
+        self.documents.update(documents)
+
+
+def turn(store, user_id, i):
+    with store.edit(user_id) as conversation:
+        conversation.append("user", f"mensagem {i}")
+        conversation.append("assistant", f"resposta {i}")
+
+
+def check_concurrent_edits():
+    """No lost updates: every turn from every thread is counted."""
+    disk = FakeDisk()
+    store = ConversationStore(disk.load, disk.save, capacity=10, flush_interval=0.01)
+    threads = [threading.Thread(target=lambda n=n: [turn(store, "u", n * TURNS_PER_THREAD + i)
+                                                    for i in range(TURNS_PER_THREAD)])
+               for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    saved = disk.documents["u"]
+    return saved["message_count"] == 2 * THREADS * TURNS_PER_THREAD and len(saved["recent_messages"]) == 10
+
+
+def check_batches_and_eviction():
+    disk = FakeDisk()
+    disk.documents["antigo"] = {"summary": "já existia", "recent_messages": [], "message_count": 6}
+    store = ConversationStore(disk.load, disk.save, max_users=3, idle_ttl=60, flush_interval=3600)
+    for user_id in ("a", "b", "c"):
+        turn(store, user_id, 0)
+    ok = not disk.batches  # nada vai para o disco no caminho do request
+    turn(store, "d", 0)  # passa de max_users: "a" sai da memória ainda sem gravar
+    ok &= "a" not in store._users and "a" in store._evicted
+    turn(store, "a", 1)  # volta antes do flush: vem do documento pendente, não do disco
+    ok &= store.view("a").message_count == 4
+    ok &= store.view("antigo").summary == "já existia"  # primeiro acesso carrega do disco
+    written = store.flush()
+    ok &= written == 4 and len(disk.batches) == 1 and not store._evicted
+    ok &= disk.documents["a"]["message_count"] == 4
+    store.idle_ttl = 0
+    ok &= store.evict_idle() == 3 and store.stats()["users"] == 0
+    ok &= store.view("a").message_count == 4 and store.flush() == 0
+    store.close()
+    return ok
+
+
+def bench(db_dir):
+    repository = Repository(Path(db_dir) / "bench.db")
+
+    def save(documents):
+        with repository.transaction():
+            for user_id, data in documents.items():
+                repository.put(f"memory:{user_id}", data)
+
+    started = time.perf_counter()
+    for i in range(BENCH_TURNS):
+        name = f"memory:{i % USERS}"
+        data = repository.get(name) or {"summary": "", "recent_messages": [], "message_count": 0}
+        data["recent_messages"] += [{"role": "user", "content": f"m {i}"}, {"role": "assistant", "content": f"r {i}"}]
+        data["recent_messages"] = data["recent_messages"][-40:]
+        data["message_count"] += 2
+        repository.put(name, data)
+    legacy = BENCH_TURNS / (time.perf_counter() - started)
+
+    store = ConversationStore(lambda user_id: repository.get(f"memory:{user_id}"), save, flush_interval=3600)
+    started = time.perf_counter()
+    for i in range(BENCH_TURNS):
+        turn(store, str(i % USERS), i)
+    store_rate = BENCH_TURNS / (time.perf_counter() - started)
+    started = time.perf_counter()
+    written = store.flush()
+    flush_ms = (time.perf_counter() - started) * 1000
+    store.close()
+    return legacy, store_rate, written, flush_ms
+
+
+if __name__ == "__main__":
+    concurrent_ok = check_concurrent_edits()
+    print(f"[TEST] {THREADS} threads x {TURNS_PER_THREAD} turnos no mesmo usuário, sem update perdido: "
+          f"{'OK' if concurrent_ok else 'FALHOU'}")
+    eviction_ok = check_batches_and_eviction()
+    print(f"[TEST] Flush em lote, despejo LRU/ocioso com gravação pendente: {'OK' if eviction_ok else 'FALHOU'}")
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        legacy, store_rate, written, flush_ms = bench(db_dir)
+    print(f"[BENCH] turno ({USERS} usuários): store {store_rate:,.0f}/s | get + put por turno {legacy:,.0f}/s")
+    print(f"[BENCH] flush de {written} usuários num commit: {flush_ms:.1f} ms")
+
+    if not (concurrent_ok and eviction_ok):
+        print("[ERROR] ConversationStore perdeu ou embaralhou conversas")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
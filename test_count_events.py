@@ -1,3 +1,5 @@
-import json
-h = json.load(open('financeiro_history.json'))
-print(f'Total de eventos: {len(h["eventos"])}')
+import sys
+sys.path.insert(0, 'lifeos_backend')
+from history_store import HistoryStore
+store = HistoryStore('financeiro_history')
+print(f'Total de eventos: {store.count(None)}')
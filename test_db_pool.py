@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Checkouts aninhados do db_pool e isolamento entre tasks asyncio.
+
+Um bloco aninhado usa a conexão do externo e só o externo faz commit (ou
+rollback); duas tasks intercaladas na mesma thread têm conexões e transações
+separadas; asyncio.to_thread herda a conexão de quem chamou.
+
+    python test_db_pool.py
+"""
+
+import asyncio
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from db_pool import ConnectionPool
+
+
+def rows(pool):
+    with pool.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT v FROM t ORDER BY v")]
+
+
+def reader(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT v FROM t ORDER BY v")]
+    finally:
+        conn.close()
+
+
+def check_nested_commit(pool):
+    """The inner block shares the connection; nothing is visible to others until the outer exits."""
+    with pool.connection() as outer:
+        outer.execute("INSERT INTO t (v) VALUES ('externo')")
+        with pool.connection() as inner:
+            same = inner is outer
+            inner.execute("INSERT INTO t (v) VALUES ('interno')")
+        visible_after_inner = reader(pool.path)
+    return same and visible_after_inner == [] and reader(pool.path) == ["externo", "interno"]
+
+
+def check_nested_rollback(pool):
+    """An error escaping the inner block rolls back the outer block's writes too."""
+    try:
+        with pool.connection() as outer:
+            outer.execute("INSERT INTO t (v) VALUES ('perdido 1')")
+            with pool.connection() as inner:
+                inner.execute("INSERT INTO t (v) VALUES ('perdido 2')")
+                raise ValueError("falha no meio")
+    except ValueError:
+        pass
+    return "perdido 1" not in rows(pool) and pool.stats()["idle"] == pool.stats()["open"]
+
+
+def check_tasks_isolated(pool):
+    """Two tasks interleaving on the event loop thread get their own connection and transaction."""
+    seen = {}
+
+    async def writer():
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO t (v) VALUES ('task')")
+            seen["writer"] = conn
+            await asyncio.sleep(0.02)  # o leitor roda aqui, na mesma thread
+            raise RuntimeError("writer")
+
+    async def reader_task():
+        await asyncio.sleep(0.01)
+        with pool.connection() as conn:
+            seen["reader"] = conn
+            return [row[0] for row in conn.execute("SELECT v FROM t")]
+
+    async def main():
+        return await asyncio.gather(writer(), reader_task(), return_exceptions=True)
+
+    failed, read = asyncio.run(main())
+    return (seen["reader"] is not seen["writer"] and "task" not in read
+            and isinstance(failed, RuntimeError) and "task" not in rows(pool))
+
+
+def check_to_thread_inherits(pool):
+    """A sync helper run with asyncio.to_thread joins the caller's open transaction."""
+    async def main():
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO t (v) VALUES ('async')")
+
+            def helper():
+                with pool.connection() as inner:
+                    inner.execute("INSERT INTO t (v) VALUES ('thread')")
+                    return inner is conn
+
+            shared = await asyncio.to_thread(helper)
+            pending = reader(pool.path)
+        return shared, pending
+
+    shared, pending = asyncio.run(main())
+    stored = rows(pool)
+    return shared and "thread" not in pending and "async" in stored and "thread" in stored
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(Path(tmp) / "pool.db", size=4, acquire_timeout=1.0)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t (v TEXT)")
+
+        checks = [
+            ("Aninhado usa a conexão externa; commit só na saída do externo", check_nested_commit),
+            ("Erro no aninhado desfaz o bloco externo inteiro", check_nested_rollback),
+            ("Tasks intercaladas na mesma thread não compartilham conexão", check_tasks_isolated),
+            ("asyncio.to_thread herda a conexão de quem chamou", check_to_thread_inherits),
+        ]
+        failures = 0
+        for name, check in checks:
+            ok = check(pool)
+            failures += not ok
+            print(f"[TEST] {name}: {'OK' if ok else 'FALHOU'}")
+        print(f"[TEST] Pool: {pool.stats()}")
+        pool.close()
+
+    if failures:
+        print("[ERROR] db_pool misturou conexões ou commitou no lugar errado")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Extração incremental do financial_extractor e o worker de fundo.
+
+Confere que dobrar a conversa em pedaços, com os fatos salvos e relidos entre
+um pedaço e outro (marca d'água), dá o mesmo resultado de uma passada só, e
+que o BackgroundExtractor junta pedidos repetidos do mesmo usuário, respeita
+o timeout do wait e sobrevive a erros.
+
+    python test_financial_extractor.py
+"""
+
+import io
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+import structured_log
+from financial_extractor import BackgroundExtractor, FinancialFacts
+
+CONVERSATIONS = 200
+
+USER_LINES = [
+    "Minha renda é de R$ {v}", "ganho {v} por mês", "3000 é minha renda", "recebo {v} de salário",
+    "minhas despesas são {v}", "gasto uns {v} reais", "tenho {v} no cartão", "uma multa de R$ {v}",
+    "empréstimo de {v} em 12 parcelas", "devo {v} de dívida", "quero juntar {v} até dezembro", "ok, entendi",
+]
+ASSISTANT_LINES = ["Entendi, R$ {v} por mês.", "Qual é a sua renda?", "Vamos montar o plano com {v}.", "Certo!"]
+
+
+def conversation(rng):
+    messages = []
+    for message_id in range(1, rng.randint(2, 30)):
+        role = rng.choice(["user", "user", "assistant"])
+        line = rng.choice(USER_LINES if role == "user" else ASSISTANT_LINES)
+        value = rng.choice([f"{rng.randint(1, 20)} mil", f"{rng.randint(100, 9999)},{rng.randint(0, 99):02d}",
+                            str(rng.randint(50, 20000)), f"{rng.randint(1, 9)}.{rng.randint(100, 999)},00"])
+        messages.append((message_id, line.format(v=value), role))
+    return messages
+
+
+def check_watermark_matches_full_pass():
+    """Chunked extraction through to_row/from_row equals one pass over the whole conversation."""
+    rng = random.Random(3)
+    mismatches = 0
+    for _ in range(CONVERSATIONS):
+        messages = conversation(rng)
+        full = FinancialFacts()
+        for message in messages:
+            full.feed(*message)
+
+        row, pos = None, 0
+        while pos < len(messages):
+            facts = FinancialFacts.from_row(row)
+            new = [m for m in messages if m[0] > facts.last_message_id][: rng.randint(1, 4)]
+            for message in new:
+                facts.feed(*message)
+            row = facts.to_row(42)[1:]
+            pos += len(new)
+        incremental = FinancialFacts.from_row(row)
+        mismatches += (incremental.result() != full.result()
+                       or incremental.last_message_id != messages[-1][0])
+    return mismatches == 0
+
+
+class Gate:
+    """extract() that records its calls and blocks on user 0 until released."""
+
+    def __init__(self, fail_for=()):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fail_for = set(fail_for)
+
+    def __call__(self, user_id, save):
+        self.calls.append((user_id, save))
+        if user_id == 0:
+            self.started.set()
+            self.release.wait(5)
+        if user_id in self.fail_for:
+            raise RuntimeError(f"falha do usuário {user_id}")
+
+
+def check_coalescing():
+    """Requests queued while the worker is busy collapse into one run per user; save=True wins."""
+    gate = Gate()
+    extractor = BackgroundExtractor(gate)
+    extractor.submit(0)
+    gate.started.wait(5)
+    for _ in range(10):
+        extractor.submit(1)
+    extractor.submit(1, save=True)
+    extractor.submit(2)
+    extractor.submit(2)
+    queued = extractor.stats()["pending"]
+    gate.release.set()
+    done = extractor.wait(1) and extractor.wait(2)
+    extractor.close()
+    stats = extractor.stats()
+    return (done and queued == 2 and sorted(gate.calls) == [(0, False), (1, True), (2, False)]
+            and stats["coalesced"] == 11 and stats["runs"] == 3)
+
+
+def check_wait_timeout():
+    """wait gives up after its timeout while the user's extraction is still running."""
+    gate = Gate()
+    extractor = BackgroundExtractor(gate)
+    extractor.submit(0)
+    gate.started.wait(5)
+    started = time.monotonic()
+    timed_out = not extractor.wait(0, timeout=0.1)
+    elapsed = time.monotonic() - started
+    other_user = extractor.wait(5, timeout=0.1)  # nada na fila para ele: não espera
+    gate.release.set()
+    finished = extractor.wait(0, timeout=5)
+    extractor.close()
+    return timed_out and 0.09 <= elapsed < 1.0 and other_user and finished
+
+
+def check_errors_and_close():
+    """A failing extraction is logged and counted and the worker goes on; after close, submit runs inline."""
+    stream = io.StringIO()
+    structured_log.configure(fmt="text", stream=stream)
+    gate = Gate(fail_for={1})
+    extractor = BackgroundExtractor(gate)
+    extractor.submit(1)
+    extractor.submit(2)
+    extractor.wait(1)
+    extractor.wait(2)
+    extractor.close()
+    caller = threading.current_thread()
+    ran_in = []
+    extractor.extract = lambda user_id, save: ran_in.append(threading.current_thread())
+    extractor.submit(3)
+    stats = extractor.stats()
+    structured_log.shutdown()
+    logged = "Erro na extração user_id=1" in stream.getvalue() and "falha do usuário 1" in stream.getvalue()
+    return stats["errors"] == 1 and gate.calls == [(1, False), (2, False)] and ran_in == [caller] and logged
+
+
+if __name__ == "__main__":
+    checks = [
+        (f"Marca d'água em pedaços = passada completa ({CONVERSATIONS} conversas)", check_watermark_matches_full_pass),
+        ("Pedidos repetidos na fila viram uma execução (save=True vence)", check_coalescing),
+        ("wait desiste no timeout com a extração ainda rodando", check_wait_timeout),
+        ("Erro contado sem parar o worker; depois do close roda no chamador", check_errors_and_close),
+    ]
+    failures = 0
+    for name, check in checks:
+        ok = check()
+        failures += not ok
+        print(f"[TEST] {name}: {'OK' if ok else 'FALHOU'}")
+
+    if failures:
+        print("[ERROR] extração incremental divergiu ou o worker perdeu pedidos")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Log append-only do history_store: partições por usuário, recuperação após crash e deltas.
+
+Simula appends rasgados (linha final do .log pela metade, registro parcial
+no .idx, índice atrás ou à frente do log) e confere que, ao reabrir, o índice
+volta a bater com o log e os ids continuam de onde pararam. Depois grava uma
+sequência aleatória de mudanças no financeiro e confere que state_at refaz
+exatamente cada estado a partir dos deltas e snapshots.
+
+    python test_history_store.py
+"""
+
+import json
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from history_store import INDEX_MAGIC, INDEX_RECORD, HistoryStore, apply_delta, diff_state
+
+EVENTS = 30
+CHANGES = 150
+SNAPSHOT_EVERY = 10
+
+
+def fill(root, user_id=1, events=EVENTS):
+    store = HistoryStore(root, durable=False)
+    for i in range(events):
+        store.append(user_id, {"tipo": "ADD_DIVIDA" if i % 3 else "PAGAMENTO", "valor": float(i), "timestamp": 1000 + i})
+    store.close()
+    return Path(root) / f"{user_id}.log", Path(root) / f"{user_id}.idx"
+
+
+def consistent(store, user_id, expected):
+    """Index, log and every read path agree on ids 1..expected."""
+    ids = [event["id"] for event in store.iter_events(user_id)]
+    page, _ = store.query(user_id, after_id=0, limit=expected + 5)
+    return (ids == list(range(1, expected + 1)) and [e["id"] for e in page] == ids
+            and store.count(user_id) == expected and store.last_id(user_id) == expected
+            and all(store.get(user_id, i)["id"] == i for i in (1, expected)))
+
+
+def check_partitions(root):
+    store = HistoryStore(root, durable=False)
+    store.append(1, {"tipo": "ADD_DIVIDA", "timestamp": 1})
+    store.append(2, {"tipo": "ADD_DIVIDA", "timestamp": 1})
+    store.append(1, {"tipo": "PAGAMENTO", "timestamp": 2})
+    store.append(None, {"tipo": "ADD_DIVIDA", "timestamp": 3})
+    ok = (store.count(1) == 2 and store.count(2) == 1 and store.count(None) == 1
+          and [e["tipo"] for e in store.iter_events(1)] == ["ADD_DIVIDA", "PAGAMENTO"]
+          and (Path(root) / "global.log").exists())
+    try:
+        store.append("../etc", {"tipo": "X"})
+        ok = False
+    except ValueError:
+        pass
+    store.close()
+    return ok
+
+
+def check_torn_log(root):
+    """A half-written last line is dropped and its id is reused by the next append."""
+    log_path, _ = fill(root)
+    with open(log_path, "ab") as log:
+        log.write(b'{"id": 31, "tipo": "ADD_DIV')
+    store = HistoryStore(root, durable=False)
+    recovered = consistent(store, 1, EVENTS)
+    event = store.append(1, {"tipo": "ADD_DIVIDA", "timestamp": 2000})
+    ok = recovered and event["id"] == EVENTS + 1 and consistent(store, 1, EVENTS + 1)
+    store.close()
+    return ok
+
+
+def check_torn_index(root):
+    """A partial index record and log lines the index never saw are rebuilt from the log."""
+    _, idx_path = fill(root)
+    idx_size = idx_path.stat().st_size
+    # Corta os 5 últimos registros e deixa meio registro no fim
+    keep = idx_size - 5 * INDEX_RECORD.size
+    data = idx_path.read_bytes()[:keep]
+    idx_path.write_bytes(data + data[-INDEX_RECORD.size:][: INDEX_RECORD.size // 2])
+    store = HistoryStore(root, durable=False)
+    ok = consistent(store, 1, EVENTS) and idx_path.stat().st_size == idx_size
+    store.close()
+    return ok
+
+
+def check_index_ahead(root):
+    """Index entries pointing past a truncated log are dropped."""
+    log_path, _ = fill(root)
+    lines = log_path.read_bytes().splitlines(keepends=True)
+    log_path.write_bytes(b"".join(lines[:-4]))
+    store = HistoryStore(root, durable=False)
+    ok = consistent(store, 1, EVENTS - 4)
+    store.close()
+    return ok
+
+
+def check_legacy_import(root):
+    """The legacy JSON is imported once, into the partition it is given."""
+    legacy = Path(root) / "financeiro_history.json"
+    legacy.write_text(json.dumps({"eventos": [
+        {"id": i, "tipo": "ADD_DIVIDA", "valor": 10.0, "timestamp": i,
+         "estado_antes": {"dividas": []}, "estado_depois": {"dividas": []}} for i in range(1, 6)
+    ]}), encoding="utf-8")
+    store = HistoryStore(Path(root) / "history")
+    first, again = store.import_legacy(legacy, user_id=7), store.import_legacy(legacy, user_id=7)
+    ok = first == 5 and again == 0 and consistent(store, 7, 5) and store.count(None) == 0
+    store.close()
+    return ok
+
+
+def check_old_index_format(root):
+    """An index with another header is rebuilt from scratch."""
+    _, idx_path = fill(root)
+    idx_path.write_bytes(b"LIDX\x01\x00\x00\x00" + b"\x00" * 40)
+    store = HistoryStore(root, durable=False)
+    ok = consistent(store, 1, EVENTS) and idx_path.read_bytes().startswith(INDEX_MAGIC)
+    store.close()
+    return ok
+
+
+def random_changes(seed=7):
+    """(before, after) pairs of a financeiro evolving the way the chat changes it."""
+    rng = random.Random(seed)
+    state = {"renda": 3000.0, "dividas": []}
+    next_id = 1
+    for i in range(CHANGES):
+        before = json.loads(json.dumps(state))
+        roll = rng.random()
+        if roll < 0.4 or not state["dividas"]:
+            state["dividas"].append({"id": next_id, "valor": float(rng.randint(50, 5000)), "descricao": "Dívida"})
+            next_id += 1
+        elif roll < 0.7:
+            state["dividas"].pop(rng.randrange(len(state["dividas"])))
+        elif roll < 0.8:
+            state["dividas"].append(dict(rng.choice(state["dividas"]), id=None))  # item repetido sem id
+        elif roll < 0.9:
+            state["renda"] = float(rng.randint(1000, 9000))
+        elif "meta" in state:
+            del state["meta"]
+        else:
+            state["meta"] = f"meta {i}"
+        yield before, json.loads(json.dumps(state))
+
+
+def check_deltas(root):
+    """Every delta is compact and diff_state/apply_delta round-trip."""
+    ok = True
+    for before, after in random_changes():
+        delta = diff_state(before, after)
+        ok &= apply_delta(before, delta) == after
+        ok &= len(json.dumps(delta)) < 200  # não cresce com a lista de dívidas
+    return ok
+
+
+def check_state_at(root):
+    """state_at rebuilds the financeiro after each event, by id and by timestamp, before and after reopening."""
+    store = HistoryStore(root, durable=False, snapshot_every=SNAPSHOT_EVERY)
+    states = []
+    for i, (before, after) in enumerate(random_changes()):
+        store.append_change(1, {"tipo": "MUDANCA", "timestamp": 1000 + 10 * i}, before, after)
+        states.append(after)
+    # Mudança feita fora do histórico: o "antes" não bate e o evento leva snapshot
+    outside = dict(states[-1], renda=1.0)
+    event = store.append_change(1, {"tipo": "MUDANCA", "timestamp": 5000}, outside, dict(outside, meta="fora"))
+    states.append(dict(outside, meta="fora"))
+    store.close()
+
+    store = HistoryStore(root, durable=False, snapshot_every=SNAPSHOT_EVERY)
+    events = list(store.iter_events(1))
+    snapshots = [e["id"] for e in events if "snapshot" in e]
+    ok = ("snapshot" in event and "estado_antes" not in events[5] and snapshots[0] == 1
+          and all(b - a <= SNAPSHOT_EVERY for a, b in zip(snapshots, snapshots[1:])))
+    ok &= all(store.state_at(1, event_id=i + 1) == (i + 1, state) for i, state in enumerate(states))
+    ok &= store.state_at(1, timestamp=1000 + 10 * 42 + 5) == (43, states[42])
+    ok &= store.state_at(1) == (len(states), states[-1]) and store.state_at(1, timestamp=999) == (None, None)
+    # Depois de reabrir, o próximo delta parte do último estado do log
+    store.append_change(1, {"tipo": "MUDANCA", "timestamp": 6000}, states[-1], dict(states[-1], renda=2.0))
+    ok &= store.state_at(1)[1] == dict(states[-1], renda=2.0)
+    store.close()
+    return ok
+
+
+if __name__ == "__main__":
+    checks = [
+        ("Partições por usuário (e global sem user_id)", check_partitions),
+        ("Linha final rasgada no .log é descartada", check_torn_log),
+        ("Registro parcial e entradas faltando no .idx são refeitos", check_torn_index),
+        ("Entradas do .idx além do fim do .log são descartadas", check_index_ahead),
+        ("Índice em formato antigo é reconstruído", check_old_index_format),
+        ("Arquivo legado importado uma vez, na partição do dono", check_legacy_import),
+        ("Deltas compactos; diff_state/apply_delta ida e volta", check_deltas),
+        ("state_at refaz cada estado a partir dos snapshots", check_state_at),
+    ]
+    failures = 0
+    for name, check in checks:
+        with tempfile.TemporaryDirectory() as tmp:
+            ok = check(tmp)
+        failures += not ok
+        print(f"[TEST] {name}: {'OK' if ok else 'FALHOU'}")
+
+    if failures:
+        print("[ERROR] history_store perdeu ou desalinhou eventos")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Acurácia e throughput do roteador de intenções contra o corpus rotulado.
+
+Compara com as checagens antigas (any(palavra in msg.lower() ...)) espalhadas
+por main.py, test_server.py e test_server_auth.py.
+
+    python test_intent_router.py
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from intent_router import Intent, message_router
+
+CORPUS_FILE = Path(__file__).parent / "lifeos_backend" / "intent_corpus.jsonl"
+MIN_ACCURACY = 0.9  # mensagens com o conjunto de intenções exatamente certo
+BENCH_ROUNDS = 200
+
+# Listas como estavam nos handlers antes do roteador
+LEGACY_KEYWORDS = {
+    Intent.FINANCE: ["dívida", "divida", "financeiro", "devo", "pagar", "débito", "cartão", "nubank", "credores"],
+    Intent.DEBT: ["divida", "dívida"],
+    Intent.FINANCE_AREA: ["financeiro"],
+    Intent.READ_FINANCE: ["como está", "o que tem", "mostre", "status", "meu financeiro"],
+    Intent.URGENCY: ["atrasado", "atraso", "juros", "vence", "urgente", "dias"],
+    Intent.OVERDUE: ["atrasado", "atraso", "juros", "urgente"],
+    Intent.DUE_SOON: ["vence", "próximo", "breve"],
+    Intent.CONFIRM: ["confirmo", "confirmar", "sim", "pode", "ok", "yes", "claro"],
+    Intent.DELETE: ["apagar", "remover", "excluir"],
+    Intent.ADD: ["adicionar", "criar", "nova"],
+    Intent.HISTORY: ["histórico", "extrato", "pago"],
+    Intent.STRATEGY: ["estratégia", "estrategia", "plano", "criar", "ajuda", "dividas"],
+    Intent.SAVE_VERB: ["adicione", "adiciona", "salve", "salva", "coloque", "coloca", "guarde", "guarda"],
+    Intent.SAVE_TARGET: ["financeiro", "página", "pagina", "controle", "estratégia", "estrategia", "plano"],
+    Intent.TASK: ["tarefa", "fazer", "preciso", "tenho que"],
+    Intent.ROUTINE: ["rotina", "acordar", "dormir", "sempre", "todo dia"],
+    Intent.CALENDAR: ["reunião", "reuniao", "evento", "compromisso", "amanhã", "hoje"],
+}
+
+
+def legacy_route(text):
+    lower = text.lower()
+    return {intent for intent, words in LEGACY_KEYWORDS.items() if any(word in lower for word in words)}
+
+
+def router_route(text):
+    return set(message_router.route(text).intents)
+
+
+def load_corpus():
+    with open(CORPUS_FILE, "r", encoding="utf-8") as f:
+        return [(row["text"], {Intent(i) for i in row["intents"]}) for row in map(json.loads, f) if row]
+
+
+def accuracy(route, corpus, show_errors=False):
+    hits = 0
+    for text, expected in corpus:
+        got = route(text)
+        if got == expected:
+            hits += 1
+        elif show_errors:
+            missing = sorted(i.value for i in expected - got)
+            extra = sorted(i.value for i in got - expected)
+            print(f"[ERRO] {text!r}: faltou {missing} sobrou {extra}")
+    return hits / len(corpus)
+
+
+def per_intent(route, corpus):
+    """(precision, recall) por intenção."""
+    scores = {}
+    for intent in Intent:
+        tp = fp = fn = 0
+        for text, expected in corpus:
+            got = intent in route(text)
+            want = intent in expected
+            tp += got and want
+            fp += got and not want
+            fn += want and not got
+        precision = tp / (tp + fp) if tp + fp else 1.0
+        recall = tp / (tp + fn) if tp + fn else 1.0
+        scores[intent] = (precision, recall)
+    return scores
+
+
+def throughput(route, texts):
+    started = time.perf_counter()
+    for _ in range(BENCH_ROUNDS):
+        for text in texts:
+            route(text)
+    elapsed = time.perf_counter() - started
+    return BENCH_ROUNDS * len(texts) / elapsed
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    print(f"[TEST] {len(corpus)} mensagens rotuladas")
+
+    router_acc = accuracy(router_route, corpus, show_errors=True)
+    legacy_acc = accuracy(legacy_route, corpus)
+    print(f"[TEST] Acurácia (conjunto exato): roteador {router_acc:.1%} | checagens antigas {legacy_acc:.1%}")
+
+    legacy_scores = per_intent(legacy_route, corpus)
+    for intent, (precision, recall) in per_intent(router_route, corpus).items():
+        old_p, old_r = legacy_scores[intent]
+        print(f"[TEST]   {intent.value:<13} P {precision:.2f} R {recall:.2f}   (antes P {old_p:.2f} R {old_r:.2f})")
+
+    texts = [text for text, _ in corpus]
+    # Uma chamada por handler que fazia as suas próprias varreduras
+    print(f"[BENCH] roteador (todas as intenções, 1 passada): {throughput(message_router.route, texts):,.0f} msg/s")
+    print(f"[BENCH] checagens antigas (todas as listas):      {throughput(legacy_route, texts):,.0f} msg/s")
+
+    if router_acc < MIN_ACCURACY or router_acc < legacy_acc:
+        print(f"[ERROR] Acurácia abaixo do mínimo ({MIN_ACCURACY:.0%}) ou pior que as checagens antigas")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
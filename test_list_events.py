@@ -1,6 +1,8 @@
-import json
+import sys
+sys.path.insert(0, 'lifeos_backend')
+from history_store import HistoryStore
 
-h = json.load(open('financeiro_history.json'))
-print(f'Total de eventos: {len(h["eventos"])}')
-for i, e in enumerate(h['eventos']):
+store = HistoryStore('financeiro_history')
+print(f'Total de eventos: {store.count(None)}')
+for i, e in enumerate(store.iter_events(None)):
     print(f'{i+1}. {e["tipo"]} - R$ {e.get("valor", 0)} - ts {e["timestamp"]}')
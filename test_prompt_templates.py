@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Equivalência, prefixo estável e microbenchmark da montagem do system prompt.
+
+Compara lifeos_system_message (templates compilados, estático primeiro, bloco
+financeiro memoizado na revisão) com a montagem antiga do build_context_messages,
+que refazia tudo com f-strings a cada turno e punha o resumo da conversa logo
+depois do prompt raiz.
+
+    python test_prompt_templates.py [seed]
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from prompt_templates import BlockCache, PromptTemplate, lifeos_system_message, next_revision
+from system_prompt import LIFEOS_SYSTEM_PROMPT
+
+CASES = 500
+TURNS = 20  # turnos seguidos com o mesmo estado financeiro
+BENCH_ROUNDS = 20
+BENCH_REPEATS = 5
+
+
+def legacy_parts(financeiro, context, memory_summary, history_summary):
+    """Partes do system prompt como o build_context_messages montava antes, na ordem antiga."""
+    system_parts = [LIFEOS_SYSTEM_PROMPT]
+    if memory_summary:
+        system_parts.append(f"Contexto da conversa: {memory_summary}")
+    if history_summary:
+        system_parts.append(f"Resumo das mensagens anteriores: {history_summary}")
+    if financeiro.faseAtual or financeiro.totalDivida or financeiro.focoAtual:
+        fin_parts = []
+        if financeiro.faseAtual:
+            fin_parts.append(f"Fase: {financeiro.faseAtual}")
+        if financeiro.totalDivida is not None:
+            fin_parts.append(f"Dívida total: R$ {financeiro.totalDivida:.2f}")
+        if financeiro.prazoAlvoMeses is not None:
+            fin_parts.append(f"Prazo: {financeiro.prazoAlvoMeses} meses")
+        if financeiro.ritmoMensal is not None:
+            fin_parts.append(f"Ritmo mensal: R$ {financeiro.ritmoMensal:.2f}")
+        if financeiro.ritmoDiario is not None:
+            fin_parts.append(f"Ritmo diário: R$ {financeiro.ritmoDiario:.2f}")
+        if financeiro.focoAtual:
+            fin_parts.append(f"Foco: {financeiro.focoAtual}")
+        system_parts.append(f"ESTRATÉGIA FINANCEIRA ATIVA: {'; '.join(fin_parts)}")
+    else:
+        system_parts.append("FINANCEIRO: Nenhuma estratégia definida ainda.")
+    if context:
+        rotina_list = context.get("routines", [])
+        rotina_text = (
+            "Rotina: vazia" if not rotina_list else f"Rotina: {', '.join([str(x) for x in rotina_list])}"
+        )
+        task_titles = [t.get("title") for t in context.get("tasks", []) if isinstance(t, dict)]
+        tasks_text = (
+            f"Tarefas: {', '.join([str(x) for x in task_titles])}" if task_titles else "Tarefas: nenhuma"
+        )
+        event_titles = [e.get("title") for e in context.get("calendar", []) if isinstance(e, dict)]
+        cal_text = (
+            f"Calendário: {', '.join([str(x) for x in event_titles])}" if event_titles else "Calendário: sem eventos"
+        )
+        system_parts.append(f"{rotina_text} | {tasks_text} | {cal_text}")
+    return system_parts
+
+
+def random_state():
+    debt = random.choice([None, 0.0, round(random.uniform(100, 50_000), 2)])
+    months = random.choice([None, random.randint(1, 36)])
+    monthly = debt / months if debt and months else None
+    return SimpleNamespace(
+        faseAtual=random.choice([None, 1, 2, 3, 4]),
+        totalDivida=debt,
+        prazoAlvoMeses=months,
+        ritmoMensal=monthly,
+        ritmoDiario=monthly / 30 if monthly else None,
+        focoAtual=random.choice([None, "", "Calcular ritmo", "Executar e repetir"]),
+        revision=next_revision(),
+    )
+
+
+def random_context():
+    if random.random() < 0.3:
+        return None
+    return {
+        "routines": random.sample(["academia", "leitura", "meditação", "estudo"], random.randint(0, 3)),
+        "tasks": [{"title": f"tarefa {i}"} for i in range(random.randint(0, 4))],
+        "calendar": [{"title": f"evento {i}"} for i in range(random.randint(0, 3))],
+    }
+
+
+def random_summary():
+    return random.choice(["", f"usuário quer quitar o cartão até {random.randint(1, 12)}/2027"])
+
+
+def check_equivalence(cases):
+    """Same blocks as the old assembly, reordered: static first, summaries last."""
+    failures = 0
+    blocks = BlockCache()
+    for financeiro, context, memory_summary, history_summary in cases:
+        parts = legacy_parts(financeiro, context, memory_summary, history_summary)
+        n_summaries = bool(memory_summary) + bool(history_summary)
+        expected = "\n\n".join([parts[0]] + parts[1 + n_summaries:] + parts[1:1 + n_summaries])
+        # 2ª vez sai do memo
+        for got in [lifeos_system_message(financeiro, context, memory_summary, history_summary, blocks)
+                    for _ in range(2)]:
+            if got != expected:
+                failures += 1
+                print(f"[FAIL] {financeiro}: {got[len(LIFEOS_SYSTEM_PROMPT):]!r} != {expected[len(LIFEOS_SYSTEM_PROMPT):]!r}")
+    return failures
+
+
+def common_prefix(texts):
+    first = texts[0]
+    size = len(first)
+    for text in texts[1:]:
+        size = min(size, len(text))
+        while not text.startswith(first[:size]):
+            size -= 1
+    return size
+
+
+def check_memo():
+    blocks = BlockCache()
+    state = random_state()
+    state.totalDivida, state.focoAtual = 1000.0, "Parar sangria"
+    first = lifeos_system_message(state, None, "", "", blocks)
+    state.totalDivida = 500.0  # mudança sem gravar: mesma revisão, bloco memoizado
+    stale = lifeos_system_message(state, None, "", "", blocks)
+    state.revision = next_revision()  # save_financeiro carimba uma revisão nova
+    fresh = lifeos_system_message(state, None, "", "", blocks)
+    stats = blocks.stats()
+    return (first == stale and "R$ 500.00" in fresh and "R$ 1000.00" in first
+            and stats["hits"] == 1 and stats["misses"] == 2)
+
+
+def throughput(fn, cases):
+    """Calls per second, best of BENCH_REPEATS runs (the least disturbed by the rest of the machine)."""
+    best = float("inf")
+    for _ in range(BENCH_REPEATS):
+        started = time.perf_counter()
+        for _ in range(BENCH_ROUNDS):
+            for case in cases:
+                fn(*case)
+        best = min(best, time.perf_counter() - started)
+    return BENCH_ROUNDS * len(cases) / best
+
+
+if __name__ == "__main__":
+    random.seed(int(sys.argv[1]) if len(sys.argv) > 1 else 1234)
+
+    template = PromptTemplate("Fixo.\n\nDADOS:\n{dados} e {mais:.2f}")
+    template_ok = (template.fields == {"dados", "mais"} and template.static_prefix == "Fixo.\n\nDADOS:\n"
+                   and template.render(dados="x", mais=1) == "Fixo.\n\nDADOS:\nx e 1.00")
+    print(f"[TEST] PromptTemplate (campos, prefixo estático, render): {'OK' if template_ok else 'FALHOU'}")
+
+    cases = [(random_state(), random_context(), random_summary(), random_summary()) for _ in range(CASES)]
+    failures = check_equivalence(cases)
+    print(f"[TEST] Mesmos blocos da montagem antiga: {2 * CASES - failures}/{2 * CASES}")
+
+    memo_ok = check_memo()
+    print(f"[TEST] Memo do bloco financeiro por revisão: {'OK' if memo_ok else 'FALHOU'}")
+
+    # Conversa: estado e contexto fixos, resumos mudando a cada turno
+    financeiro, context = random_state(), random_context()
+    financeiro.totalDivida, financeiro.focoAtual = 12_000.0, "Executar e repetir"
+    turns = [(financeiro, context, f"resumo do turno {i}", f"mensagens antigas até {i}") for i in range(TURNS)]
+    new_prefix = common_prefix([lifeos_system_message(*turn) for turn in turns])
+    old_prefix = common_prefix(["\n\n".join(legacy_parts(*turn)) for turn in turns])
+    print(f"[TEST] Prefixo igual em {TURNS} turnos: novo {new_prefix} chars | antigo {old_prefix} chars")
+
+    blocks = BlockCache()
+    conversation = [turns[i % TURNS] for i in range(CASES)]
+    memo_rate = throughput(lambda *c: lifeos_system_message(*c, blocks=blocks), conversation)
+    legacy_rate = throughput(lambda *c: "\n\n".join(legacy_parts(*c)), conversation)
+    memo_faster = memo_rate > legacy_rate
+    print(f"[BENCH] system prompt (turnos com o mesmo estado): templates + memo {memo_rate:,.0f}/s | f-strings {legacy_rate:,.0f}/s "
+          f"{'OK' if memo_faster else 'FALHOU'}")
+    new_rate = throughput(lambda *c: lifeos_system_message(*c, blocks=blocks), cases)
+    old_rate = throughput(lambda *c: "\n\n".join(legacy_parts(*c)), cases)
+    print(f"[BENCH] system prompt (estados variados):          templates + memo {new_rate:,.0f}/s | f-strings {old_rate:,.0f}/s")
+
+    if not template_ok or failures or not memo_ok or new_prefix <= old_prefix or not memo_faster:
+        print("[ERROR] Montagem do prompt divergiu da antiga, perdeu o prefixo estável ou o memo não compensou")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
@@ -1,35 +1,99 @@
 #!/usr/bin/env python3
 """Backend mínimo - Fonte única de verdade: lifeos_state.json + financeiro_history.json"""
 
-from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from pathlib import Path
 from datetime import datetime, timedelta
-import json
-import re
-import sqlite3
-import bcrypt
 import jwt
 import os
-import requests
+import sys
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from history_store import HistoryStore
+from state_store import JsonStateCache
+from json_writer import writer as json_writer
+from db_pool import ConnectionPool
+from migrations import apply_migrations, audit_queries
+from cache import TTLCache
+from token_auth import RevocationList, TokenVerifier
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from llm_gateway import LLMGateway
+from llm_cache import LLMResponseCache
+from intent_router import Intent, route_message
+from financial_extractor import BackgroundExtractor, FinancialFacts
+from strategy_parser import parse_strategy
+from context_budget import ContextBudgeter, llm_summarizer
+from prompt_templates import PromptTemplate, next_revision, prompt_blocks
+from sse import MarkerFilter, SSE_HEADERS, sse_event
+import structured_log
+from structured_log import RequestIdMiddleware, get_logger
+
 # Carregar variáveis do arquivo .env
 load_dotenv()
+structured_log.configure()
+
+log = get_logger("chat")
+db_log = get_logger("db")
+history_log = get_logger("history")
+auth_log = get_logger("auth")
+finance_log = get_logger("financeiro")
+extract_log = get_logger("extract")
+interaction_log = get_logger("interaction")
+server_log = get_logger("server")
 
 STATE_FILE = Path("lifeos_state.json")
-HISTORY_FILE = Path("financeiro_history.json")
+HISTORY_FILE = Path("financeiro_history.json")  # legado, importado para HISTORY_DIR
+HISTORY_DIR = Path("financeiro_history")
 DB_FILE = Path("lifeos_users.db")
+DB_POOL_SIZE = 8
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60  # segundos; flags mudadas por /auth/* invalidam antes disso
+REVOKED_TOKENS_FILE = Path("revoked_tokens.json")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "32"))
+HISTORY_PAGE_LIMIT = 50
+HISTORY_REPLY_LIMIT = 10
 SECRET_KEY = "lifeos-secret-key-change-in-production"
 ALGORITHM = "HS256"
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")  # ex.: llm_cache.db para persistir entre restarts
+CHAT_MODEL = "gpt-3.5-turbo"
+CONTEXT_BUDGET = int(os.getenv("CONTEXT_BUDGET", "1500"))  # tokens de histórico por prompt
+HISTORY_LIMIT = 40  # mensagens carregadas por turno; o orçamento decide quantas vão para a IA
 
 security = HTTPBearer()
 
-app = FastAPI()
+# Um cliente HTTP (keep-alive, HTTP/2 se disponível) para toda a vida do processo
+llm_gateway = LLMGateway(OPENROUTER_API_KEY, OPENROUTER_URL)
+# Respostas da IA por usuário + payload; um hit não chama o OpenRouter
+llm_cache = LLMResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL, Path(LLM_CACHE_DB) if LLM_CACHE_DB else None)
+# Histórico dentro de CONTEXT_BUDGET tokens; o que sai da janela vira resumo rolante por usuário
+context_budgeter = ContextBudgeter(
+    CONTEXT_BUDGET, summarize=llm_summarizer(llm_gateway, CHAT_MODEL) if OPENROUTER_API_KEY else None
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await llm_gateway.start(warmup=bool(OPENROUTER_API_KEY))
+    yield
+    await context_budgeter.aclose()
+    await llm_gateway.aclose()
+    llm_cache.close()
+    fact_extractor.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -46,12 +110,15 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=600,
 )
+app.add_middleware(RequestIdMiddleware)
+
+db_pool = ConnectionPool(DB_FILE, size=DB_POOL_SIZE)
 
 # Database initialization
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
+# Migrações versionadas: só acrescente no final, nunca edite uma já publicada
+MIGRATIONS = [
+    (1, "tabelas iniciais", [
+        """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT UNIQUE NOT NULL,
@@ -60,8 +127,8 @@ def init_db():
             consultation_started INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    cursor.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS user_financial_profile (
             user_id INTEGER PRIMARY KEY,
             income REAL DEFAULT 0,
@@ -71,8 +138,8 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
-    """)
-    cursor.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS user_debts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -82,8 +149,8 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
-    """)
-    cursor.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS chat_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -92,13 +159,84 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
-    """)
-    conn.commit()
-    conn.close()
-    print(f"[DB] Database initialized: {DB_FILE}")
+        """,
+    ]),
+    (2, "índices do caminho quente (histórico do chat e dívidas por usuário)", [
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_user_created ON chat_history (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_debts_user ON user_debts (user_id)",
+    ]),
+    (3, "extração financeira incremental (marca d'água + fatos parciais por usuário)", [
+        """
+        CREATE TABLE IF NOT EXISTS financial_facts (
+            user_id INTEGER PRIMARY KEY,
+            last_message_id INTEGER NOT NULL DEFAULT 0,
+            income REAL DEFAULT 0,
+            expenses REAL DEFAULT 0,
+            debts TEXT NOT NULL DEFAULT '[]',
+            numbers TEXT NOT NULL DEFAULT '[]',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history (user_id, id)",
+    ]),
+    (4, "estratégias versionadas, parseadas na chegada; o perfil aponta para a salva", [
+        """
+        CREATE TABLE IF NOT EXISTS strategies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            analysis TEXT NOT NULL DEFAULT '',
+            steps TEXT NOT NULL DEFAULT '',
+            monthly_focus TEXT NOT NULL DEFAULT '',
+            daily_goal TEXT NOT NULL DEFAULT '',
+            text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, version),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        # Sobrescrever o perfil (onboarding, consultoria) zera o ponteiro: o savings_goal novo vale
+        "ALTER TABLE user_financial_profile ADD COLUMN strategy_id INTEGER REFERENCES strategies (id)",
+    ]),
+    (5, "revisão do perfil financeiro, carimbada a cada gravação de renda/despesas/dívidas", [
+        "ALTER TABLE user_financial_profile ADD COLUMN revision INTEGER NOT NULL DEFAULT 0",
+    ]),
+]
+
+# Consultas dos endpoints auditadas com EXPLAIN QUERY PLAN na subida
+HOT_QUERIES = {
+    "chat_history recente": (
+        "SELECT id, role, content FROM chat_history WHERE user_id = ? ORDER BY created_at DESC LIMIT 40", (0,)),
+    "chat_history do assistente": (
+        "SELECT content FROM chat_history WHERE user_id = ? AND role = 'assistant' ORDER BY created_at DESC LIMIT 10", (0,)),
+    "chat_history depois da marca d'água": (
+        "SELECT id, content, role FROM chat_history WHERE user_id = ? AND id > ? ORDER BY id", (0, 0)),
+    "fatos financeiros": (
+        "SELECT last_message_id, income, expenses, debts, numbers FROM financial_facts WHERE user_id = ?", (0,)),
+    "dívidas do usuário": ("SELECT id, name, amount FROM user_debts WHERE user_id = ?", (0,)),
+    "perfil financeiro": (
+        "SELECT p.income, p.expenses, p.has_debts, COALESCE(s.text, p.savings_goal) FROM user_financial_profile p "
+        "LEFT JOIN strategies s ON s.id = p.strategy_id WHERE p.user_id = ?", (0,)),
+    "última estratégia": (
+        "SELECT id FROM strategies WHERE user_id = ? ORDER BY version DESC LIMIT 1", (0,)),
+    "usuário por email": (
+        "SELECT id, email, password_hash, onboarding_completed, consultation_started FROM users WHERE email = ?", ("",)),
+    "usuário por id": ("SELECT id, email, onboarding_completed, consultation_started FROM users WHERE id = ?", (0,)),
+}
+
+def init_db():
+    with db_pool.connection() as conn:
+        apply_migrations(conn, MIGRATIONS)
+        audit_queries(conn, HOT_QUERIES)
+    db_log.info("Banco inicializado", file=str(DB_FILE), schema=MIGRATIONS[-1][0])
 
 init_db()
 
+history_store = HistoryStore(HISTORY_DIR)
+if history_store.import_legacy(HISTORY_FILE):
+    HISTORY_FILE.rename(HISTORY_FILE.with_name(HISTORY_FILE.name + ".imported"))
+
 # Auth helpers
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -106,12 +244,11 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# Tokens verificados ficam em cache até o exp; /auth/logout revoga
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM, RevocationList(REVOKED_TOKENS_FILE))
+
 def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except:
-        return None
+    return token_verifier.verify(token)
 
 def get_current_user(request: Request):
     auth_header = request.headers.get("Authorization")
@@ -125,6 +262,39 @@ def get_current_user(request: Request):
     
     return payload
 
+# Usuários resolvidos pelo claim user_id do JWT (assinado), com flags em cache
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def get_user(user_id: int) -> dict | None:
+    """id, email e flags do usuário; None se não existe (ex.: token de usuário removido)."""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    with db_pool.connection() as conn:
+        row = conn.execute(
+            "SELECT id, email, onboarding_completed, consultation_started FROM users WHERE id = ?",
+            (user_id,)
+        ).fetchone()
+    if not row:
+        return None
+    user = {
+        "id": row[0],
+        "email": row[1],
+        "onboarding_completed": bool(row[2]),
+        "consultation_started": bool(row[3]),
+    }
+    user_cache.set(user_id, user)
+    return user
+
+def invalidate_user(user_id: int):
+    user_cache.invalidate(user_id)
+
+# bcrypt roda num pool próprio: login em massa não ocupa o threadpool dos outros endpoints
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_MAX_PENDING)
+
+def hasher_busy():
+    return HTTPException(status_code=503, detail="Servidor ocupado, tente novamente", headers={"Retry-After": "1"})
+
 # Pydantic models
 class SignupRequest(BaseModel):
     email: str
@@ -143,64 +313,49 @@ class OnboardingData(BaseModel):
     control_level: str = ""
     savingsGoal: str = ""
 
-def load_state():
-    if not STATE_FILE.exists():
-        return {
-            "financeiro": {
-                "fase": 1,
-                "dividas": [],
-                "foco": "Parar sangria",
-                "ultima_atualizacao": None,
-            }
+def default_state():
+    return {
+        "financeiro": {
+            "fase": 1,
+            "dividas": [],
+            "foco": "Parar sangria",
+            "ultima_atualizacao": None,
         }
-    with open(STATE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    }
 
 
-def save_state(state: dict):
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+state_cache = JsonStateCache(STATE_FILE, default_state)
 
 
-def load_history():
-    if not HISTORY_FILE.exists():
-        return {"eventos": []}
-    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+def load_state():
+    return state_cache.load()
 
 
-def save_history(history: dict):
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+def save_state(state: dict):
+    state_cache.save(state)
 
 
-def record_event(tipo: str, valor: float | None, descricao: str, estado_antes: dict, estado_depois: dict):
+def load_history(user_id=None):
+    return history_store.load(user_id)
+
+
+def record_event(tipo: str, valor: float | None, descricao: str, estado_antes: dict, estado_depois: dict, user_id=None):
     """Registra um evento IMUTÁVEL no histórico após confirmar mudança real."""
-    history = load_history()
-    if not history.get("eventos"):
-        history["eventos"] = []
-    
-    event_id = (history["eventos"][-1].get("id", 0) + 1) if history["eventos"] else 1
-    
-    event = {
-        "id": event_id,
-        "tipo": tipo,
-        "valor": valor,
-        "descricao": descricao,
-        "timestamp": current_ts(),
-        "estado_antes": estado_antes.get("financeiro", {}),
-        "estado_depois": estado_depois.get("financeiro", {}),
-    }
-    
-    history["eventos"].append(event)
-    save_history(history)
-    print(f"[HISTORY] Evento registrado: {tipo} (id={event_id})")
+    event = history_store.append_change(
+        user_id,
+        {"tipo": tipo, "valor": valor, "descricao": descricao, "timestamp": current_ts()},
+        estado_antes.get("financeiro", {}),
+        estado_depois.get("financeiro", {}),
+    )
+    history_log.info("Evento registrado", user_id=user_id, tipo=tipo, id=event["id"])
 
 
-def format_history_reply():
-    """Formata histórico para resposta amigável."""
-    history = load_history()
-    eventos = history.get("eventos", [])
+def format_history_reply(user_id=None, before_id: int | None = None):
+    """Formata os últimos eventos do histórico para resposta amigável."""
+    if before_id:
+        eventos, cursor = history_store.query(user_id, before_id=before_id, limit=HISTORY_REPLY_LIMIT)
+    else:
+        eventos, cursor = history_store.tail(user_id, HISTORY_REPLY_LIMIT)
     
     if not eventos:
         return "Nenhum evento financeiro registrado até agora."
@@ -221,6 +376,9 @@ def format_history_reply():
         else:
             lines.append(f"{data_fmt} - {tipo}: R${valor:.2f}" if valor else f"{data_fmt} - {tipo}")
     
+    if cursor:
+        lines.append(f"Ver mais: peça \"histórico antes de #{cursor}\"")
+    
     return "\n".join(lines)
 
 
@@ -290,13 +448,12 @@ def remove_divida(valor: float | None = None, id: int | None = None):
 
 
 def log_interaction(intention: str, action: str, before: dict, after: dict, success: bool, error: str | None = None):
-    print("\n[DEBUG] intenção:", intention)
-    print("[DEBUG] action:", action)
-    print("[DEBUG] sucesso:", success)
-    if error:
-        print("[DEBUG] erro:", error)
-    print("[DEBUG] estado_antes:", json.dumps(before, ensure_ascii=False))
-    print("[DEBUG] estado_depois:", json.dumps(after, ensure_ascii=False))
+    # Estados inteiros só com debug ligado; a serialização fica com a thread de log
+    if interaction_log.enabled():
+        interaction_log.debug("Interação", intention=intention, action=action, success=success, error=error,
+                              before=before, after=after)
+    else:
+        interaction_log.info("Interação", intention=intention, action=action, success=success, error=error)
 
 
 class ChatRequest(BaseModel):
@@ -305,34 +462,32 @@ class ChatRequest(BaseModel):
 
 # Auth endpoints
 @app.post("/auth/signup")
-def signup(data: SignupRequest):
-    print(f"[SIGNUP] Email: {data.email}")
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+async def signup(data: SignupRequest):
+    auth_log.debug("Signup", email=data.email)
     
     # Check if user exists
-    cursor.execute("SELECT id FROM users WHERE email = ?", (data.email,))
-    if cursor.fetchone():
-        conn.close()
-        raise HTTPException(status_code=400, detail="Email already registered")
+    with db_pool.connection() as conn:
+        if conn.execute("SELECT id FROM users WHERE email = ?", (data.email,)).fetchone():
+            raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Hash password
-    password_hash = bcrypt.hashpw(data.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    # Hash password (fora do checkout: bcrypt é lento e não precisa da conexão)
+    try:
+        password_hash = await password_hasher.hash(data.password)
+    except PasswordHasherBusy:
+        raise hasher_busy()
     
     # Create user
-    cursor.execute(
-        "INSERT INTO users (email, password_hash) VALUES (?, ?)",
-        (data.email, password_hash)
-    )
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with db_pool.connection() as conn:
+        cursor = conn.execute(
+            "INSERT INTO users (email, password_hash) VALUES (?, ?)",
+            (data.email, password_hash)
+        )
+        user_id = cursor.lastrowid
     
     # Create token
     token = create_access_token({"user_id": user_id, "email": data.email})
     
-    print(f"[SIGNUP] User created: {user_id}")
+    auth_log.info("Usuário criado", user_id=user_id)
     return {
         "token": token,
         "user": {
@@ -344,18 +499,14 @@ def signup(data: SignupRequest):
     }
 
 @app.post("/auth/login")
-def login(data: LoginRequest):
-    print(f"[LOGIN] Email: {data.email}")
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+async def login(data: LoginRequest):
+    auth_log.debug("Login", email=data.email)
     
-    cursor.execute(
-        "SELECT id, email, password_hash, onboarding_completed, consultation_started FROM users WHERE email = ?",
-        (data.email,)
-    )
-    row = cursor.fetchone()
-    conn.close()
+    with db_pool.connection() as conn:
+        row = conn.execute(
+            "SELECT id, email, password_hash, onboarding_completed, consultation_started FROM users WHERE email = ?",
+            (data.email,)
+        ).fetchone()
     
     if not row:
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -363,13 +514,34 @@ def login(data: LoginRequest):
     user_id, email, password_hash, onboarding_completed, consultation_started = row
     
     # Verify password
-    if not bcrypt.checkpw(data.password.encode('utf-8'), password_hash.encode('utf-8')):
+    try:
+        valid = await password_hasher.verify(data.password, password_hash)
+    except PasswordHasherBusy:
+        raise hasher_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Custo do bcrypt mudou desde o cadastro: regrava o hash com o custo atual
+    if password_hasher.needs_rehash(password_hash):
+        try:
+            new_hash = await password_hasher.rehash(data.password)
+        except PasswordHasherBusy:
+            new_hash = None  # fica para o próximo login
+        if new_hash:
+            with db_pool.connection() as conn:
+                conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user_id))
+            auth_log.info("Hash atualizado", user_id=user_id, rounds=password_hasher.rounds)
+    
     # Create token
     token = create_access_token({"user_id": user_id, "email": email})
+    user_cache.set(user_id, {
+        "id": user_id,
+        "email": email,
+        "onboarding_completed": bool(onboarding_completed),
+        "consultation_started": bool(consultation_started),
+    })
     
-    print(f"[LOGIN] Success: {user_id}")
+    auth_log.info("Login ok", user_id=user_id)
     return {
         "token": token,
         "user": {
@@ -385,30 +557,22 @@ def get_me(request: Request):
     user = get_current_user(request)
     user_id = user["user_id"]
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT id, email, onboarding_completed, consultation_started FROM users WHERE id = ?",
-        (user_id,)
-    )
-    row = cursor.fetchone()
-    conn.close()
-    
+    row = get_user(user_id)
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_id, email, onboarding_completed, consultation_started = row
-    
     return {
-        "id": user_id,
-        "email": email,
-        "onboardingCompleted": bool(onboarding_completed),
-        "consultationStarted": bool(consultation_started)
+        "id": row["id"],
+        "email": row["email"],
+        "onboardingCompleted": row["onboarding_completed"],
+        "consultationStarted": row["consultation_started"]
     }
 
 @app.post("/auth/logout")
-def logout():
+def logout(request: Request):
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        token_verifier.revoke(auth_header.replace("Bearer ", ""))
     return {"message": "Logged out successfully"}
 
 @app.post("/auth/onboarding")
@@ -416,37 +580,33 @@ def complete_onboarding(data: OnboardingData, request: Request):
     user = get_current_user(request)
     user_id = user["user_id"]
     
-    print(f"[ONBOARDING] User {user_id}: income={data.monthly_income}, expenses={data.fixed_expenses}")
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    auth_log.debug("Onboarding", user_id=user_id, income=data.monthly_income, expenses=data.fixed_expenses)
     
-    # Save financial profile
-    cursor.execute("""
-        INSERT OR REPLACE INTO user_financial_profile 
-        (user_id, income, expenses, has_debts, savings_goal)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_id, data.monthly_income, data.fixed_expenses, int(data.has_debts), data.savingsGoal))
-    
-    # Save debts
-    if data.has_debts and data.debts:
-        cursor.execute("DELETE FROM user_debts WHERE user_id = ?", (user_id,))
-        for debt in data.debts:
-            cursor.execute("""
+    with db_pool.connection() as conn:
+        # Save financial profile
+        conn.execute("""
+            INSERT OR REPLACE INTO user_financial_profile 
+            (user_id, income, expenses, has_debts, savings_goal, revision)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, data.monthly_income, data.fixed_expenses, int(data.has_debts), data.savingsGoal,
+              next_revision()))
+        
+        # Save debts
+        if data.has_debts and data.debts:
+            conn.execute("DELETE FROM user_debts WHERE user_id = ?", (user_id,))
+            conn.executemany("""
                 INSERT INTO user_debts (user_id, name, amount, interest_rate)
                 VALUES (?, ?, ?, ?)
-            """, (user_id, debt.get("name", ""), debt.get("amount", 0), debt.get("interestRate", 0)))
-    
-    # Mark onboarding as complete
-    cursor.execute(
-        "UPDATE users SET onboarding_completed = 1 WHERE id = ?",
-        (user_id,)
-    )
-    
-    conn.commit()
-    conn.close()
+            """, [(user_id, debt.get("name", ""), debt.get("amount", 0), debt.get("interestRate", 0)) for debt in data.debts])
+        
+        # Mark onboarding as complete
+        conn.execute(
+            "UPDATE users SET onboarding_completed = 1 WHERE id = ?",
+            (user_id,)
+        )
+    invalidate_user(user_id)
     
-    print(f"[ONBOARDING] Complete for user {user_id}")
+    auth_log.info("Onboarding concluído", user_id=user_id)
     return {"message": "Onboarding completed", "success": True}
 
 @app.post("/auth/mark-consultation-started")
@@ -454,25 +614,38 @@ def mark_consultation_started(request: Request):
     user = get_current_user(request)
     user_id = user["user_id"]
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "UPDATE users SET consultation_started = 1 WHERE id = ?",
-        (user_id,)
-    )
-    
-    conn.commit()
-    conn.close()
+    with db_pool.connection() as conn:
+        conn.execute(
+            "UPDATE users SET consultation_started = 1 WHERE id = ?",
+            (user_id,)
+        )
+    invalidate_user(user_id)
     
-    print(f"[CONSULTATION] Marked as started for user {user_id}")
+    auth_log.info("Consultoria iniciada", user_id=user_id)
     return {"message": "Consultation started", "success": True}
 
 @app.get("/health")
 def health():
-    print("[HEALTH] Called")
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    """Contadores internos (latência de commit, cache de estado, pool do SQLite)."""
+    return {
+        "json_writer": json_writer.stats(),
+        "state_cache": state_cache.stats(),
+        "db_pool": db_pool.stats(),
+        "user_cache": user_cache.stats(),
+        "token_cache": token_verifier.stats(),
+        "password_hasher": password_hasher.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "llm_cache": llm_cache.stats(),
+        "financial_extractor": fact_extractor.stats(),
+        "context_budget": context_budgeter.stats(),
+        "prompt_blocks": prompt_blocks.stats(),
+        "logging": structured_log.stats(),
+    }
+
 @app.get("/financeiro")
 def financeiro(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Retorna dados financeiros do usuário autenticado"""
@@ -482,34 +655,28 @@ def financeiro(credentials: HTTPAuthorizationCredentials = Depends(security)):
         if not payload:
             raise HTTPException(status_code=401, detail="Token inválido")
         
-        user_email = payload.get("email")  # Extrair email do payload
-        
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Buscar user_id
-        cursor.execute("SELECT id FROM users WHERE email = ?", (user_email,))
-        user_row = cursor.fetchone()
-        if not user_row:
-            conn.close()
+        # user_id vem do claim assinado; o cache só confirma que o usuário existe
+        user_id = payload.get("user_id")
+        if not get_user(user_id):
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
         
-        user_id = user_row[0]
+        # Extração da consultoria roda em segundo plano: ler depois dela
+        fact_extractor.wait(user_id)
         
-        # Buscar perfil financeiro
-        cursor.execute("""
-            SELECT income, expenses, has_debts, savings_goal
-            FROM user_financial_profile WHERE user_id = ?
-        """, (user_id,))
-        profile = cursor.fetchone()
-        
-        # Buscar dívidas
-        cursor.execute("""
-            SELECT id, name, amount FROM user_debts WHERE user_id = ?
-        """, (user_id,))
-        debts_rows = cursor.fetchall()
-        
-        conn.close()
+        with db_pool.connection() as conn:
+            # Buscar perfil financeiro
+            # savings_goal: a estratégia salva (ponteiro), senão o texto do perfil
+            profile = conn.execute("""
+                SELECT p.income, p.expenses, p.has_debts, COALESCE(s.text, p.savings_goal)
+                FROM user_financial_profile p
+                LEFT JOIN strategies s ON s.id = p.strategy_id
+                WHERE p.user_id = ?
+            """, (user_id,)).fetchone()
+            
+            # Buscar dívidas
+            debts_rows = conn.execute("""
+                SELECT id, name, amount FROM user_debts WHERE user_id = ?
+            """, (user_id,)).fetchall()
         
         if not profile:
             # Usuário sem consultoria ainda
@@ -551,10 +718,10 @@ def financeiro(credentials: HTTPAuthorizationCredentials = Depends(security)):
             "ultima_atualizacao": int(datetime.now().timestamp() * 1000)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[ERROR] {e}")
-        import traceback
-        traceback.print_exc()
+        finance_log.exception("Erro ao ler dados financeiros")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/financeiro/atualizar")
@@ -565,355 +732,232 @@ async def atualizar_financeiro(request: Request):
     
     try:
         data = await request.json()
-        print(f"[UPDATE] Atualizando dados do user {user_id}: {data}")
-        
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Preservar a estratégia existente (savings_goal) ao atualizar valores
-        cursor.execute(
-            "SELECT savings_goal FROM user_financial_profile WHERE user_id = ?",
-            (user_id,)
-        )
-        row = cursor.fetchone()
-        monthly_income = data.get("monthly_income", 0)
-        total_expenses = data.get("fixed_expenses", 0) + data.get("variable_expenses", 0)
-        has_debts = int(data.get("has_debts", False))
+        finance_log.debug("Atualizando dados", user_id=user_id, data=data)
         
-        if row is not None:
-            # Atualiza somente números, mantém savings_goal
-            cursor.execute(
-                """
-                UPDATE user_financial_profile
-                SET income = ?, expenses = ?, has_debts = ?
-                WHERE user_id = ?
-                """,
-                (monthly_income, total_expenses, has_debts, user_id)
-            )
-        else:
-            # Cria registro novo sem sobrescrever estratégia futura
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Preservar a estratégia existente (savings_goal) ao atualizar valores
             cursor.execute(
-                """
-                INSERT INTO user_financial_profile
-                (user_id, income, expenses, has_debts, savings_goal)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (user_id, monthly_income, total_expenses, has_debts, "")
+                "SELECT savings_goal FROM user_financial_profile WHERE user_id = ?",
+                (user_id,)
             )
+            row = cursor.fetchone()
+            monthly_income = data.get("monthly_income", 0)
+            total_expenses = data.get("fixed_expenses", 0) + data.get("variable_expenses", 0)
+            has_debts = int(data.get("has_debts", False))
         
-        # Atualizar dívidas
-        cursor.execute("DELETE FROM user_debts WHERE user_id = ?", (user_id,))
-        for debt in data.get("debts", []):
-            cursor.execute("""
-                INSERT INTO user_debts (user_id, name, amount)
-                VALUES (?, ?, ?)
-            """, (user_id, debt["name"], debt["amount"]))
+            if row is not None:
+                # Atualiza somente números, mantém savings_goal
+                cursor.execute(
+                    """
+                    UPDATE user_financial_profile
+                    SET income = ?, expenses = ?, has_debts = ?, revision = ?
+                    WHERE user_id = ?
+                    """,
+                    (monthly_income, total_expenses, has_debts, next_revision(), user_id)
+                )
+            else:
+                # Cria registro novo sem sobrescrever estratégia futura
+                cursor.execute(
+                    """
+                    INSERT INTO user_financial_profile
+                    (user_id, income, expenses, has_debts, savings_goal, revision)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (user_id, monthly_income, total_expenses, has_debts, "", next_revision())
+                )
         
-        conn.commit()
-        conn.close()
+            # Atualizar dívidas
+            cursor.execute("DELETE FROM user_debts WHERE user_id = ?", (user_id,))
+            for debt in data.get("debts", []):
+                cursor.execute("""
+                    INSERT INTO user_debts (user_id, name, amount)
+                    VALUES (?, ?, ?)
+                """, (user_id, debt["name"], debt["amount"]))
         
-        print(f"[UPDATE] Dados atualizados para user {user_id}")
+        finance_log.info("Dados atualizados", user_id=user_id)
         return {"success": True, "message": "Dados atualizados com sucesso"}
     except Exception as e:
-        print(f"[ERROR] Erro ao atualizar: {e}")
-        import traceback
-        traceback.print_exc()
+        finance_log.exception("Erro ao atualizar", user_id=user_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/financeiro/historico")
-def financeiro_historico():
-    print("[HISTORY] Reading financeiro_history.json")
-    history = load_history()
-    return history
-
-def extract_and_save_financial_data(user_id):
-    """Extrai dados financeiros da conversa de consultoria e salva no banco"""
-    import re
-    
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Carregar histórico de chat em ordem cronológica
-        cursor.execute("""
-            SELECT content, role FROM chat_history 
-            WHERE user_id = ? 
-            ORDER BY created_at ASC
-        """, (user_id,))
-        messages = [(row[0], row[1]) for row in cursor.fetchall()]
-        
-        income = 0
-        expenses = 0
-        debts = []
-        
-        # Processar mensagens do usuário para extrair dados
-        for content, role in messages:
-            if role == "user":
-                # Procura por menção de RENDA (com keywords)
-                renda_match = re.search(r'(?:renda|ganho|salário|recebo|ganho)\s+(?:de\s+)?(?:um?|R\$)?\s*(\d+(?:[.,]\d{2})?)', content, re.IGNORECASE)
-                if renda_match and income == 0:
-                    income = float(renda_match.group(1).replace(',', '.'))
-                    print(f"[EXTRACT] Renda encontrada: {income}")
-                
-                # Procura por DESPESAS TOTAIS
-                despesa_match = re.search(r'(?:despesa|gasto|total.*gasto|custo)\s+(?:total|fixa|d)?(?:.*?)(?:de\s+|é\s+)?(?:R\$)?\s*(\d+(?:[.,]\d{2})?)', content, re.IGNORECASE)
-                if despesa_match and expenses == 0:
-                    expenses = float(despesa_match.group(1).replace(',', '.'))
-                    print(f"[EXTRACT] Despesa encontrada: {expenses}")
-                
-                # Se não encontrou com keywords, tenta extrair números do contexto
-                if income == 0 and ('renda' in content.lower() or 'ganho' in content.lower() or 'recebo' in content.lower()):
-                    nums = re.findall(r'(\d+(?:[.,]\d{2})?)', content)
-                    if nums:
-                        income = float(nums[0].replace(',', '.'))
-                        print(f"[EXTRACT] Renda (fallback): {income}")
-                
-                # Procura dívidas mencionadas (cartão, multa, etc)
-                debt_patterns = [
-                    r'(?:cartão|nubank).*?(\d+(?:[.,]\d{2})?)',
-                    r'(?:multa).*?(\d+(?:[.,]\d{2})?)',
-                    r'(?:empréstim).*?(\d+(?:[.,]\d{2})?)',
-                    r'(?:dívida?).*?(\d+(?:[.,]\d{2})?)',
-                ]
-                
-                for pattern in debt_patterns:
-                    debt_match = re.search(pattern, content, re.IGNORECASE)
-                    if debt_match:
-                        amount = float(debt_match.group(1).replace(',', '.'))
-                        if amount > 0 and not any(d['amount'] == amount for d in debts):
-                            debts.append({"name": "Dívida", "amount": amount})
-                            print(f"[EXTRACT] Dívida encontrada: {amount}")
-        
-        # Fallback: se não encontrou nada, procura pelos números maiores
-        if income == 0 or expenses == 0:
-            all_text = " ".join([c for c, r in messages])
-            numbers = []
-            for match in re.finditer(r'(\d+(?:[.,]\d{2})?)', all_text):
-                try:
-                    num = float(match.group(1).replace(',', '.'))
-                    if num > 0:
-                        numbers.append(num)
-                except:
-                    pass
-            
-            # Remover duplicatas mantendo ordem
-            unique_numbers = []
-            for n in numbers:
-                if n not in unique_numbers:
-                    unique_numbers.append(n)
-            
-            if income == 0 and len(unique_numbers) > 0:
-                income = unique_numbers[0]
-                print(f"[EXTRACT] Renda (último recurso): {income}")
-            
-            if expenses == 0 and len(unique_numbers) > 1:
-                expenses = unique_numbers[1]
-                print(f"[EXTRACT] Despesa (último recurso): {expenses}")
+def financeiro_historico(
+    after_id: int | None = None,
+    before_id: int | None = None,
+    limit: int = Query(HISTORY_PAGE_LIMIT, ge=1, le=500),
+    tipo: str | None = None,
+    since: int | None = None,
+    until: int | None = None,
+    format: str | None = None,
+):
+    """Histórico paginado por cursor; format=ndjson transmite o export completo."""
+    history_log.debug("Lendo histórico", after_id=after_id, before_id=before_id, tipo=tipo, format=format)
+    if format == "ndjson":
+        return StreamingResponse(
+            history_store.iter_lines(None, after_id=after_id, tipo=tipo, since=since, until=until),
+            media_type="application/x-ndjson",
+        )
+    eventos, cursor = history_store.query(
+        None, after_id=after_id, before_id=before_id, limit=limit, tipo=tipo, since=since, until=until
+    )
+    cursor_key = "next_before_id" if before_id is not None and after_id is None else "next_after_id"
+    return {"eventos": eventos, cursor_key: cursor}
+
+@app.get("/financeiro/historico/estado")
+def financeiro_estado_em(event_id: int | None = None, timestamp: int | None = None):
+    """Reconstrói o financeiro como estava após um evento (ou num instante)."""
+    found_id, estado = history_store.state_at(None, event_id=event_id, timestamp=timestamp)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Nenhum evento nesse ponto do histórico")
+    return {"event_id": found_id, "financeiro": estado}
+
+def extract_and_save_financial_data(user_id, save=True):
+    """Extrai dados financeiros da conversa de consultoria e salva no banco.
+
+    Incremental: lê só as mensagens depois da marca d'água do usuário e grava
+    os fatos parciais com a nova marca, na mesma conexão. Com save=False só
+    atualiza os fatos (a cada turno), e o turno que finaliza a consultoria tem
+    pouco a ler.
+    Roda na thread do fact_extractor, nunca no request.
+    """
+    with db_pool.connection() as conn:
+        facts = FinancialFacts.from_row(conn.execute("""
+            SELECT last_message_id, income, expenses, debts, numbers
+            FROM financial_facts WHERE user_id = ?
+        """, (user_id,)).fetchone())
+        rows = conn.execute("""
+            SELECT id, content, role FROM chat_history
+            WHERE user_id = ? AND id > ?
+            ORDER BY id
+        """, (user_id, facts.last_message_id)).fetchall()
         
-        print(f"[EXTRACT] User {user_id}: income={income}, expenses={expenses}, debts={len(debts)}")
+        for message_id, content, role in rows:
+            facts.feed(message_id, content, role)
+        income, expenses, debts = facts.result()
+        extract_log.debug("Extração", user_id=user_id, new_messages=len(rows), income=income, expenses=expenses,
+                          debts=len(debts))
         
-        # Validar dados (renda > despesas em geral)
-        if income > 0 and expenses > income * 5:
-            # Provável que os valores estão trocados
-            print(f"[EXTRACT] Valores possivelmente trocados, invertendo...")
-            income, expenses = expenses, income
+        if rows:
+            conn.execute("""
+                INSERT OR REPLACE INTO financial_facts
+                (user_id, last_message_id, income, expenses, debts, numbers, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, facts.to_row(user_id))
+        if not save:
+            return
         
-        # Salvar no banco de dados
+        # Salvar no banco de dados (só as colunas do perfil; strategy_id e created_at ficam)
         if income > 0 or expenses > 0 or debts:
-            cursor.execute("""
-                INSERT OR REPLACE INTO user_financial_profile 
-                (user_id, income, expenses, has_debts, savings_goal)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, income, expenses, int(len(debts) > 0), "Plano da consultoria"))
+            conn.execute("""
+                INSERT INTO user_financial_profile 
+                (user_id, income, expenses, has_debts, savings_goal, revision)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    income = excluded.income,
+                    expenses = excluded.expenses,
+                    has_debts = excluded.has_debts,
+                    savings_goal = excluded.savings_goal,
+                    revision = excluded.revision
+            """, (user_id, income, expenses, int(len(debts) > 0), "Plano da consultoria", next_revision()))
             
             # Salvar dívidas
             if debts:
-                cursor.execute("DELETE FROM user_debts WHERE user_id = ?", (user_id,))
-                for debt in debts:
-                    cursor.execute("""
-                        INSERT INTO user_debts (user_id, name, amount)
-                        VALUES (?, ?, ?)
-                    """, (user_id, debt["name"], debt["amount"]))
-            
-            conn.commit()
-            print(f"[EXTRACT] Dados salvos para user {user_id}")
+                conn.execute("DELETE FROM user_debts WHERE user_id = ?", (user_id,))
+                conn.executemany("""
+                    INSERT INTO user_debts (user_id, name, amount)
+                    VALUES (?, ?, ?)
+                """, [(user_id, "Dívida", amount) for amount in debts])
+            extract_log.info("Dados salvos", user_id=user_id)
         else:
-            print(f"[EXTRACT] Nenhum dado válido encontrado para user {user_id}")
-        
-        conn.close()
-    except Exception as e:
-        print(f"[EXTRACT] Erro ao extrair dados: {e}")
-        import traceback
-        traceback.print_exc()
-
-@app.post("/chat")
-def chat(request: ChatRequest, credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Processa mensagens do chat com IA REAL + Consultoria estruturada"""
-    try:
-        # Validar autenticação
-        token = credentials.credentials
-        payload = verify_token(token)
-        if not payload:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        
-        user_email = payload.get("email")  # Extrair email do payload
-        print(f"[CHAT] Token payload: {payload}")
-        print(f"[CHAT] User email from token: {user_email}")
-        
-        # Buscar user_id
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, email FROM users")
-        all_users = cursor.fetchall()
-        print(f"[CHAT] All users in DB: {[(u['id'], u['email']) for u in all_users]}")
-        
-        cursor.execute("SELECT id, consultation_started FROM users WHERE email = ?", (user_email,))
-        user_row = cursor.fetchone()
-        if not user_row:
-            conn.close()
-            print(f"[ERROR] User not found. Email searched: '{user_email}'")
-            raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        
-        user_id = user_row["id"]
-        
-        message = request.message
-        print(f"\n[CHAT] User {user_id} - Mensagem: '{message}'")
-        
-        # Buscar dados financeiros do usuário
-        conn_finance = sqlite3.connect(DB_FILE)
-        cursor_finance = conn_finance.cursor()
-        cursor_finance.execute("""
-            SELECT income, expenses, has_debts FROM user_financial_profile 
+            extract_log.info("Nenhum dado válido encontrado", user_id=user_id)
+
+# Um worker para a extração: pedidos do mesmo usuário na fila se juntam
+fact_extractor = BackgroundExtractor(extract_and_save_financial_data)
+
+# Acesso ao banco do /chat: funções sync rodadas via asyncio.to_thread, fora do event loop
+def load_chat_context(user_id):
+    """Perfil financeiro, dívidas, últimas HISTORY_LIMIT mensagens (mais antigas primeiro) e a
+    revisão do perfil, numa conexão só."""
+    with db_pool.connection() as conn:
+        profile = conn.execute("""
+            SELECT income, expenses, has_debts, revision FROM user_financial_profile 
             WHERE user_id = ?
-        """, (user_id,))
-        finance_data = cursor_finance.fetchone()
-        print(f"[DEBUG] finance_data encontrado: {finance_data}")
+        """, (user_id,)).fetchone()
         
-        cursor_finance.execute("""
+        debts_data = conn.execute("""
             SELECT name, amount FROM user_debts WHERE user_id = ?
-        """, (user_id,))
-        debts_data = cursor_finance.fetchall()
-        print(f"[DEBUG] debts_data encontrado: {debts_data}")
-        conn_finance.close()
+        """, (user_id,)).fetchall()
         
-        # Buscar histórico de conversa do usuário (últimas 20 mensagens)
-        cursor.execute("""
-            SELECT role, content FROM chat_history 
+        history_rows = conn.execute("""
+            SELECT id, role, content FROM chat_history 
             WHERE user_id = ? 
             ORDER BY created_at DESC 
-            LIMIT 20
-        """, (user_id,))
-        history_rows = cursor.fetchall()
-        history_rows.reverse()  # Mais antigas primeiro
-        
-        conn.close()
-        
-        if not OPENROUTER_API_KEY:
-            print("[ERROR] OPENROUTER_API_KEY não configurada")
-            return {"reply": "Erro: Chave de API não configurada", "action": None}
-        
-        # Verificar se usuário está pedindo estratégia e tem dados
-        criar_estrategia = any(palavra in message.lower() for palavra in ["estratégia", "estrategia", "plano", "criar", "ajuda", "dividas"])
-        print(f"[DEBUG] criar_estrategia detectado: {criar_estrategia}")
-        print(f"[DEBUG] Condição (finance_data and criar_estrategia): {bool(finance_data and criar_estrategia)}")
-        
-        # Verificar se usuário está PEDINDO DIRETAMENTE para adicionar/salvar estratégia
-        pedir_adicionar = any(palavra in message.lower() for palavra in ["adicione", "adiciona", "salve", "salva", "coloque", "coloca", "guarde", "guarda"]) and any(palavra in message.lower() for palavra in ["financeiro", "página", "pagina", "controle", "estratégia", "estrategia", "plano"])
-        print(f"[DEBUG] pedir_adicionar detectado: {pedir_adicionar}")
-        
-        # Se usuário está pedindo para adicionar, disparar salvar imediatamente
-        if pedir_adicionar and finance_data:
-            print("[CHAT] Usuário pediu DIRETAMENTE para adicionar estratégia na página")
-            # Buscar a estratégia completa do histórico (últimas mensagens do assistente)
-            conn = sqlite3.connect(DB_FILE)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT content FROM chat_history 
-                WHERE user_id = ? AND role = 'assistant'
-                ORDER BY created_at DESC 
-                LIMIT 10
-            """, (user_id,))
-            recent_messages = cursor.fetchall()
-            
-            # Extrair apenas as partes estruturadas da estratégia
-            import re
-            estrategia_limpa = []
-            
-            for msg in reversed(recent_messages):
-                texto = msg[0]
-                
-                # Remover introduções e perguntas
-                linhas_remover = [
-                    r"com base nas.*?personalizada:?",
-                    r"aqui está.*?personalizada:?",
-                    r"ficou alguma dúvida.*?\?",
-                    r"claro!.*?informações:?",
-                    r"vamos detalhar.*?informações:?",
-                    r"para criar.*?informações",
-                    r"fico feliz.*?dúvidas",
-                    r"infelizmente.*?orientação"
-                ]
-                
-                for padrao in linhas_remover:
-                    texto = re.sub(padrao, "", texto, flags=re.IGNORECASE | re.DOTALL)
-                
-                # Extrair apenas seções numeradas e estruturadas
-                secoes = re.findall(r'(\d+\.\s*\*\*[^*]+\*\*:?.*?)(?=\d+\.\s*\*\*|$)', texto, re.DOTALL)
-                
-                if secoes:
-                    for secao in secoes:
-                        secao_limpa = secao.strip()
-                        # Evitar duplicatas
-                        if secao_limpa and secao_limpa not in estrategia_limpa:
-                            estrategia_limpa.append(secao_limpa)
-            
-            # Montar estratégia final
-            estrategia_completa = "\n\n".join(estrategia_limpa[:4])  # Máximo 4 seções
-            
-            # Se não conseguiu extrair estruturadamente, usar fallback mais agressivo
-            if not estrategia_completa or len(estrategia_completa) < 100:
-                for msg in reversed(recent_messages[:3]):
-                    texto = msg[0]
-                    # Pegar apenas do primeiro "1." ou "**" até o final
-                    match = re.search(r'(1\.\s*\*\*.*)', texto, re.DOTALL)
-                    if match:
-                        estrategia_completa = match.group(1).strip()
-                        break
-            
-            # Limitar tamanho
-            if len(estrategia_completa) > 1200:
-                estrategia_completa = estrategia_completa[:1200] + "..."
-            
-            cursor.execute("""
-                UPDATE user_financial_profile 
-                SET savings_goal = ? 
-                WHERE user_id = ?
-            """, (estrategia_completa.strip(), user_id))
-            conn.commit()
-            conn.close()
-            print(f"[CHAT] Estratégia salva diretamente (pedido explícito do usuário)")
-            
-            return {"reply": "Perfeito! Estratégia adicionada com sucesso na sua página de Controle Financeiro! 🎯", "action": "ESTRATEGIA_SALVA"}
-        
-        # Verificar se usuário está confirmando para colocar na página (antigo fluxo)
-        confirmar_salvar = any(palavra in message.lower() for palavra in ["sim", "pode", "coloca", "adiciona", "salva", "confirmo", "ok", "yes", "claro"])
-        
-        # System prompt - adaptado se tem dados financeiros ou não
-        if finance_data and criar_estrategia:
-            print("[DEBUG] Usando system prompt COM DADOS FINANCEIROS")
-            renda, despesas, has_debts = finance_data
-            dividas_texto = ""
-            total_dividas = 0
-            if debts_data:
-                total_dividas = sum(d[1] for d in debts_data)
-                dividas_lista = [f"{d[0]}: R$ {d[1]:.2f}" for d in debts_data]
-                dividas_texto = f"\nDívidas: {', '.join(dividas_lista)} (Total: R$ {total_dividas:.2f})"
-            
-                system_prompt = f"""Leo, consultor financeiro do LifeOS.
+            LIMIT ?
+        """, (user_id, HISTORY_LIMIT)).fetchall()
+    history_rows.reverse()
+    finance_data, revision = (profile[:3], profile[3]) if profile else (None, 0)
+    return finance_data, debts_data, history_rows, revision
+
+def load_recent_assistant_messages(user_id):
+    with db_pool.connection() as conn:
+        return conn.execute("""
+            SELECT content FROM chat_history 
+            WHERE user_id = ? AND role = 'assistant'
+            ORDER BY created_at DESC 
+            LIMIT 10
+        """, (user_id,)).fetchall()
+
+def store_strategy(conn, user_id, strategy) -> int:
+    """Grava a estratégia como a próxima versão do usuário; retorna o id."""
+    version = conn.execute(
+        "SELECT COALESCE(MAX(version), 0) + 1 FROM strategies WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+    return conn.execute("""
+        INSERT INTO strategies (user_id, version, analysis, steps, monthly_focus, daily_goal, text)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, version, *strategy, strategy.render())).lastrowid
+
+def save_latest_strategy(user_id) -> bool:
+    """Aponta o perfil para a última versão da estratégia: um UPDATE por chave, sem re-parsear nada.
+
+    Conversas de antes da tabela strategies: parseia as últimas respostas do
+    assistente uma vez e grava a mais recente que for uma estratégia.
+    """
+    with db_pool.connection() as conn:
+        row = conn.execute(
+            "SELECT id FROM strategies WHERE user_id = ? ORDER BY version DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        strategy_id = row[0] if row else None
+        if strategy_id is None:
+            for (texto,) in load_recent_assistant_messages(user_id):
+                strategy = parse_strategy(texto)
+                if strategy:
+                    strategy_id = store_strategy(conn, user_id, strategy)
+                    break
+        if strategy_id is None:
+            return False
+        conn.execute("UPDATE user_financial_profile SET strategy_id = ? WHERE user_id = ?", (strategy_id, user_id))
+    return True
+
+def save_chat_turn(user_id, message: str, reply: str):
+    # Resposta com estratégia é parseada uma vez, aqui, e vira uma versão nova
+    strategy = parse_strategy(reply)
+    with db_pool.connection() as conn:
+        conn.executemany("""
+            INSERT INTO chat_history (user_id, role, content) 
+            VALUES (?, ?, ?)
+        """, [(user_id, "user", message), (user_id, "assistant", reply)])
+        if strategy:
+            store_strategy(conn, user_id, strategy)
 
-DADOS DO USUÁRIO:
-Renda: R$ {renda:.2f} | Despesas: R$ {despesas:.2f} | Disponível: R$ {(renda - despesas):.2f}{dividas_texto}
+# Marcadores de controle que a IA escreve na resposta e nunca chegam ao usuário
+CHAT_MARKERS = ("SALVAR_ESTRATEGIA", "CONSULTORIA_FINALIZADA", "CONSULTORIA FINALIZADA")
+
+# Prompts do Leo, compilados na importação. Instruções fixas primeiro e dados do
+# usuário no fim: o prefixo é o mesmo para todos e o provedor pode cacheá-lo
+STRATEGY_PROMPT = PromptTemplate("""Leo, consultor financeiro do LifeOS.
 
 INSTRUÇÕES OBRIGATÓRIAS:
 
@@ -941,10 +985,19 @@ INSTRUÇÕES OBRIGATÓRIAS:
 5. Se usuário disser SIM/PODE/ADICIONA, responda:
    "Perfeito! SALVAR_ESTRATEGIA"
 
-IMPORTANTE: Após esclarecer dúvidas, SEMPRE pergunte sobre adicionar na página."""
-        else:
-            print("[DEBUG] Usando system prompt PADRÃO (sem dados ou sem palavra-chave)")
-            system_prompt = """Você é um consultor financeiro profissional do LifeOS chamado Leo. Seja empático e conversacional.
+IMPORTANTE: Após esclarecer dúvidas, SEMPRE pergunte sobre adicionar na página.
+
+DADOS DO USUÁRIO:
+{dados}""")
+STRATEGY_DATA = PromptTemplate(
+    "Renda: R$ {renda:.2f} | Despesas: R$ {despesas:.2f} | Disponível: R$ {disponivel:.2f}{dividas}"
+)
+STRATEGY_REMINDER = PromptTemplate(
+    "LEMBRETE: Usuário JÁ forneceu dados - Renda: R${renda:.0f}, Despesas: R${despesas:.0f}, "
+    "Disponível: R${disponivel:.0f}. NÃO PEÇA essas informações novamente. CRIE A ESTRATÉGIA AGORA "
+    "e termine com 'Ficou alguma dúvida sobre o plano?'"
+)
+DEFAULT_PROMPT = """Você é um consultor financeiro profissional do LifeOS chamado Leo. Seja empático e conversacional.
 
 Conduza uma consultoria em 3 etapas:
 
@@ -962,177 +1015,236 @@ IMPORTANTE:
 - NUNCA repita perguntas que já foram respondidas
 - Quando responder com listas, use texto simples sem markdown (sem **, _, títulos em negrito)."""
 
-        # Construir array de mensagens com histórico
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Adicionar histórico
-        for row in history_rows:
-            messages.append({"role": row[0], "content": row[1]})
-        
-        # Se tem dados financeiros, adicionar lembrete do sistema antes da mensagem atual
-        if finance_data and criar_estrategia:
-            renda, despesas, has_debts = finance_data
-            reminder = f"LEMBRETE: Usuário JÁ forneceu dados - Renda: R${renda:.0f}, Despesas: R${despesas:.0f}, Disponível: R${renda-despesas:.0f}. NÃO PEÇA essas informações novamente. CRIE A ESTRATÉGIA AGORA e termine com 'Ficou alguma dúvida sobre o plano?'"
-            messages.append({"role": "system", "content": reminder})
-            print(f"[DEBUG] Adicionado lembrete do sistema sobre dados existentes")
-        
-        # Adicionar mensagem atual
-        messages.append({"role": "user", "content": message})
-        
-        print(f"[CHAT] Enviando {len(messages)} mensagens para IA (histórico: {len(history_rows)})")
-        
-        # Chamar IA
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        
-        payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": 400,
-        }
-        
-        print(f"[CHAT] Chamando OpenRouter...")
-        response = requests.post(OPENROUTER_URL, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code != 200:
-            print(f"[ERROR] OpenRouter retornou {response.status_code}")
-            return {"reply": f"Erro ao conectar com IA: {response.status_code}", "action": None}
-        
-        result = response.json()
-        ai_reply = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-        
-        if not ai_reply:
-            return {"reply": "Desculpe, não consegui processar", "action": None}
+def strategy_data_block(finance_data, debts_data):
+    """Linhas de renda/despesas/dívidas do prompt de estratégia."""
+    renda, despesas, has_debts = finance_data
+    dividas = ""
+    if debts_data:
+        total_dividas = sum(d[1] for d in debts_data)
+        dividas_lista = [f"{d[0]}: R$ {d[1]:.2f}" for d in debts_data]
+        dividas = f"\nDívidas: {', '.join(dividas_lista)} (Total: R$ {total_dividas:.2f})"
+    return STRATEGY_DATA.render(renda=renda, despesas=despesas, disponivel=renda - despesas, dividas=dividas)
+
+async def prepare_chat(request: ChatRequest, credentials: HTTPAuthorizationCredentials):
+    """Autentica, carrega o contexto e monta o payload da IA.
+
+    Retorna (resposta_imediata, None) quando o turno se resolve sem IA, ou
+    (None, (user_id, message, payload)).
+    """
+    # Validar autenticação
+    token = credentials.credentials
+    payload = verify_token(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    
+    # user_id vem do claim assinado; flags do usuário saem do cache
+    user_id = payload.get("user_id")
+    user = await asyncio.to_thread(get_user, user_id)
+    if not user:
+        log.warning("Usuário do token não encontrado", user_id=user_id)
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    
+    message = request.message
+    log.info("Mensagem recebida", user_id=user_id, chars=len(message))
+    log.debug("Mensagem", user_id=user_id, message=message)
+    
+    # Dados financeiros e histórico (últimas HISTORY_LIMIT mensagens) numa única conexão do pool
+    finance_data, debts_data, history_rows, revision = await asyncio.to_thread(load_chat_context, user_id)
+    log.debug("Contexto financeiro", finance_data=finance_data, debts_data=debts_data)
+    
+    if not OPENROUTER_API_KEY:
+        log.error("OPENROUTER_API_KEY não configurada")
+        return {"reply": "Erro: Chave de API não configurada", "action": None}, None
+    
+    # Verificar se usuário está pedindo estratégia e tem dados
+    intents = route_message(message)
+    criar_estrategia = Intent.STRATEGY in intents
+    
+    # Verificar se usuário está PEDINDO DIRETAMENTE para adicionar/salvar estratégia
+    pedir_adicionar = Intent.SAVE_VERB in intents and Intent.SAVE_TARGET in intents
+    log.debug("Intenções", criar_estrategia=criar_estrategia, pedir_adicionar=pedir_adicionar,
+              com_dados=bool(finance_data and criar_estrategia))
+    
+    # Se usuário está pedindo para adicionar, disparar salvar imediatamente
+    if pedir_adicionar and finance_data:
+        if not await asyncio.to_thread(save_latest_strategy, user_id):
+            return {"reply": "Ainda não montamos uma estratégia para adicionar. Quer que eu crie uma agora?", "action": None}, None
+        log.info("Estratégia salva a pedido do usuário", user_id=user_id)
         
-        print(f"[CHAT] IA Response: {ai_reply[:100]}...")
+        return {"reply": "Perfeito! Estratégia adicionada com sucesso na sua página de Controle Financeiro! 🎯", "action": "ESTRATEGIA_SALVA"}, None
+    
+    # Verificar se usuário está confirmando para colocar na página (antigo fluxo)
+    confirmar_salvar = intents.any(Intent.CONFIRM, Intent.SAVE_VERB)
+    
+    # System prompt - adaptado se tem dados financeiros ou não
+    if finance_data and criar_estrategia:
+        # Toda gravação de renda/despesas/dívidas carimba uma revisão nova no perfil
+        dados = prompt_blocks.render("dados_financeiros", (user_id, revision),
+                                     lambda: strategy_data_block(finance_data, debts_data))
+        system_prompt = STRATEGY_PROMPT.render(dados=dados)
+    else:
+        system_prompt = DEFAULT_PROMPT
+
+    # Construir array de mensagens com histórico
+    messages = [{"role": "system", "content": system_prompt}]
+    
+    # Histórico: as mais novas que cabem no orçamento; as anteriores entram como resumo
+    summary, recent = context_budgeter.select(
+        user_id, [(row[0], {"role": row[1], "content": row[2]}) for row in history_rows]
+    )
+    if summary:
+        messages.append({"role": "system", "content": f"Resumo da conversa até aqui: {summary}"})
+    messages.extend(recent)
+    
+    # Se tem dados financeiros, adicionar lembrete do sistema antes da mensagem atual
+    if finance_data and criar_estrategia:
+        renda, despesas, has_debts = finance_data
+        reminder = STRATEGY_REMINDER.render(renda=renda, despesas=despesas, disponivel=renda - despesas)
+        messages.append({"role": "system", "content": reminder})
+    
+    # Adicionar mensagem atual
+    messages.append({"role": "user", "content": message})
+    
+    log.debug("Mensagens para IA", user_id=user_id, messages=len(messages),
+              strategy_prompt=system_prompt is not DEFAULT_PROMPT, history=f"{len(recent)}/{len(history_rows)}",
+              history_tokens=context_budgeter.last_history_tokens, summary=bool(summary))
+    
+    payload = {
+        "model": CHAT_MODEL,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 400,
+    }
+    return None, (user_id, message, payload)
+
+async def finish_chat(user_id, message: str, ai_reply: str) -> dict:
+    """Persiste o turno e trata os marcadores da resposta completa da IA."""
+    # Salvar histórico da conversa
+    await asyncio.to_thread(save_chat_turn, user_id, message, ai_reply)
+    # Avança a marca d'água da extração em segundo plano, turno a turno
+    fact_extractor.submit(user_id)
+    
+    # Detectar se usuário confirmou salvar estratégia
+    if "SALVAR_ESTRATEGIA" in ai_reply.upper():
+        # A estratégia já foi parseada e versionada quando chegou; salvar só move o ponteiro
+        if await asyncio.to_thread(save_latest_strategy, user_id):
+            log.info("Estratégia salva", user_id=user_id)
+        else:
+            log.info("Nenhuma estratégia para salvar", user_id=user_id)
         
-        # Salvar histórico da conversa
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO chat_history (user_id, role, content) 
-            VALUES (?, ?, ?)
-        """, (user_id, "user", message))
-        cursor.execute("""
-            INSERT INTO chat_history (user_id, role, content) 
-            VALUES (?, ?, ?)
-        """, (user_id, "assistant", ai_reply))
-        conn.commit()
-        conn.close()
-        print(f"[CHAT] Histórico salvo para user {user_id}")
+        return {"reply": ai_reply.replace("SALVAR_ESTRATEGIA", "").replace("SALVAR_ESTRATEGIA", "").strip(), "action": "ESTRATEGIA_SALVA"}
+    
+    # Detectar consultoria antiga (manter compatibilidade)
+    if "CONSULTORIA_FINALIZADA" in ai_reply.upper() or "CONSULTORIA FINALIZADA" in ai_reply.upper():
+        log.info("Consultoria finalizada", user_id=user_id)
+        fact_extractor.submit(user_id, save=True)
+        return {"reply": ai_reply.replace("CONSULTORIA FINALIZADA", "").replace("CONSULTORIA_FINALIZADA", "").strip(), "action": "CONSULTORIA_FINALIZADA"}
+    
+    return {"reply": ai_reply, "action": None}
+
+@app.post("/chat")
+async def chat(request: ChatRequest, response: Response, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Processa mensagens do chat com IA REAL + Consultoria estruturada"""
+    try:
+        immediate, turn = await prepare_chat(request, credentials)
+        if immediate:
+            return immediate
+        user_id, message, payload = turn
         
-        # Detectar se usuário confirmou salvar estratégia
-        if "SALVAR_ESTRATEGIA" in ai_reply.upper():
-            print("[CHAT] Usuário confirmou salvar estratégia na página")
-            # Buscar a estratégia completa do histórico (últimas mensagens do assistente)
-            conn = sqlite3.connect(DB_FILE)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT content FROM chat_history 
-                WHERE user_id = ? AND role = 'assistant'
-                ORDER BY created_at DESC 
-                LIMIT 10
-            """, (user_id,))
-            recent_messages = cursor.fetchall()
+        ai_reply = await asyncio.to_thread(llm_cache.get, payload, user_id)
+        response.headers["X-LLM-Cache"] = "hit" if ai_reply is not None else "miss"
+        if ai_reply is None:
+            llm_response = await llm_gateway.complete(payload)
             
-            # Extrair apenas as partes estruturadas da estratégia
-            import re
-            estrategia_limpa = []
+            if llm_response.status_code != 200:
+                log.error("OpenRouter retornou erro", user_id=user_id, status=llm_response.status_code)
+                return {"reply": f"Erro ao conectar com IA: {llm_response.status_code}", "action": None}
             
-            for msg in reversed(recent_messages[1:]):  # Pular última (confirmação)
-                texto = msg[0]
-                
-                # Remover introduções e perguntas
-                linhas_remover = [
-                    r"com base nas.*?personalizada:?",
-                    r"aqui está.*?personalizada:?",
-                    r"ficou alguma dúvida.*?\?",
-                    r"claro!.*?informações:?",
-                    r"vamos detalhar.*?informações:?",
-                    r"para criar.*?informações",
-                    r"fico feliz.*?dúvidas",
-                    r"infelizmente.*?orientação",
-                    r"salvar_estrategia"
-                ]
-                
-                for padrao in linhas_remover:
-                    texto = re.sub(padrao, "", texto, flags=re.IGNORECASE | re.DOTALL)
-                
-                # Extrair apenas seções numeradas e estruturadas
-                secoes = re.findall(r'(\d+\.\s*\*\*[^*]+\*\*:?.*?)(?=\d+\.\s*\*\*|$)', texto, re.DOTALL)
-                
-                if secoes:
-                    for secao in secoes:
-                        secao_limpa = secao.strip()
-                        # Evitar duplicatas
-                        if secao_limpa and secao_limpa not in estrategia_limpa:
-                            estrategia_limpa.append(secao_limpa)
+            result = llm_response.json()
+            ai_reply = result.get("choices", [{}])[0].get("message", {}).get("content", "")
             
-            # Montar estratégia final
-            estrategia_completa = "\n\n".join(estrategia_limpa[:4])  # Máximo 4 seções
-            
-            # Se não conseguiu extrair estruturadamente, usar fallback
-            if not estrategia_completa or len(estrategia_completa) < 100:
-                for msg in reversed(recent_messages[1:4]):
-                    texto = msg[0]
-                    # Pegar apenas do primeiro "1." ou "**" até o final
-                    match = re.search(r'(1\.\s*\*\*.*)', texto, re.DOTALL)
-                    if match:
-                        estrategia_completa = match.group(1).strip()
-                        break
-            
-            # Limitar tamanho
-            if len(estrategia_completa) > 1200:
-                estrategia_completa = estrategia_completa[:1200] + "..."
-            
-            # Limpar marcadores residuais
-            estrategia_completa = estrategia_completa.replace("SALVAR_ESTRATEGIA", "").replace("Perfeito!", "").strip()
-            
-            cursor.execute("""
-                UPDATE user_financial_profile 
-                SET savings_goal = ? 
-                WHERE user_id = ?
-            """, (estrategia_completa, user_id))
-            conn.commit()
-            conn.close()
-            print(f"[CHAT] Estratégia completa salva para user {user_id}")
-            
-            return {"reply": ai_reply.replace("SALVAR_ESTRATEGIA", "").replace("SALVAR_ESTRATEGIA", "").strip(), "action": "ESTRATEGIA_SALVA"}
-        
-        # Detectar consultoria antiga (manter compatibilidade)
-        if "CONSULTORIA FINALIZADA" in ai_reply.upper():
-            print("[CHAT] Consultoria detectada como finalizada")
-            extract_and_save_financial_data(user_id)
-            return {"reply": ai_reply.replace("CONSULTORIA FINALIZADA", "").replace("CONSULTORIA_FINALIZADA", "").strip(), "action": "CONSULTORIA_FINALIZADA"}
+            if not ai_reply:
+                return {"reply": "Desculpe, não consegui processar", "action": None}
+            await asyncio.to_thread(llm_cache.set, payload, ai_reply, user_id)
         
-        return {"reply": ai_reply, "action": None}
+        log.debug("Resposta da IA", user_id=user_id, cached=response.headers["X-LLM-Cache"] == "hit",
+                  reply=ai_reply[:100])
+        return await finish_chat(user_id, message, ai_reply)
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return {"reply": "Erro: Timeout ao conectar com IA. Tente novamente.", "action": None}
     except Exception as e:
-        print(f"[ERROR] {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Erro no chat")
         return {"reply": f"Erro: {str(e)}", "action": None}
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """/chat com a resposta da IA transmitida token a token (Server-Sent Events).
+
+    Eventos `delta` trazem o texto parcial (sem marcadores); o `done` final traz
+    reply/action como no /chat, depois que o turno foi salvo.
+    """
+    immediate, turn = await prepare_chat(request, credentials)
+    if immediate:
+        return StreamingResponse(iter([sse_event(immediate, "done")]), media_type="text/event-stream", headers=SSE_HEADERS)
+    user_id, message, payload = turn
+    cached_reply = await asyncio.to_thread(llm_cache.get, payload, user_id)
+    
+    async def deltas():
+        if cached_reply is not None:
+            yield cached_reply
+            return
+        async for delta in llm_gateway.stream(payload):
+            yield delta
+    
+    async def events():
+        parts = []
+        markers = MarkerFilter(CHAT_MARKERS)
+        try:
+            async for delta in deltas():
+                parts.append(delta)
+                visible = markers.feed(delta)
+                if visible:
+                    yield sse_event({"delta": visible})
+            rest = markers.flush()
+            if rest:
+                yield sse_event({"delta": rest})
+            
+            ai_reply = "".join(parts)
+            if not ai_reply:
+                yield sse_event({"reply": "Desculpe, não consegui processar", "action": None}, "done")
+                return
+            log.debug("Resposta da IA (stream)", user_id=user_id, cached=cached_reply is not None, reply=ai_reply[:100])
+            if cached_reply is None:
+                await asyncio.to_thread(llm_cache.set, payload, ai_reply, user_id)
+            yield sse_event(await finish_chat(user_id, message, ai_reply), "done")
+        except httpx.TimeoutException:
+            yield sse_event({"detail": "Timeout ao conectar com IA. Tente novamente."}, "error")
+        except httpx.HTTPStatusError as e:
+            log.error("OpenRouter retornou erro", user_id=user_id, status=e.response.status_code)
+            yield sse_event({"detail": f"Erro ao conectar com IA: {e.response.status_code}"}, "error")
+        except Exception as e:
+            log.exception("Erro no chat (stream)")
+            yield sse_event({"detail": f"Erro: {str(e)}"}, "error")
+    
+    headers = {**SSE_HEADERS, "X-LLM-Cache": "hit" if cached_reply is not None else "miss"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
 if __name__ == "__main__":
     import uvicorn
     import signal
     import sys
     
     def signal_handler(sig, frame):
-        print("\n[SERVER] Recebeu sinal de término, ignorando...")
+        server_log.warning("Recebeu sinal de término, ignorando", signal=sig)
         pass
     
     # Ignorar sinais de término
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    print("[SERVER] Iniciando com proteção contra shutdown...")
-    print("LifeOS state foundation established")
+    server_log.info("Iniciando com proteção contra shutdown", port=8001)
     try:
         uvicorn.run(
             app, 
@@ -1141,8 +1253,8 @@ if __name__ == "__main__":
             log_level="info"
         )
     except KeyboardInterrupt:
-        print("[SERVER] KeyboardInterrupt capturado, continuando...")
+        server_log.warning("KeyboardInterrupt capturado, continuando")
         pass
-    except Exception as e:
-        print(f"[SERVER] Erro: {e}, continuando...")
+    except Exception:
+        server_log.exception("Erro no servidor, continuando")
         pass
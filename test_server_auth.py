@@ -1,21 +1,59 @@
 #!/usr/bin/env python3
 """Backend LifeOS com autenticação real SQLite"""
 
-from fastapi import FastAPI, Depends, HTTPException, status, Cookie
+from fastapi import FastAPI, Depends, HTTPException, status, Cookie, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
 from datetime import datetime
-import json
 import re
 import sqlite3
-import bcrypt
 from typing import Optional
 import secrets
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from history_store import HistoryStore
+from state_store import JsonStateCache, UserShardStore
+from json_writer import writer as json_writer
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from migrations import apply_migrations
+from session_store import SessionStore, SESSION_TTL
+from intent_router import Intent, route_message
+from br_parser import parse_values
+import structured_log
+from structured_log import RequestIdMiddleware, get_logger
+
+structured_log.configure()
+
+log = get_logger("chat")
+db_log = get_logger("db")
+history_log = get_logger("history")
+interaction_log = get_logger("interaction")
+server_log = get_logger("server")
 
 STATE_FILE = Path("lifeos_state.json")
-HISTORY_FILE = Path("financeiro_history.json")
+USER_SHARDS_DIR = Path("lifeos_state") / "users"
+HISTORY_FILE = Path("financeiro_history.json")  # legado, importado para HISTORY_DIR
+HISTORY_DIR = Path("financeiro_history")
 DB_FILE = Path("lifeos.db")
+HISTORY_PAGE_LIMIT = 50
+HISTORY_REPLY_LIMIT = 10
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "32"))
+# Dono do histórico legado (de antes do login, sem user_id). As leituras aqui são
+# sempre por usuário e não enxergam a partição "global"
+LEGACY_HISTORY_OWNER = os.getenv("LEGACY_HISTORY_OWNER")
+
+history_store = HistoryStore(HISTORY_DIR)
+if HISTORY_FILE.exists():
+    if LEGACY_HISTORY_OWNER is None:
+        history_log.warning("Histórico legado não importado: defina LEGACY_HISTORY_OWNER", file=str(HISTORY_FILE))
+    elif history_store.import_legacy(HISTORY_FILE, user_id=int(LEGACY_HISTORY_OWNER)):
+        HISTORY_FILE.rename(HISTORY_FILE.with_name(HISTORY_FILE.name + ".imported"))
 
 app = FastAPI()
 
@@ -32,6 +70,7 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=600,
 )
+app.add_middleware(RequestIdMiddleware)
 
 # ==================== DATABASE ====================
 def get_db():
@@ -40,19 +79,18 @@ def get_db():
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    """Initialize database."""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
+# Migrações versionadas: só acrescente no final, nunca edite uma já publicada
+MIGRATIONS = [
+    (1, "tabelas iniciais", [
+        """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """)
-    cursor.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS sessions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -60,10 +98,26 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY(user_id) REFERENCES users(id)
         )
-    """)
-    conn.commit()
+        """,
+    ]),
+    (2, "last_seen/expires_at nas sessões", [
+        "ALTER TABLE sessions ADD COLUMN last_seen INTEGER",
+        "ALTER TABLE sessions ADD COLUMN expires_at INTEGER",
+        f"UPDATE sessions SET last_seen = CAST(strftime('%s', created_at) AS INTEGER), "
+        f"expires_at = CAST(strftime('%s', created_at) AS INTEGER) + {SESSION_TTL}",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)",
+    ]),
+]
+
+def init_db():
+    """Initialize database."""
+    conn = get_db()
+    apply_migrations(conn, MIGRATIONS)
     conn.close()
-    print("[DB] Database initialized")
+    db_log.info("Banco inicializado", file=str(DB_FILE), schema=MIGRATIONS[-1][0])
+
+# token -> user_id em memória; last_seen gravado em lote e sessões expiradas varridas em background
+session_store = SessionStore(get_db)
 
 # ==================== MODELS ====================
 class SignupRequest(BaseModel):
@@ -83,34 +137,37 @@ class AuthResponse(BaseModel):
     token: str
 
 # ==================== AUTH FUNCTIONS ====================
-def hash_password(password: str) -> str:
-    """Hash password with bcrypt."""
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode(), salt).decode()
+# bcrypt roda num pool próprio, limitado; fila cheia vira 503
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_MAX_PENDING)
 
-def verify_password(password: str, password_hash: str) -> bool:
-    """Verify password."""
-    return bcrypt.checkpw(password.encode(), password_hash.encode())
+async def hash_password(password: str) -> str:
+    """Hash password with bcrypt (dedicated pool)."""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """Verify password (dedicated pool)."""
+    try:
+        return await password_hasher.verify(password, password_hash)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
 
 def get_current_user(token: Optional[str] = Cookie(None)):
     """Get current user from token."""
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM sessions WHERE token = ?", (token,))
-    session = cursor.fetchone()
-    conn.close()
-    
-    if not session:
+    user_id = session_store.lookup(token)
+    if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
-    return session["user_id"]
+    return user_id
 
 # ==================== AUTH ENDPOINTS ====================
 @app.post("/auth/signup")
-def signup(req: SignupRequest):
+async def signup(req: SignupRequest):
     """Create new user."""
     if not req.email or not req.password:
         raise HTTPException(status_code=400, detail="Email and password required")
@@ -120,24 +177,25 @@ def signup(req: SignupRequest):
     
     # Check if email exists
     cursor.execute("SELECT id FROM users WHERE email = ?", (req.email,))
-    if cursor.fetchone():
-        conn.close()
+    exists = cursor.fetchone()
+    conn.close()
+    if exists:
         raise HTTPException(status_code=400, detail="Email already exists")
     
     # Create user
-    password_hash = hash_password(req.password)
+    password_hash = await hash_password(req.password)
+    conn = get_db()
+    cursor = conn.cursor()
     cursor.execute("INSERT INTO users (email, password_hash) VALUES (?, ?)", 
                    (req.email, password_hash))
     conn.commit()
     
     user_id = cursor.lastrowid
+    conn.close()
     
     # Create session
     token = secrets.token_urlsafe(32)
-    cursor.execute("INSERT INTO sessions (user_id, token) VALUES (?, ?)", 
-                   (user_id, token))
-    conn.commit()
-    conn.close()
+    session_store.create(user_id, token)
     
     return AuthResponse(
         user=UserResponse(id=user_id, email=req.email),
@@ -145,7 +203,7 @@ def signup(req: SignupRequest):
     )
 
 @app.post("/auth/login")
-def login(req: LoginRequest):
+async def login(req: LoginRequest):
     """Login user."""
     if not req.email or not req.password:
         raise HTTPException(status_code=400, detail="Email and password required")
@@ -156,19 +214,30 @@ def login(req: LoginRequest):
     # Find user
     cursor.execute("SELECT id, password_hash FROM users WHERE email = ?", (req.email,))
     user = cursor.fetchone()
+    conn.close()
     
-    if not user or not verify_password(req.password, user["password_hash"]):
-        conn.close()
+    if not user or not await verify_password(req.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     user_id = user["id"]
     
+    # Custo do bcrypt mudou desde o cadastro: regrava o hash com o custo atual
+    new_hash = None
+    if password_hasher.needs_rehash(user["password_hash"]):
+        try:
+            new_hash = await password_hasher.rehash(req.password)
+        except PasswordHasherBusy:
+            pass  # fica para o próximo login
+    
+    if new_hash:
+        conn = get_db()
+        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user_id))
+        conn.commit()
+        conn.close()
+    
     # Create session
     token = secrets.token_urlsafe(32)
-    cursor.execute("INSERT INTO sessions (user_id, token) VALUES (?, ?)", 
-                   (user_id, token))
-    conn.commit()
-    conn.close()
+    session_store.create(user_id, token)
     
     return AuthResponse(
         user=UserResponse(id=user_id, email=req.email),
@@ -190,64 +259,57 @@ def get_me(user_id: int = Depends(get_current_user)):
     return UserResponse(id=user["id"], email=user["email"])
 
 @app.post("/auth/logout")
-def logout(user_id: int = Depends(get_current_user)):
+def logout(user_id: int = Depends(get_current_user), token: Optional[str] = Cookie(None)):
     """Logout user."""
+    session_store.revoke(token)
     return {"status": "logged out"}
 
 # ==================== STATE FUNCTIONS ====================
-def load_state():
-    if not STATE_FILE.exists():
-        return {
-            "financeiro": {
-                "fase": 1,
-                "dividas": [],
-                "foco": "Parar sangria",
-                "ultima_atualizacao": None,
-            }
+def default_state():
+    return {
+        "financeiro": {
+            "fase": 1,
+            "dividas": [],
+            "foco": "Parar sangria",
+            "ultima_atualizacao": None,
         }
-    with open(STATE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    }
+
+state_cache = JsonStateCache(STATE_FILE, default_state)
+user_shards = UserShardStore(USER_SHARDS_DIR, default_state)
+user_shards.migrate_from(state_cache)
 
-def save_state(state: dict):
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+def load_state(user_id=None):
+    """Estado do usuário (shard próprio); sem usuário, o financeiro legado de lifeos_state.json."""
+    if user_id is None:
+        return state_cache.load()
+    return user_shards.load(user_id)
 
-def load_history():
-    if not HISTORY_FILE.exists():
-        return {"eventos": []}
-    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+def save_state(state: dict, user_id=None):
+    if user_id is None:
+        state_cache.save(state)
+    else:
+        user_shards.save(user_id, state)
 
-def save_history(history: dict):
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+def load_history(user_id=None):
+    return history_store.load(user_id)
 
-def record_event(tipo: str, valor: float | None, descricao: str, estado_antes: dict, estado_depois: dict):
+def record_event(tipo: str, valor: float | None, descricao: str, estado_antes: dict, estado_depois: dict, user_id=None):
     """Registra um evento IMUTÁVEL no histórico após confirmar mudança real."""
-    history = load_history()
-    if not history.get("eventos"):
-        history["eventos"] = []
-    
-    event_id = (history["eventos"][-1].get("id", 0) + 1) if history["eventos"] else 1
-    
-    event = {
-        "id": event_id,
-        "tipo": tipo,
-        "valor": valor,
-        "descricao": descricao,
-        "timestamp": current_ts(),
-        "estado_antes": estado_antes.get("financeiro", {}),
-        "estado_depois": estado_depois.get("financeiro", {}),
-    }
-    
-    history["eventos"].append(event)
-    save_history(history)
-    print(f"[HISTORY] Evento registrado: {tipo} (id={event_id})")
-
-def format_history_reply():
-    """Formata histórico para resposta amigável."""
-    history = load_history()
-    eventos = history.get("eventos", [])
+    event = history_store.append_change(
+        user_id,
+        {"tipo": tipo, "valor": valor, "descricao": descricao, "timestamp": current_ts()},
+        estado_antes.get("financeiro", {}),
+        estado_depois.get("financeiro", {}),
+    )
+    history_log.info("Evento registrado", user_id=user_id, tipo=tipo, id=event["id"])
+
+def format_history_reply(user_id=None, before_id: int | None = None):
+    """Formata os últimos eventos do histórico para resposta amigável."""
+    if before_id:
+        eventos, cursor = history_store.query(user_id, before_id=before_id, limit=HISTORY_REPLY_LIMIT)
+    else:
+        eventos, cursor = history_store.tail(user_id, HISTORY_REPLY_LIMIT)
     
     if not eventos:
         return "Nenhum evento financeiro registrado até agora."
@@ -268,34 +330,37 @@ def format_history_reply():
         else:
             lines.append(f"{data_fmt} - {tipo}: R${valor:.2f}" if valor else f"{data_fmt} - {tipo}")
     
+    if cursor:
+        lines.append(f"Ver mais: peça \"histórico antes de #{cursor}\"")
+    
     return "\n".join(lines)
 
 def current_ts():
     import time
     return int(time.time())
 
-def get_financeiro():
-    state = load_state()
+def get_financeiro(user_id=None):
+    state = load_state(user_id)
     return state.get("financeiro", {})
 
-def add_divida(valor: float, descricao: str = "Dívida"):
-    state = load_state()
+def add_divida(valor: float, descricao: str = "Dívida", user_id=None):
+    state = load_state(user_id)
     fin = state.get("financeiro", {})
     if valor <= 0:
         raise ValueError("Valor deve ser maior que zero")
     dividas = fin.get("dividas", [])
-    new_id = (dividas[-1]["id"] + 1) if dividas else 1
+    new_id = max((d.get("id", 0) for d in dividas), default=0) + 1
     dividas.append({"id": new_id, "descricao": descricao, "valor": valor})
     fin.update({
         "dividas": dividas,
         "ultima_atualizacao": current_ts(),
     })
     state["financeiro"] = fin
-    save_state(state)
+    save_state(state, user_id)
     return fin, {"id": new_id, "descricao": descricao, "valor": valor}
 
-def remove_divida(valor: float | None = None, id: int | None = None):
-    state = load_state()
+def remove_divida(valor: float | None = None, id: int | None = None, user_id=None):
+    state = load_state(user_id)
     fin = state.get("financeiro", {})
     dividas = fin.get("dividas", [])
     if not dividas:
@@ -327,34 +392,74 @@ def remove_divida(valor: float | None = None, id: int | None = None):
         "ultima_atualizacao": current_ts(),
     })
     state["financeiro"] = fin
-    save_state(state)
+    save_state(state, user_id)
     return fin, removed_divida
 
 def log_interaction(intention: str, action: str, before: dict, after: dict, success: bool, error: str | None = None):
-    print("\n[DEBUG] intenção:", intention)
-    print("[DEBUG] action:", action)
-    print("[DEBUG] sucesso:", success)
-    if error:
-        print("[DEBUG] erro:", error)
-    print("[DEBUG] estado_antes:", json.dumps(before, ensure_ascii=False))
-    print("[DEBUG] estado_depois:", json.dumps(after, ensure_ascii=False))
+    # Estados inteiros só com debug ligado; a serialização fica com a thread de log
+    if interaction_log.enabled():
+        interaction_log.debug("Interação", intention=intention, action=action, success=success, error=error,
+                              before=before, after=after)
+    else:
+        interaction_log.info("Interação", intention=intention, action=action, success=success, error=error)
 
 # ==================== PROTECTED ROUTES ====================
 @app.get("/health")
 def health():
-    print("[HEALTH] Called")
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    """Contadores internos (latência de commit, cache de estado)."""
+    return {
+        "json_writer": json_writer.stats(),
+        "state_cache": state_cache.stats(),
+        "user_shards": user_shards.stats(),
+        "password_hasher": password_hasher.stats(),
+        "sessions": session_store.stats(),
+        "logging": structured_log.stats(),
+    }
+
 @app.get("/financeiro")
 def financeiro(user_id: int = Depends(get_current_user)):
-    print("[FINANCEIRO] Reading lifeos_state.json")
-    return get_financeiro()
+    return get_financeiro(user_id)
 
 @app.get("/financeiro/historico")
-def financeiro_historico(user_id: int = Depends(get_current_user)):
-    print("[HISTORY] Reading financeiro_history.json")
-    history = load_history()
-    return history
+def financeiro_historico(
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(HISTORY_PAGE_LIMIT, ge=1, le=500),
+    tipo: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    format: Optional[str] = None,
+    user_id: int = Depends(get_current_user),
+):
+    """Histórico paginado por cursor; format=ndjson transmite o export completo."""
+    history_log.debug("Lendo histórico", user_id=user_id, after_id=after_id, before_id=before_id, tipo=tipo,
+                      format=format)
+    if format == "ndjson":
+        return StreamingResponse(
+            history_store.iter_lines(user_id, after_id=after_id, tipo=tipo, since=since, until=until),
+            media_type="application/x-ndjson",
+        )
+    eventos, cursor = history_store.query(
+        user_id, after_id=after_id, before_id=before_id, limit=limit, tipo=tipo, since=since, until=until
+    )
+    cursor_key = "next_before_id" if before_id is not None and after_id is None else "next_after_id"
+    return {"eventos": eventos, cursor_key: cursor}
+
+@app.get("/financeiro/historico/estado")
+def financeiro_estado_em(
+    event_id: Optional[int] = None,
+    timestamp: Optional[int] = None,
+    user_id: int = Depends(get_current_user),
+):
+    """Reconstrói o financeiro como estava após um evento (ou num instante)."""
+    found_id, estado = history_store.state_at(user_id, event_id=event_id, timestamp=timestamp)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Nenhum evento nesse ponto do histórico")
+    return {"event_id": found_id, "financeiro": estado}
 
 class ChatRequest(BaseModel):
     message: str
@@ -365,10 +470,13 @@ def chat(request: ChatRequest, user_id: int = Depends(get_current_user)):
     """Processa mensagens do chat, EXECUTA ação real e responde após persistir."""
     try:
         message = request.message
-        print(f"\n[CHAT] Mensagem recebida: '{message}'")
+        log.info("Mensagem recebida", user_id=user_id, chars=len(message))
+        log.debug("Mensagem", user_id=user_id, message=message)
         message_lower = message.lower()
+        intents = route_message(message)
+        value = parse_values(message).first_amount()
 
-        before_state = load_state()
+        before_state = load_state(user_id)
         intention = ""
         action = ""
         success = False
@@ -376,104 +484,99 @@ def chat(request: ChatRequest, user_id: int = Depends(get_current_user)):
         new_state: dict | None = None
 
         # ===== DELETAR DÍVIDA =====
-        if "apagar" in message_lower or "remover" in message_lower or "excluir" in message_lower:
-            if "divida" in message_lower or "dívida" in message_lower:
+        if Intent.DELETE in intents:
+            if Intent.DEBT in intents:
                 intention = "remover_divida"
-                match = re.search(r"(\d+(?:[.,]\d+)?)", message)
-                if match:
-                    value_str = match.group(1).replace(",", ".")
-                    value = float(value_str)
+                if value is not None:
                     try:
-                        removed_fin, removed_item = remove_divida(valor=value)
-                        new_state = load_state()
+                        removed_fin, removed_item = remove_divida(valor=value, user_id=user_id)
+                        new_state = load_state(user_id)
                         action = "FINANCEIRO_DELETE"
                         reply_text = f"Dívida de R$ {value:.2f} removida. Estado atualizado: {new_state.get('financeiro', {})}"
                         success = True
-                        record_event("REMOVE_DIVIDA", value, removed_item.get("descricao", ""), before_state, new_state)
+                        record_event("REMOVE_DIVIDA", value, removed_item.get("descricao", ""), before_state, new_state, user_id)
                     except Exception as e:
-                        new_state = load_state()
+                        new_state = load_state(user_id)
                         log_interaction(intention, "FINANCEIRO_DELETE", before_state, new_state, False, str(e))
                         return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
                 else:
                     intention = "remover_todas_dividas"
                     try:
-                        state = load_state()
+                        state = load_state(user_id)
                         fin = state.get("financeiro", {})
                         if not fin.get("dividas"):
                             raise ValueError("Não há dívidas para remover")
                         fin["dividas"] = []
                         fin["ultima_atualizacao"] = current_ts()
                         state["financeiro"] = fin
-                        save_state(state)
-                        new_state = load_state()
+                        save_state(state, user_id)
+                        new_state = load_state(user_id)
                         action = "FINANCEIRO_DELETE_ALL"
                         reply_text = f"Todas as dívidas removidas. Estado atualizado: {new_state.get('financeiro', {})}"
                         success = True
-                        record_event("REMOVE_ALL_DIVIDAS", None, "Todas as dívidas removidas", before_state, new_state)
+                        record_event("REMOVE_ALL_DIVIDAS", None, "Todas as dívidas removidas", before_state, new_state, user_id)
                     except Exception as e:
-                        new_state = load_state()
+                        new_state = load_state(user_id)
                         log_interaction(intention, "FINANCEIRO_DELETE_ALL", before_state, new_state, False, str(e))
                         return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
 
         # ===== ADICIONAR DÍVIDA =====
-        if "adicionar" in message_lower or "criar" in message_lower or "nova" in message_lower:
-            if "divida" in message_lower or "dívida" in message_lower:
+        if Intent.ADD in intents:
+            if Intent.DEBT in intents:
                 intention = "adicionar_divida"
-                match = re.search(r"(\d+(?:[.,]\d+)?)", message)
-                if match:
-                    value_str = match.group(1).replace(",", ".")
-                    value = float(value_str)
+                if value is not None:
                     try:
-                        added_fin, added_item = add_divida(valor=value, descricao="Dívida")
-                        new_state = load_state()
+                        added_fin, added_item = add_divida(valor=value, descricao="Dívida", user_id=user_id)
+                        new_state = load_state(user_id)
                         action = "FINANCEIRO_ADD"
                         reply_text = f"Dívida de R$ {value:.2f} adicionada. Estado atualizado: {new_state.get('financeiro', {})}"
                         success = True
-                        record_event("ADD_DIVIDA", value, "Dívida", before_state, new_state)
+                        record_event("ADD_DIVIDA", value, "Dívida", before_state, new_state, user_id)
                     except Exception as e:
-                        new_state = load_state()
+                        new_state = load_state(user_id)
                         log_interaction(intention, "FINANCEIRO_ADD", before_state, new_state, False, str(e))
                         return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
                 else:
                     intention = "adicionar_divida_sem_valor"
-                    new_state = load_state()
+                    new_state = load_state(user_id)
                     log_interaction(intention, "FINANCEIRO_ADD", before_state, new_state, False, "Valor não informado")
                     return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
 
         # ===== CONSULTAR FINANCEIRO =====
-        if not success and ("financeiro" in message_lower or ("divida" in message_lower or "dívida" in message_lower)):
+        if not success and intents.any(Intent.FINANCE_AREA, Intent.DEBT):
             intention = "ler_financeiro"
             try:
-                estado = get_financeiro()
-                new_state = load_state()
+                estado = get_financeiro(user_id)
+                new_state = load_state(user_id)
                 action = "FINANCEIRO_READ"
                 reply_text = f"Estado financeiro atual: {estado}"
                 success = True
             except Exception as e:
-                new_state = load_state()
+                new_state = load_state(user_id)
                 log_interaction(intention, "FINANCEIRO_READ", before_state, new_state, False, str(e))
                 return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
 
         # ===== LER HISTÓRICO FINANCEIRO =====
-        if not success and ("histórico" in message_lower or "extrato" in message_lower or "pago" in message_lower):
+        if not success and Intent.HISTORY in intents:
             intention = "ler_historico_financeiro"
             try:
-                reply_text = format_history_reply()
-                new_state = load_state()
+                cursor_match = re.search(r"antes de #(\d+)", message_lower)
+                reply_text = format_history_reply(user_id, int(cursor_match.group(1)) if cursor_match else None)
+                new_state = load_state(user_id)
                 action = "FINANCEIRO_HISTORICO_READ"
                 success = True
-            except Exception as e:
-                new_state = load_state()
-                print(f"[ERROR] Erro ao ler histórico: {e}")
+            except Exception:
+                new_state = load_state(user_id)
+                log.exception("Erro ao ler histórico", user_id=user_id)
                 return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
 
         if not intention:
-            new_state = load_state()
+            new_state = load_state(user_id)
             log_interaction("intenção_não_mapeada", "NONE", before_state, new_state, False, "Nenhuma action derivada")
             return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
 
         if not success or new_state is None:
-            new_state = load_state()
+            new_state = load_state(user_id)
             log_interaction(intention or "", action or "", before_state, new_state, False, "Ação não executada")
             return {"reply": "Não foi possível executar a ação. Estado não alterado.", "action": None}
 
@@ -481,9 +584,7 @@ def chat(request: ChatRequest, user_id: int = Depends(get_current_user)):
         return {"reply": reply_text, "action": action}
 
     except Exception as e:
-        print(f"[ERROR] {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Erro no chat", user_id=user_id)
         return {"reply": f"Erro ao executar ação: {str(e)}", "action": None}
 
 if __name__ == "__main__":
@@ -494,14 +595,13 @@ if __name__ == "__main__":
     init_db()
     
     def signal_handler(sig, frame):
-        print("\n[SERVER] Recebeu sinal de término, ignorando...")
+        server_log.warning("Recebeu sinal de término, ignorando", signal=sig)
         pass
     
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    print("[SERVER] Iniciando com proteção contra shutdown...")
-    print("LifeOS state foundation established")
+    server_log.info("Iniciando com proteção contra shutdown", port=8001)
     try:
         uvicorn.run(
             app, 
@@ -510,8 +610,8 @@ if __name__ == "__main__":
             log_level="info"
         )
     except KeyboardInterrupt:
-        print("[SERVER] KeyboardInterrupt capturado, continuando...")
+        server_log.warning("KeyboardInterrupt capturado, continuando")
         pass
-    except Exception as e:
-        print(f"[SERVER] Erro: {e}, continuando...")
+    except Exception:
+        server_log.exception("Erro no servidor, continuando")
         pass
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Sessões do session_store: cache, last_seen em write-behind e varredura de expiradas.
+
+Conta as conexões abertas para conferir que um hit do cache não toca o banco,
+que os last_seen acumulados saem num flush só (também pela thread de
+manutenção) e que a varredura apaga só as expiradas, em blocos.
+
+    python test_session_store.py
+"""
+
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from session_store import SessionStore
+
+TTL = 3600
+
+
+class CountingDB:
+    """connect() for the store, counting how many connections it opens."""
+
+    def __init__(self, path):
+        self.path = path
+        self.opened = 0
+        with sqlite3.connect(path) as conn:
+            conn.execute("""
+                CREATE TABLE sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    token TEXT UNIQUE NOT NULL,
+                    last_seen INTEGER,
+                    expires_at INTEGER
+                )
+            """)
+
+    def connect(self):
+        self.opened += 1
+        return sqlite3.connect(self.path)
+
+    def row(self, token):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT last_seen, expires_at FROM sessions WHERE token = ?", (token,)).fetchone()
+
+
+def check_cache_and_write_behind(db):
+    """Cached lookups skip the database; their last_seen is written in one batch."""
+    store = SessionStore(db.connect, ttl=TTL, flush_interval=3600)
+    for i in range(20):
+        store.create(i, f"token-{i}")
+    old_seen = int(time.time()) - 100
+    with sqlite3.connect(db.path) as conn:
+        conn.execute("UPDATE sessions SET last_seen = ?, expires_at = ?", (old_seen, old_seen + TTL))
+    opened = db.opened
+    found = [store.lookup(f"token-{i}") for i in range(20) for _ in range(5)]
+    lookups_opened = db.opened - opened
+    pending = store.stats()["pending_touches"]
+    untouched = db.row("token-0")[0] == old_seen
+    written = store.flush()
+    last_seen, expires_at = db.row("token-0")
+    return (found == [i for i in range(20) for _ in range(5)] and lookups_opened == 0 and pending == 20
+            and untouched and written == 20 and db.opened - opened == 1 and last_seen >= old_seen + 100
+            and expires_at == last_seen + TTL and store.flush() == 0)
+
+
+def check_expired_and_revoked(db):
+    """An expired session is refused once it leaves the cache; revoke drops it everywhere."""
+    store = SessionStore(db.connect, ttl=TTL, flush_interval=3600)
+    store.create(1, "velho")
+    store.create(2, "sair")
+    with sqlite3.connect(db.path) as conn:
+        conn.execute("UPDATE sessions SET expires_at = ? WHERE token = 'velho'", (int(time.time()) - 1,))
+    store.cache.invalidate("velho")
+    expired = store.lookup("velho")
+    store.lookup("sair")
+    store.revoke("sair")
+    return (expired is None and store.lookup("sair") is None and db.row("sair") is None
+            and store.stats()["pending_touches"] == 0)
+
+
+def check_sweep(db):
+    """Only expired rows go, in chunks of sweep_chunk."""
+    store = SessionStore(db.connect, ttl=TTL, flush_interval=3600, sweep_chunk=7)
+    now = int(time.time())
+    with sqlite3.connect(db.path) as conn:
+        conn.executemany("INSERT INTO sessions (user_id, token, last_seen, expires_at) VALUES (?, ?, ?, ?)",
+                         [(i, f"expirada-{i}", now - TTL - 10, now - 10) for i in range(50)]
+                         + [(i, f"viva-{i}", now, now + TTL) for i in range(5)])
+    opened = db.opened
+    swept = store.sweep()
+    with sqlite3.connect(db.path) as conn:
+        left = [row[0] for row in conn.execute("SELECT token FROM sessions ORDER BY id")]
+    return swept == 50 and left == [f"viva-{i}" for i in range(5)] and db.opened - opened == 1 and store.sweep() == 0
+
+
+def check_background_flush(db):
+    """The maintenance thread flushes pending touches and sweeps on its own."""
+    store = SessionStore(db.connect, ttl=TTL, flush_interval=0.05, sweep_interval=0)
+    store.create(1, "ativa")
+    with sqlite3.connect(db.path) as conn:
+        conn.execute("UPDATE sessions SET last_seen = 0")
+        conn.execute("INSERT INTO sessions (user_id, token, last_seen, expires_at) VALUES (2, 'expirada', 0, 1)")
+    store.lookup("ativa")
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and (store.stats()["flushes"] == 0 or store.stats()["swept"] == 0):
+        time.sleep(0.02)
+    return db.row("ativa")[0] > 0 and db.row("expirada") is None and store.stats()["pending_touches"] == 0
+
+
+if __name__ == "__main__":
+    checks = [
+        ("Hit do cache não abre conexão; last_seen gravado num flush só", check_cache_and_write_behind),
+        ("Sessão expirada recusada; revoke tira do cache e do banco", check_expired_and_revoked),
+        ("Varredura apaga só as expiradas, em blocos", check_sweep),
+        ("Thread de manutenção faz flush e varredura sozinha", check_background_flush),
+    ]
+    failures = 0
+    for name, check in checks:
+        with tempfile.TemporaryDirectory() as tmp:
+            ok = check(CountingDB(Path(tmp) / "sessions.db"))
+        failures += not ok
+        print(f"[TEST] {name}: {'OK' if ok else 'FALHOU'}")
+
+    if failures:
+        print("[ERROR] session_store perdeu ou atrasou atualizações de sessão")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
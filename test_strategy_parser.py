@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""parse_strategy contra respostas no formato que a IA devolve.
+
+Cobre o formato pedido pelo prompt (seções "1." a "4." separadas por linha em
+branco), títulos em **negrito**, listas numeradas dentro dos passos (coladas,
+com recuo ou separadas por linha em branco) e respostas que não são estratégia.
+
+    python test_strategy_parser.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+from strategy_parser import parse_strategy
+
+PLAIN = """Vamos montar seu plano com base nos seus dados!
+
+1. Análise da situação:
+Você ganha R$ 4.500,00 e gasta R$ 3.200,00 por mês. Sobram R$ 1.300,00.
+
+2. Passos práticos:
+- Liste todas as dívidas com juros
+- Negocie o cartão primeiro
+- Guarde R$ 200 por mês
+
+3. Foco do mês:
+Quitar a fatura do cartão.
+
+4. Meta diária:
+Gastar no máximo R$ 40 por dia.
+
+Ficou alguma dúvida sobre o plano?"""
+
+NESTED = """Aqui está sua estratégia:
+
+1. Análise da situação: sua renda cobre as despesas, mas o cartão consome 30% dela.
+
+2. Passos práticos:
+1. Negociar a fatura do cartão com o banco
+2. Cancelar duas assinaturas que você não usa
+3. Separar R$ 300 no dia do pagamento
+
+3. Foco do mês: renegociar o cartão.
+
+4. Meta diária: R$ 35 de gastos variáveis.
+
+Ficou alguma dúvida sobre o plano?"""
+
+# Subitens com recuo e um deles citando "meta" (radical de uma seção)
+NESTED_INDENTED = """1. Análise da situação
+Dívida total de R$ 12.000,00 em três credores.
+
+2. Passos práticos
+   1. Parar de usar o cheque especial
+   2. Definir uma meta de economia semanal
+   3. Quitar primeiro a dívida de juros maiores
+
+3. Foco do mês
+Sair do cheque especial.
+
+4. Meta diária
+Guardar R$ 10 por dia.
+
+Ficou alguma dúvida sobre o plano?"""
+
+# Lista numerada separada por linhas em branco, sem recuo
+NESTED_SPACED = """1. Análise da situação: gastos variáveis altos.
+
+2. Passos práticos:
+
+1. Anotar todos os gastos por uma semana
+
+2. Cortar o delivery
+
+3. Revisar o plano do celular
+
+3. Foco do mês: controlar o delivery.
+
+4. Meta diária: R$ 25.
+
+Ficou alguma dúvida sobre o plano?"""
+
+BOLD = """**1. Análise da situação:** renda de R$ 3.000,00, despesas de R$ 2.800,00.
+
+**2. Passos práticos:** cortar gastos e negociar dívidas.
+
+**3. Foco do mês:** montar reserva de R$ 200.
+
+**4. Meta diária:** R$ 20 por dia.
+
+SALVAR_ESTRATEGIA"""
+
+NOT_A_STRATEGY = """Claro! Para montar o plano preciso de algumas informações:
+
+1. Qual é a sua renda mensal?
+2. Quanto você gasta com despesas fixas?
+3. Você tem dívidas?"""
+
+CASES = [
+    ("formato do prompt", PLAIN, {
+        "analysis": "Você ganha R$ 4.500,00 e gasta R$ 3.200,00 por mês. Sobram R$ 1.300,00.",
+        "steps": "- Liste todas as dívidas com juros\n- Negocie o cartão primeiro\n- Guarde R$ 200 por mês",
+        "monthly_focus": "Quitar a fatura do cartão.",
+        "daily_goal": "Gastar no máximo R$ 40 por dia.",
+    }),
+    ("lista numerada nos passos", NESTED, {
+        "analysis": "sua renda cobre as despesas, mas o cartão consome 30% dela.",
+        "steps": "1. Negociar a fatura do cartão com o banco\n2. Cancelar duas assinaturas que você não usa\n"
+                 "3. Separar R$ 300 no dia do pagamento",
+        "monthly_focus": "renegociar o cartão.",
+        "daily_goal": "R$ 35 de gastos variáveis.",
+    }),
+    ("lista com recuo citando 'meta'", NESTED_INDENTED, {
+        "analysis": "Dívida total de R$ 12.000,00 em três credores.",
+        "steps": "1. Parar de usar o cheque especial\n   2. Definir uma meta de economia semanal\n"
+                 "   3. Quitar primeiro a dívida de juros maiores",
+        "monthly_focus": "Sair do cheque especial.",
+        "daily_goal": "Guardar R$ 10 por dia.",
+    }),
+    ("lista separada por linhas em branco", NESTED_SPACED, {
+        "analysis": "gastos variáveis altos.",
+        "steps": "1. Anotar todos os gastos por uma semana\n\n2. Cortar o delivery\n\n3. Revisar o plano do celular",
+        "monthly_focus": "controlar o delivery.",
+        "daily_goal": "R$ 25.",
+    }),
+    ("títulos em negrito", BOLD, {
+        "analysis": "renda de R$ 3.000,00, despesas de R$ 2.800,00.",
+        "steps": "cortar gastos e negociar dívidas.",
+        "monthly_focus": "montar reserva de R$ 200.",
+        "daily_goal": "R$ 20 por dia.",
+    }),
+    ("perguntas numeradas", NOT_A_STRATEGY, None),
+]
+
+
+def check(text, expected):
+    strategy = parse_strategy(text)
+    if expected is None:
+        return strategy is None, strategy
+    if strategy is None:
+        return False, None
+    got = strategy._asdict()
+    return got == expected, got
+
+
+if __name__ == "__main__":
+    failures = 0
+    for name, text, expected in CASES:
+        ok, got = check(text, expected)
+        print(f"[TEST] {name}: {'OK' if ok else 'FALHOU'}")
+        if not ok:
+            failures += 1
+            print(f"       esperado {expected!r}\n       obtido   {got!r}")
+
+    rendered = parse_strategy(NESTED).render()
+    render_ok = rendered.startswith("1. Análise da situação:\n") and "\n\n3. Foco do mês:\nrenegociar" in rendered
+    print(f"[TEST] render com as quatro seções: {'OK' if render_ok else 'FALHOU'}")
+
+    if failures or not render_ok:
+        print("[ERROR] parse_strategy perdeu ou misturou seções")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")
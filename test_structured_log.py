@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Nível, amostragem, request id e formato do structured_log, e microbenchmark por chamada.
+
+Compara um debug desligado (só o `if` do nível) e um info ligado (enfileirado;
+a formatação fica com a thread de log) com o print síncrono que os servidores
+usavam, formatando a f-string e escrevendo no request.
+
+    python test_structured_log.py
+"""
+
+import asyncio
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "lifeos_backend"))
+import structured_log
+from structured_log import RequestIdMiddleware, get_logger
+
+BENCH_CALLS = 100_000
+SAMPLED_CALLS = 2000
+
+
+def captured(level="DEBUG", fmt="json", sample=""):
+    stream = io.StringIO()
+    structured_log.configure(level=level, fmt=fmt, sample=sample, stream=stream)
+    return stream
+
+
+def lines(stream):
+    structured_log.shutdown()  # esvazia a fila antes de ler
+    return [line for line in stream.getvalue().splitlines() if line]
+
+
+def check_levels_and_fields():
+    stream = captured(level="INFO")
+    log = get_logger("teste")
+    state = {"financeiro": {"dividas": [1, 2]}}
+    log.debug("Não sai")
+    log.info("Mensagem recebida", user_id=7, state=state)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        log.exception("Falhou")
+    records = [json.loads(line) for line in lines(stream)]
+    return (len(records) == 2 and records[0]["event"] == "Mensagem recebida" and records[0]["user_id"] == 7
+            and records[0]["state"] == state and records[0]["category"] == "teste"
+            and records[1]["level"] == "error" and "ZeroDivisionError" in records[1]["exc"])
+
+
+def check_sampling():
+    stream = captured(sample="ruidoso=0.1,mudo=0")
+    noisy, mute = get_logger("ruidoso"), get_logger("mudo")
+    for i in range(SAMPLED_CALLS):
+        noisy.info("Evento", i=i)
+        mute.debug("Evento", i=i)
+    mute.warning("Aviso passa sempre")
+    records = [json.loads(line) for line in lines(stream)]
+    kept = sum(record["category"] == "ruidoso" for record in records)
+    muted = [record for record in records if record["category"] == "mudo"]
+    sampled_out = structured_log.stats()["sampled_out"]
+    return (0.05 * SAMPLED_CALLS < kept < 0.15 * SAMPLED_CALLS and len(muted) == 1
+            and sampled_out["mudo"] == SAMPLED_CALLS and sampled_out["ruidoso"] == SAMPLED_CALLS - kept)
+
+
+def check_request_id():
+    """The middleware sets the id for logs inside the request and echoes it in the response."""
+    stream = captured(fmt="text")
+    log = get_logger("teste")
+
+    async def endpoint(scope, receive, send):
+        log.info("Dentro do request")
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def request(headers):
+        await RequestIdMiddleware(endpoint)({"type": "http", "headers": headers}, None, send)
+
+    asyncio.run(request([(b"x-request-id", b"abc123")]))
+    asyncio.run(request([]))
+    log.info("Fora do request")
+    output = lines(stream)
+    echoed = [dict(message["headers"])[b"x-request-id"].decode() for message in sent
+              if message["type"] == "http.response.start"]
+    return (len(output) == 3 and " abc123 Dentro do request" in output[0] and echoed[0] == "abc123"
+            and f" {echoed[1]} Dentro do request" in output[1] and " - Fora do request" in output[2]
+            and structured_log.request_id.get() is None)
+
+
+def per_call_ns(fn):
+    started = time.perf_counter()
+    for i in range(BENCH_CALLS):
+        fn(i)
+    return (time.perf_counter() - started) / BENCH_CALLS * 1e9
+
+
+def bench():
+    state = {"financeiro": {"dividas": [{"valor": 100.0, "descricao": "cartão"}] * 5}, "historico": list(range(50))}
+    sink = io.StringIO()
+    printed = per_call_ns(lambda i: print(f"[DEBUG] estado_antes: {json.dumps(state, ensure_ascii=False)}",
+                                          file=sink))
+    structured_log.configure(level="INFO", stream=io.StringIO())
+    log = get_logger("bench")
+    disabled = per_call_ns(lambda i: log.debug("Estado antes", state=state))
+    enabled = per_call_ns(lambda i: log.info("Mensagem recebida", user_id=i, chars=42))
+    structured_log.shutdown()
+    return printed, disabled, enabled
+
+
+if __name__ == "__main__":
+    levels_ok = check_levels_and_fields()
+    print(f"[TEST] Nível checado primeiro, campos e traceback no JSON: {'OK' if levels_ok else 'FALHOU'}")
+    sampling_ok = check_sampling()
+    print(f"[TEST] Amostragem por categoria (avisos passam sempre): {'OK' if sampling_ok else 'FALHOU'}")
+    request_id_ok = check_request_id()
+    print(f"[TEST] Request id do middleware nos logs e na resposta: {'OK' if request_id_ok else 'FALHOU'}")
+
+    printed, disabled, enabled = bench()
+    print(f"[BENCH] por chamada: debug desligado {disabled:,.0f} ns | info enfileirado {enabled:,.0f} ns | "
+          f"print com json.dumps {printed:,.0f} ns")
+
+    if not (levels_ok and sampling_ok and request_id_ok):
+        print("[ERROR] structured_log perdeu, duplicou ou formatou errado os registros")
+        sys.exit(1)
+    print("[TEST] Tudo OK!")